@@ -2,7 +2,7 @@ from typing import List, Optional
 from NetworkConnection.BaseRPCRequests import RPCRequest, SubscriptionRequest, CallRequest
 from Web3Types.SimpleTypes import HexBytes, Address
 from Web3Types.Transaction import Transaction
-from Web3Types.TransactionLog import Log
+from Web3Types.TransactionLog import LazyLog
 from Web3Types.TransactionReciept import TransactionReceipt
 
 
@@ -25,10 +25,7 @@ class GetTransactionReceiptsByBlock(AlchemyRPCRequest):
         for tr in response['receipts']:
             if tr['contractAddress'] is not None:
                 continue
-            logs = [Log(HexBytes(l['blockHash']), int(l['blockNumber'], 16), int(l['transactionIndex'], 16),
-                        Address(l['address']), int(l['logIndex'], 16), HexBytes(l['data']),
-                        True if l['removed'] == "true" else False, [HexBytes(t) for t in l['topics']],
-                        HexBytes(l['transactionHash'])) for l in tr['logs']]
+            logs = [LazyLog(l) for l in tr['logs']]
             receipt = TransactionReceipt(HexBytes(tr['blockHash']), int(tr['blockNumber'], 16),
                                          int(tr['transactionIndex'], 16),
                                          HexBytes(tr['transactionHash']), Address(tr['from']), Address(tr['to']),
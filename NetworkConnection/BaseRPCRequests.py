@@ -1,9 +1,11 @@
-from typing import List, Optional
+import copy
+import json
+from typing import List, Optional, Tuple
 from Utilities.FunctionCallBuilder import create_event_topic, decode_function_output
 from Web3Types.Block import Block
 from Web3Types.SimpleTypes import HexBytes, Address
 from Web3Types.Transaction import Transaction, SmartContractTransaction
-from Web3Types.TransactionLog import Log
+from Web3Types.TransactionLog import Log, LazyLog
 
 
 class RPC_Error(Exception):
@@ -23,6 +25,14 @@ class RPCRequest:
     def decode_response(self, response):
         return response
 
+    def cache_key(self) -> Optional[str]:
+        """key identifying requests whose result can never change (e.g. calls pinned to a block), None otherwise"""
+        return None
+
+    def create_cache_key(self) -> str:
+        return json.dumps([self.request_name, self.params], sort_keys=True, separators=(",", ":"))
+
+
 class BlockNumberRequest(RPCRequest):
 
     def __init__(self):
@@ -37,6 +47,9 @@ class GetBlockByHash(RPCRequest):
     def __init__(self, block_hash):
         super().__init__("eth_getBlockByHash", [block_hash, False])
 
+    def cache_key(self) -> Optional[str]:
+        return self.create_cache_key()
+
     def decode_response(self, response):
         gasUsed = int(response['gasUsed'], 16)
         logsBloom = HexBytes(response['logsBloom'])
@@ -48,6 +61,13 @@ class GetBlockByHash(RPCRequest):
         return Block(block_hash, gasUsed, logsBloom, miner, number, parent_hash, timestamp)
 
 
+class GetTransactionByHash(RPCRequest):
+    """gets the raw transaction body, None if the node doesn't know the transaction (e.g. a dropped pending one)"""
+
+    def __init__(self, transaction_hash):
+        super().__init__("eth_getTransactionByHash", [str(transaction_hash)])
+
+
 class SubscriptionRequest(RPCRequest):
 
     def __init__(self, params):
@@ -112,29 +132,51 @@ class GetLogsRequest(RPCRequest):
 
     def __init__(self, from_block, to_block, event_abis, address: Address = None):
         self.abis = event_abis
+        # lower case hex topic -> event abi, so decoding a log is a single dictionary lookup
+        self.topic_abis = {} if event_abis is None else {str(create_event_topic(a)): a for a in event_abis}
         if type(from_block) == int:
             from_block = hex(from_block)
         if type(to_block) == int:
             to_block = hex(to_block)
         params = {"fromBlock": from_block, "toBlock": to_block}
         if event_abis is not None:
-            params["topics"] = [str(create_event_topic(a)) for a in event_abis]
+            if len(event_abis) > 1:
+                # any of the events may match the first topic
+                params["topics"] = [[str(create_event_topic(a)) for a in event_abis]]
+            else:
+                params["topics"] = [str(create_event_topic(a)) for a in event_abis]
         if address is not None:
             params['address'] = str(address)
         super().__init__("eth_getLogs", [params])
 
-    def decode_response(self, response) -> List[Log]:
-        outs = []
-        for l in response:
-            log = Log(HexBytes(l['blockHash']), int(l['blockNumber'], 16), int(l['transactionIndex'], 16),
-                      Address(l['address']), int(l['logIndex'], 16), HexBytes(l['data']),
-                      True if l['removed'] == "true" else False, [HexBytes(t) for t in l['topics']],
-                      HexBytes(l['transactionHash']))
-            for t in self.abis:
-                if log.topics[0] == create_event_topic(t):
-                    log.decode_data(t)
-            outs.append(log)
-        return outs
+    def decode_response(self, response) -> List[LazyLog]:
+        topic_abis = self.topic_abis
+        return [LazyLog(l, topic_abis.get(l['topics'][0].lower()) if l['topics'] else None) for l in response]
+
+    def decode_log(self, raw_log) -> LazyLog:
+        """decodes a single log of the response, used when streaming"""
+        return LazyLog(raw_log, self.topic_abis.get(raw_log['topics'][0].lower()) if raw_log['topics'] else None)
+
+    def filter_key(self) -> str:
+        """the address and topics of the request, i.e. everything but the block range"""
+        params = {k: v for k, v in self.params[0].items() if k not in ("fromBlock", "toBlock")}
+        return json.dumps(params, sort_keys=True, separators=(",", ":"))
+
+    def for_range(self, from_block: int, to_block: int) -> "GetLogsRequest":
+        """a copy of the request over a different block range"""
+        request = copy.copy(self)
+        request.params = [dict(self.params[0], fromBlock=hex(from_block), toBlock=hex(to_block))]
+        return request
+
+    def block_range(self, lower_block: Optional[str] = None,
+                    upper_block: Optional[str] = None) -> Optional[Tuple[int, int]]:
+        """the first and last block of the request, or of lower_block/upper_block when given. None if either end is a
+        block tag such as "latest", which has no fixed range"""
+        from_block = lower_block if lower_block is not None else self.params[0]["fromBlock"]
+        to_block = upper_block if upper_block is not None else self.params[0]["toBlock"]
+        if not from_block.startswith("0x") or not to_block.startswith("0x"):
+            return None
+        return int(from_block, 16), int(to_block, 16)
 
 
 class HeadFilterRequest(FilterRequest):
@@ -161,8 +203,12 @@ class CallRequest(RPCRequest):
         else:
             block = "latest"
         self.transaction: Transaction = transaction
+        self.block_number: Optional[int] = block_number
         super().__init__("eth_call", [transaction.to_json(), block])
 
+    def cache_key(self) -> Optional[str]:
+        return self.create_cache_key() if self.block_number is not None else None
+
     def decode_response(self, response):
         if response is None:
             return None
@@ -104,33 +104,15 @@ def update_v2_pool_from_log(v2_liquidity_pool: UniswapV2LP, log: Log, event_topi
         raise EventNotImplemented("Only sync is implemented for uniswap V2 events")
 
 
+V3_POOL_EVENTS = {"Swap", "Mint", "Burn", "Flash", "Collect", "Initialize"}
+
+
 def decode_v3_log_data(log: Log) -> str:
-    swap_event = fcb.create_event_abi("Swap", fcb.get_abi("V3LiquidityPool"))
-    mint_event = fcb.create_event_abi("Mint", fcb.get_abi("V3LiquidityPool"))
-    burn_event = fcb.create_event_abi("Burn", fcb.get_abi("V3LiquidityPool"))
-    flash_event = fcb.create_event_abi("Flash", fcb.get_abi("V3LiquidityPool"))
-    collect_event = fcb.create_event_abi("Collect", fcb.get_abi("V3LiquidityPool"))
-    initialize_event = fcb.create_event_abi("Initialize", fcb.get_abi("V3LiquidityPool"))
-    if log.topics[0] == fcb.create_event_topic(swap_event):
-        log.decode_data(swap_event)
-        return "Swap"
-    elif log.topics[0] == fcb.create_event_topic(mint_event):
-        log.decode_data(mint_event)
-        return "Mint"
-    elif log.topics[0] == fcb.create_event_topic(burn_event):
-        log.decode_data(burn_event)
-        return "Burn"
-    elif log.topics[0] == fcb.create_event_topic(flash_event):
-        log.decode_data(flash_event)
-        return "Flash"
-    elif log.topics[0] == fcb.create_event_topic(collect_event):
-        log.decode_data(collect_event)
-        return "Collect"
-    elif log.topics[0] == fcb.create_event_topic(initialize_event):
-        log.decode_data(initialize_event)
-        return "Initialize"
-    else:
+    event = fcb.get_abi("V3LiquidityPool").event_by_topic(log.topics[0])
+    if event is None or event.name not in V3_POOL_EVENTS:
         raise EventNotImplemented("Couldn't find correct event to update")
+    log.decode_data(event)
+    return event.name
 
 
 def update_v3_pool_from_log(v3_liquidity_pool: UniswapV3LP, log: Log, swap_event: str, mint_event: str, burn_event: str, flash_event: str, collect_event: str, init_event: str):
@@ -485,9 +467,11 @@ class BlockchainConnectionManager:
 
     # TODO -- TEST
     async def update_v3_pools_from_chain(self, liquidity_pool_dict: Dict[Address, UniswapV3LP], block_start: int,
-                                         block_end: int):
+                                         block_end: int, stream: bool = False):
         """Updates all v3 liquidity pools given using logs from between block_start and block_end. Note this is inefficient for small numbers
                 of liquidity pools as the method fetches all logs from the time period, not specific to the set content.
+            If stream is True all the events are requested together and each log is applied as soon as it is received,
+            which keeps memory bounded for large ranges.
             WARNING: Use with care - if ANY blocks are missed between different updates the values will be incorrect. Therefore, it is recommended
             not to directly call this method and instead use a graph method."""
         all_events = ["Initialize", "Swap", "Mint", "Collect", "Flash", "Burn"]
@@ -498,6 +482,16 @@ class BlockchainConnectionManager:
         burn_event = fcb.create_event_topic(fcb.create_event_abi("Burn", fcb.get_abi("V3LiquidityPool")))
         flash_event = fcb.create_event_topic(fcb.create_event_abi("Flash", fcb.get_abi("V3LiquidityPool")))
         collect_event = fcb.create_event_topic(fcb.create_event_abi("Collect", fcb.get_abi("V3LiquidityPool")))
+        if stream:
+            # logs come back from the node already ordered by block and log index
+            request = GetLogsRequest(block_start, block_end, all_events_abi)
+            async for curr_log in self.connection.smart_stream_log_request(request):
+                if curr_log.address in liquidity_pool_dict:
+                    try:
+                        update_v3_pool_from_log(liquidity_pool_dict[curr_log.address], curr_log, swap_event, mint_event, burn_event, flash_event, collect_event, initialize_event)
+                    except Exception as e:
+                        raise Exception(f"{e} on block {curr_log.block_number}")
+            return
         # get logs
         coros = [self.get_v3_logs(event_abi, block_start=block_start, block_end=block_end) for event_abi
                  in all_events_abi]
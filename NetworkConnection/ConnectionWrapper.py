@@ -0,0 +1,15 @@
+class ConnectionWrapper:
+    """Base of the layers which wrap a connection (coalescing, caching, scheduling...). Anything a layer doesn't
+    implement itself is passed straight through to the wrapped connection, so a layer can be used in place of the
+    connection, e.g. by BlockchainConnectionManager"""
+
+    __slots__ = ("connection",)
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __getattr__(self, item):
+        if item == "connection":
+            # not set yet, e.g. while copying or unpickling
+            raise AttributeError(item)
+        return getattr(self.connection, item)
@@ -0,0 +1,132 @@
+import asyncio
+import sqlite3
+from typing import List, Optional, Tuple, Dict
+from NetworkConnection.BaseRPCRequests import RPCRequest, GetLogsRequest, BlockNumberRequest
+from NetworkConnection.ConnectionWrapper import ConnectionWrapper
+from NetworkConnection.RPCConnection import HTTPRPCConnection
+from Web3Types.TransactionLog import LazyLog
+import Utilities.JsonCodec as json_codec
+
+
+class LogRangeCache(ConnectionWrapper):
+    """A persistent sqlite cache of eth_getLogs results. For each filter (address and topics) the cache records which
+    block ranges it holds every log for, so a request is split into cached sub ranges, served locally, and gaps which
+    are fetched from the connection then stored. Only blocks at least finality_depth behind the head are cached, the
+    rest of a range is always fetched. Anything other than log requests is passed straight through to the
+    connection."""
+
+    __slots__ = ("path", "db", "finality_depth", "finalised_block", "blocks_served", "blocks_fetched")
+
+    def __init__(self, connection: HTTPRPCConnection, path: str, finality_depth: int = 64,
+                 finalised_block: Optional[int] = None):
+        super().__init__(connection)
+        self.path: str = path
+        self.finality_depth: int = finality_depth
+        # only ever increases, so a stale value just means fewer blocks are cached
+        self.finalised_block: Optional[int] = finalised_block
+        self.blocks_served: int = 0
+        self.blocks_fetched: int = 0
+        self.db: sqlite3.Connection = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS ranges (filter_key TEXT NOT NULL, from_block INTEGER NOT NULL, "
+                        "to_block INTEGER NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS ranges_filter ON ranges (filter_key, from_block)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS logs (filter_key TEXT NOT NULL, block_number INTEGER NOT NULL, "
+                        "log_index INTEGER NOT NULL, raw TEXT NOT NULL, PRIMARY KEY (filter_key, block_number, "
+                        "log_index))")
+        self.db.commit()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"blocks_served": self.blocks_served, "blocks_fetched": self.blocks_fetched}
+
+    async def get_finalised_block(self, block_number: int) -> int:
+        """gets the most recent block which is safe to cache, only asking for the head if block_number is past it"""
+        if self.finalised_block is None or block_number > self.finalised_block:
+            head = await self.connection.send_request(BlockNumberRequest())
+            self.finalised_block = max(self.finalised_block or 0, head - self.finality_depth)
+        return self.finalised_block
+
+    def covered_ranges(self, filter_key: str, from_block: int, to_block: int) -> List[Tuple[int, int]]:
+        return self.db.execute("SELECT from_block, to_block FROM ranges WHERE filter_key = ? AND to_block >= ? AND "
+                               "from_block <= ? ORDER BY from_block", (filter_key, from_block, to_block)).fetchall()
+
+    def plan(self, filter_key: str, from_block: int, to_block: int) -> List[Tuple[int, int, bool]]:
+        """splits the range into (from, to, cached) sub ranges"""
+        segments = []
+        position = from_block
+        for covered_from, covered_to in self.covered_ranges(filter_key, from_block, to_block):
+            if covered_from > position:
+                segments.append((position, covered_from - 1, False))
+            if covered_to >= position:
+                segments.append((max(position, covered_from), min(covered_to, to_block), True))
+                position = covered_to + 1
+        if position <= to_block:
+            segments.append((position, to_block, False))
+        return segments
+
+    def load_logs(self, request: GetLogsRequest, filter_key: str, from_block: int, to_block: int) -> List[LazyLog]:
+        rows = self.db.execute("SELECT raw FROM logs WHERE filter_key = ? AND block_number BETWEEN ? AND ? "
+                               "ORDER BY block_number, log_index", (filter_key, from_block, to_block))
+        return [request.decode_log(json_codec.loads(raw)) for (raw,) in rows]
+
+    def store_logs(self, filter_key: str, from_block: int, to_block: int, logs: List[LazyLog]):
+        self.db.executemany("INSERT OR REPLACE INTO logs (filter_key, block_number, log_index, raw) VALUES (?, ?, ?, ?)",
+                            [(filter_key, log.block_number, log.log_index, json_codec.dumps(log.to_rpc_json()))
+                             for log in logs])
+        # merge the new range with any ranges it overlaps or touches
+        touching = self.db.execute("SELECT rowid, from_block, to_block FROM ranges WHERE filter_key = ? AND "
+                                   "to_block >= ? AND from_block <= ?",
+                                   (filter_key, from_block - 1, to_block + 1)).fetchall()
+        merged_from = min([from_block] + [r[1] for r in touching])
+        merged_to = max([to_block] + [r[2] for r in touching])
+        self.db.executemany("DELETE FROM ranges WHERE rowid = ?", [(r[0],) for r in touching])
+        self.db.execute("INSERT INTO ranges (filter_key, from_block, to_block) VALUES (?, ?, ?)",
+                        (filter_key, merged_from, merged_to))
+        self.db.commit()
+
+    async def fetch_segment(self, request: GetLogsRequest, filter_key: str, from_block: int, to_block: int,
+                            store: bool) -> List[LazyLog]:
+        logs = await self.connection.smart_send_log_request(request, hex(from_block), hex(to_block))
+        self.blocks_fetched += to_block - from_block + 1
+        if store:
+            self.store_logs(filter_key, from_block, to_block, logs)
+        return logs
+
+    async def smart_send_log_request(self, request: GetLogsRequest, lower_block: Optional[str] = None,
+                                     upper_block: Optional[str] = None) -> List[LazyLog]:
+        block_range = request.block_range(lower_block, upper_block)
+        if block_range is None:
+            # block tags such as "latest" can't be cached
+            return await self.connection.smart_send_log_request(request, lower_block, upper_block)
+        from_block, to_block = block_range
+        filter_key = request.filter_key()
+        cache_to = min(to_block, await self.get_finalised_block(to_block))
+        segments = self.plan(filter_key, from_block, cache_to) if from_block <= cache_to else []
+        if cache_to < to_block:
+            # cached = None marks blocks which are fetched but not stored
+            segments.append((max(from_block, cache_to + 1), to_block, None))
+        # gaps are fetched concurrently, the connection bounds how many requests are actually in flight
+        fetched = iter(await asyncio.gather(*[self.fetch_segment(request, filter_key, segment_from, segment_to,
+                                                                 cached is not None)
+                                              for segment_from, segment_to, cached in segments if not cached]))
+        logs = []
+        for segment_from, segment_to, cached in segments:
+            if cached:
+                self.blocks_served += segment_to - segment_from + 1
+                logs += self.load_logs(request, filter_key, segment_from, segment_to)
+            else:
+                logs += next(fetched)
+        return logs
+
+    async def send_request(self, request: RPCRequest):
+        if isinstance(request, GetLogsRequest) and request.block_range() is not None:
+            return await self.smart_send_log_request(request)
+        return await self.connection.send_request(request)
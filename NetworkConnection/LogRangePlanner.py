@@ -0,0 +1,132 @@
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from NetworkConnection.BaseRPCRequests import GetLogsRequest
+from NetworkConnection.ConnectionWrapper import ConnectionWrapper
+from NetworkConnection.RPCConnection import HTTPRPCConnection, BlockRangeError
+from NetworkConnection.RequestScheduler import is_transient
+from Web3Types.TransactionLog import LazyLog
+
+
+class LogRangePlanner(ConnectionWrapper):
+    """Plans the block windows of large eth_getLogs requests from the density of logs (logs per block) seen so far for
+    each filter, sizing windows so they should return around target_fill * max_logs logs, safely under the provider
+    cap. Up to max_concurrency windows are in flight at once. A window that still exceeds the cap is split using the
+    provider's suggested range and the density estimate is raised, windows failing with a transient error are retried
+    with backoff. splits and retries are counted so the settings can be tuned. Anything other than log requests is
+    passed straight through to the connection."""
+
+    __slots__ = ("max_logs", "target_fill", "max_concurrency", "initial_window", "max_window", "smoothing",
+                 "max_retries", "retry_delay", "densities", "windows_sent", "splits", "retries")
+
+    def __init__(self, connection: HTTPRPCConnection, max_logs: int = 10000, target_fill: float = 0.5,
+                 max_concurrency: int = 4, initial_window: int = 2000, max_window: int = 100000,
+                 smoothing: float = 0.5, max_retries: int = 3, retry_delay: float = 0.25):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        super().__init__(connection)
+        self.max_logs: int = max_logs
+        self.target_fill: float = target_fill
+        self.max_concurrency: int = max_concurrency
+        self.initial_window: int = initial_window
+        self.max_window: int = max_window
+        # weight given to the latest observation in the moving average of the density
+        self.smoothing: float = smoothing
+        self.max_retries: int = max_retries
+        self.retry_delay: float = retry_delay
+        self.densities: Dict[str, float] = {}
+        self.windows_sent: int = 0
+        self.splits: int = 0
+        self.retries: int = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"windows_sent": self.windows_sent, "splits": self.splits, "retries": self.retries}
+
+    def window_size(self, filter_key: str) -> int:
+        density = self.densities.get(filter_key)
+        if density is None:
+            return self.initial_window
+        if density == 0:
+            return self.max_window
+        return max(1, min(self.max_window, int(self.target_fill * self.max_logs / density)))
+
+    def observe(self, filter_key: str, blocks: int, logs: int):
+        density = logs / blocks
+        previous = self.densities.get(filter_key)
+        if previous is not None:
+            density = self.smoothing * density + (1 - self.smoothing) * previous
+        self.densities[filter_key] = density
+
+    def observe_overflow(self, filter_key: str, blocks: int):
+        """the window had more than max_logs logs, so the density is at least max_logs / blocks"""
+        self.densities[filter_key] = max(self.densities.get(filter_key, 0), self.max_logs / blocks)
+
+    async def send_window(self, request: GetLogsRequest, from_block: int, to_block: int) -> List[LazyLog]:
+        attempt = 0
+        while True:
+            self.windows_sent += 1
+            try:
+                return await self.connection.send_request(request.for_range(from_block, to_block))
+            except Exception as err:
+                if not is_transient(err) or attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+                attempt += 1
+
+    def split_window(self, filter_key: str, from_block: int, to_block: int,
+                     err: BlockRangeError) -> List[Tuple[int, int]]:
+        blocks = to_block - from_block + 1
+        if blocks == 1:
+            raise err
+        self.splits += 1
+        self.observe_overflow(filter_key, blocks)
+        suggested = int(err.upper_block, 16) - int(err.lower_block, 16) + 1
+        size = max(1, min(self.window_size(filter_key), suggested, blocks // 2))
+        return [(i, min(to_block, i + size - 1)) for i in range(from_block, to_block + 1, size)]
+
+    async def smart_send_log_request(self, request: GetLogsRequest, lower_block: Optional[str] = None,
+                                     upper_block: Optional[str] = None) -> List[LazyLog]:
+        block_range = request.block_range(lower_block, upper_block)
+        if block_range is None:
+            # block tags such as "latest" have no range to plan
+            return await self.connection.smart_send_log_request(request, lower_block, upper_block)
+        from_block, to_block = block_range
+        filter_key = request.filter_key()
+        # windows which were split and still need to be sent, these are sent before planning any new windows
+        split_windows = deque()
+        next_block = from_block
+        results: Dict[int, List[LazyLog]] = {}
+
+        async def worker():
+            nonlocal next_block
+            while True:
+                if split_windows:
+                    window_from, window_to = split_windows.popleft()
+                elif next_block <= to_block:
+                    window_from = next_block
+                    window_to = min(to_block, window_from + self.window_size(filter_key) - 1)
+                    next_block = window_to + 1
+                else:
+                    return
+                try:
+                    logs = await self.send_window(request, window_from, window_to)
+                except BlockRangeError as err:
+                    split_windows.extendleft(reversed(self.split_window(filter_key, window_from, window_to, err)))
+                    continue
+                self.observe(filter_key, window_to - window_from + 1, len(logs))
+                results[window_from] = logs
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.max_concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            raise
+        return [log for window_from in sorted(results) for log in results[window_from]]
+
+    async def send_request(self, request):
+        if isinstance(request, GetLogsRequest) and request.block_range() is not None:
+            return await self.smart_send_log_request(request)
+        return await self.connection.send_request(request)
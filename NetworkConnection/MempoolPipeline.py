@@ -0,0 +1,159 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Iterable, AsyncIterator, Tuple
+from eth_abi.exceptions import DecodingError, InsufficientDataBytes
+from NetworkConnection.AlchemyRPCRequests import AlchemyPendingTransactions
+from NetworkConnection.BaseRPCRequests import PendingTransactionSubscriptionRequest, GetTransactionByHash
+from NetworkConnection.WebsocketsRPCConnection import WebsocketsRPCConnection
+from Utilities.FunctionCallBuilder import ROUTER_SELECTORS, decode_router_transaction_input
+from Utilities.UniversalRouterDecoder import decode_universal_router_transaction_input, UniversalRouterCommand, \
+    EXECUTE_DEADLINE_SELECTOR, EXECUTE_NO_DEADLINE_SELECTOR, EXECUTE_SUB_PLAN, SWAP_COMMANDS, V3_SWAP_EXACT_OUT, \
+    CONTRACT_BALANCE, InvalidPath
+from Web3Types.SimpleTypes import HexBytes, Address
+from Web3Types.SwapIntent import SwapIntent
+
+# mainnet uniswap v2 router and universal routers
+DEFAULT_ROUTERS = (Address("0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"),
+                   Address("0x3fC91A3afd70395Cd496C647d5a6CC9D4B2b7FAD"),
+                   Address("0xEf1c6E67703c7BD7107eed8303Fbe6EC2554BF6B"))
+
+
+def decode_router_swap(tx: Dict, data: bytes) -> List[SwapIntent]:
+    function_name, decoded = decode_router_transaction_input(data)
+    args = dict(zip((i['name'] for i in ROUTER_SELECTORS[data[:4]]['inputs']), decoded))
+    # the eth variants take the input amount as the transaction value
+    amount_in = args.get('amountIn', args.get('amountInMax', int(tx['value'], 16)))
+    exact_input = 'amountOutMin' in args
+    amount_out_min = args['amountOutMin'] if exact_input else args['amountOut']
+    return [SwapIntent(HexBytes(tx['hash']), Address(tx['to']), function_name, args['path'], amount_in,
+                       amount_out_min, args['deadline'], args['to'], exact_input)]
+
+
+def flatten_commands(commands: List[UniversalRouterCommand]) -> List[UniversalRouterCommand]:
+    flat = []
+    for command in commands:
+        if command.command == EXECUTE_SUB_PLAN:
+            flat += flatten_commands(command.args['commands'])
+        else:
+            flat.append(command)
+    return flat
+
+
+def decode_universal_router_swap(tx: Dict, data: bytes) -> List[SwapIntent]:
+    """a swap intent for every v2 or v3 swap command in the transaction"""
+    function_name, commands, deadline = decode_universal_router_transaction_input(data)
+    intents = []
+    for command in flatten_commands(commands):
+        if command.command not in SWAP_COMMANDS:
+            continue
+        args = command.args
+        exact_input = 'amountIn' in args
+        amount_in = args['amountIn'] if exact_input else args['amountInMax']
+        if amount_in == CONTRACT_BALANCE:
+            # spends whatever the router holds, usually the eth wrapped by an earlier command
+            amount_in = int(tx['value'], 16)
+        # v3 exact output paths run from the output token back to the input token
+        path = args['path'][::-1] if command.command == V3_SWAP_EXACT_OUT else args['path']
+        intents.append(SwapIntent(HexBytes(tx['hash']), Address(tx['to']), command.name, path, amount_in,
+                                  args['amountOutMin'] if exact_input else args['amountOut'], deadline,
+                                  args['recipient'], exact_input))
+    return intents
+
+
+def decode_swap_intents(transactions: List[Dict]) -> Tuple[List[SwapIntent], int]:
+    """decodes the swaps in raw transaction bodies, skipping anything which isn't a router swap. Returns the intents and
+    the number of transactions whose calldata couldn't be decoded. A plain function so it can be run in a process
+    pool"""
+    intents = []
+    failures = 0
+    for tx in transactions:
+        try:
+            data = bytes.fromhex(tx['input'][2:])
+            selector = data[:4]
+            if selector in ROUTER_SELECTORS:
+                intents += decode_router_swap(tx, data)
+            elif selector == EXECUTE_DEADLINE_SELECTOR or selector == EXECUTE_NO_DEADLINE_SELECTOR:
+                intents += decode_universal_router_swap(tx, data)
+        except (InsufficientDataBytes, InvalidPath, DecodingError, ValueError):
+            # malformed calldata, the transaction will revert anyway
+            failures += 1
+    return intents, failures
+
+
+class MempoolPipeline:
+    """Turns pending transactions sent to the routers into SwapIntents. With alchemy=True the alchemy subscription
+    delivers full transaction bodies filtered to the routers, otherwise pending hashes are fetched in batches of
+    fetch_batch_size. Decoding runs in executor (e.g. a ProcessPoolExecutor) when one is given and there are at least
+    min_executor_batch transactions to decode, otherwise inline."""
+
+    __slots__ = ("connection", "routers", "alchemy", "fetch_batch_size", "executor", "min_executor_batch",
+                 "subscription", "hashes_seen", "transactions_fetched", "router_transactions", "intents",
+                 "decode_failures")
+
+    def __init__(self, connection: WebsocketsRPCConnection, routers: Iterable[Address] = DEFAULT_ROUTERS,
+                 alchemy: bool = False, fetch_batch_size: int = 100, executor: Optional[Executor] = None,
+                 min_executor_batch: int = 64):
+        self.connection: WebsocketsRPCConnection = connection
+        # lower case hex so a raw transaction's to field can be checked without building an Address
+        self.routers: Dict[str, Address] = {str(r).lower(): r for r in routers}
+        self.alchemy: bool = alchemy
+        self.fetch_batch_size: int = fetch_batch_size
+        self.executor: Optional[Executor] = executor
+        self.min_executor_batch: int = min_executor_batch
+        self.subscription = None
+        self.hashes_seen: int = 0
+        self.transactions_fetched: int = 0
+        self.router_transactions: int = 0
+        self.intents: int = 0
+        self.decode_failures: int = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hashes_seen": self.hashes_seen, "transactions_fetched": self.transactions_fetched,
+                "router_transactions": self.router_transactions, "intents": self.intents,
+                "decode_failures": self.decode_failures}
+
+    async def start(self):
+        if self.alchemy:
+            self.subscription = AlchemyPendingTransactions([str(r) for r in self.routers.values()])
+        else:
+            self.subscription = PendingTransactionSubscriptionRequest()
+        await self.connection.subscribe_to_events(self.subscription)
+
+    async def fetch_transactions(self, hashes: List[HexBytes]) -> List[Dict]:
+        batches = [hashes[i: i + self.fetch_batch_size] for i in range(0, len(hashes), self.fetch_batch_size)]
+        results = await asyncio.gather(*[self.connection.send_batch_request([GetTransactionByHash(h) for h in batch])
+                                         for batch in batches])
+        # dropped or already mined transactions come back as None
+        transactions = [tx for batch in results for tx in batch if tx is not None]
+        self.transactions_fetched += len(transactions)
+        return transactions
+
+    async def decode(self, transactions: List[Dict]) -> List[SwapIntent]:
+        if self.executor is not None and len(transactions) >= self.min_executor_batch:
+            intents, failures = await asyncio.get_running_loop().run_in_executor(self.executor, decode_swap_intents,
+                                                                                 transactions)
+        else:
+            intents, failures = decode_swap_intents(transactions)
+        self.decode_failures += failures
+        return intents
+
+    async def poll(self) -> List[SwapIntent]:
+        """waits for pending transactions, returning the swaps in everything received since the last poll"""
+        if self.subscription is None:
+            await self.start()
+        received = await self.connection.poll_subscription_as_list(self.subscription)
+        if self.alchemy:
+            transactions = received
+        else:
+            self.hashes_seen += len(received)
+            transactions = await self.fetch_transactions(received)
+        transactions = [tx for tx in transactions if tx.get('to') is not None and tx['to'].lower() in self.routers]
+        self.router_transactions += len(transactions)
+        intents = await self.decode(transactions)
+        self.intents += len(intents)
+        return intents
+
+    async def __aiter__(self) -> AsyncIterator[SwapIntent]:
+        while True:
+            for intent in await self.poll():
+                yield intent
@@ -1,7 +1,11 @@
 import asyncio
 import copy
+import socket
+from typing import AsyncIterator, Dict, Tuple
 import aiohttp
 from NetworkConnection.BaseRPCRequests import *
+from Utilities.JsonStream import JsonArrayStreamParser
+from Utilities.JsonCodec import JsonCodec, get_codec
 
 
 class Batch_Error(Exception):
@@ -21,18 +25,112 @@ class ExecutionRevertError(RPC_Error):
     pass
 
 
+class RateLimitError(RPC_Error):
+    """the provider is throttling requests (http 429, or infura's -32005 without a suggested block range)"""
+    pass
+
+
+class TransportConfig:
+    """Connection pool settings for HTTPRPCConnection. limit and limit_per_host bound the number of open sockets,
+    keepalive_timeout is how long idle sockets are kept for reuse and max_in_flight bounds the number of requests
+    waiting on a response across every caller of the connection (further requests queue until one completes).
+    Streamed responses are held open by their consumer, so they are bounded separately by max_streams"""
+
+    __slots__ = ("limit", "limit_per_host", "keepalive_timeout", "ttl_dns_cache", "tcp_nodelay", "max_in_flight",
+                 "max_streams")
+
+    def __init__(self, limit: int = 64, limit_per_host: int = 32, keepalive_timeout: float = 30,
+                 ttl_dns_cache: Optional[int] = 300, tcp_nodelay: bool = True, max_in_flight: int = 32,
+                 max_streams: int = 8):
+        if max_in_flight < 1 or max_streams < 1:
+            raise ValueError("max_in_flight and max_streams must be at least 1")
+        self.limit: int = limit
+        self.limit_per_host: int = limit_per_host
+        self.keepalive_timeout: float = keepalive_timeout
+        self.ttl_dns_cache: Optional[int] = ttl_dns_cache
+        self.tcp_nodelay: bool = tcp_nodelay
+        self.max_in_flight: int = max_in_flight
+        self.max_streams: int = max_streams
+
+    def _create_socket(self, addr_info) -> socket.socket:
+        family, sock_type, proto, _, _ = addr_info
+        sock = socket.socket(family=family, type=sock_type, proto=proto)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self.tcp_nodelay else 0)
+        return sock
+
+    def create_connector(self) -> aiohttp.TCPConnector:
+        kwargs = {"limit": self.limit, "limit_per_host": self.limit_per_host,
+                  "keepalive_timeout": self.keepalive_timeout, "ttl_dns_cache": self.ttl_dns_cache,
+                  "use_dns_cache": self.ttl_dns_cache is not None}
+        try:
+            # socket_factory is only available in newer versions of aiohttp, which set TCP_NODELAY by default anyway
+            return aiohttp.TCPConnector(socket_factory=self._create_socket, **kwargs)
+        except TypeError:
+            return aiohttp.TCPConnector(**kwargs)
+
+
+class BatchConfig:
+    """Limits for json-rpc batches. Batches with more than max_batch_size requests or an encoded size over
+    max_batch_bytes are split into chunks, up to max_concurrent_chunks of which are sent at once. A chunk that fails
+    as a whole (connection error or a malformed response) is resent up to retries times with exponential backoff"""
+
+    __slots__ = ("max_batch_size", "max_batch_bytes", "max_concurrent_chunks", "retries", "retry_delay")
+
+    def __init__(self, max_batch_size: int = 500, max_batch_bytes: int = 1000000, max_concurrent_chunks: int = 4,
+                 retries: int = 2, retry_delay: float = 0.25):
+        if max_batch_size < 1 or max_concurrent_chunks < 1:
+            raise ValueError("max_batch_size and max_concurrent_chunks must be at least 1")
+        if max_batch_size > HTTPRPCConnection.MAX_REQUESTS:
+            # request ids wrap after MAX_REQUESTS, so a larger chunk would reuse ids
+            raise ValueError(f"max_batch_size can be at most {HTTPRPCConnection.MAX_REQUESTS}")
+        self.max_batch_size: int = max_batch_size
+        self.max_batch_bytes: int = max_batch_bytes
+        self.max_concurrent_chunks: int = max_concurrent_chunks
+        self.retries: int = retries
+        self.retry_delay: float = retry_delay
+
+    def split(self, encoded_requests: List[bytes]) -> List[Tuple[int, int]]:
+        """gets the (start, end) index of each chunk. A single request over the byte budget is sent in its own chunk"""
+        chunks = []
+        start = 0
+        chunk_bytes = 0
+        for index, encoded in enumerate(encoded_requests):
+            if index > start and (index - start >= self.max_batch_size
+                                  or chunk_bytes + len(encoded) + 1 > self.max_batch_bytes):
+                chunks.append((start, index))
+                start = index
+                chunk_bytes = 0
+            chunk_bytes += len(encoded) + 1
+        if start < len(encoded_requests):
+            chunks.append((start, len(encoded_requests)))
+        return chunks
+
+
 class HTTPRPCConnection:
-    __slots__ = ("http_connection", "http_url", "current_request_id")
+    __slots__ = ("http_connection", "http_url", "current_request_id", "codec", "transport_config", "batch_config",
+                 "in_flight", "streams")
 
     MAX_REQUESTS = 10000
+    STREAM_CHUNK_SIZE = 65536
+    JSON_HEADERS = {"Content-Type": "application/json"}
 
-    def __init__(self, http_url: str):
+    def __init__(self, http_url: str, codec: Optional[JsonCodec] = None,
+                 transport_config: Optional[TransportConfig] = None, batch_config: Optional[BatchConfig] = None):
         self.http_connection: aiohttp.ClientSession = None
         self.http_url: str = http_url
         self.current_request_id = 0
+        self.codec: JsonCodec = codec if codec is not None else get_codec()
+        self.transport_config: TransportConfig = transport_config if transport_config is not None \
+            else TransportConfig()
+        self.batch_config: BatchConfig = batch_config if batch_config is not None else BatchConfig()
+        self.in_flight: asyncio.Semaphore = None
+        self.streams: asyncio.Semaphore = None
 
     def enter(self):
-        self.http_connection = aiohttp.ClientSession()
+        self.in_flight = asyncio.Semaphore(self.transport_config.max_in_flight)
+        self.streams = asyncio.Semaphore(self.transport_config.max_streams)
+        self.http_connection = aiohttp.ClientSession(connector=self.transport_config.create_connector(),
+                                                     json_serialize=self.codec.dumps)
 
     async def __aenter__(self):
         self.enter()
@@ -53,6 +151,9 @@ class HTTPRPCConnection:
                 raise ExecutionRevertError(3, response['error']['message'])
             elif response['error']['code'] == -32000:
                 raise RPC_Error(response['error']['code'], response)
+            elif response['error']['code'] == 429 or (response['error']['code'] == -32005
+                                                       and '[' not in response['error'].get('message', '')):
+                raise RateLimitError(response['error']['code'], response)
             elif response['error']['code'] == -32005:
                 response = response['error']
                 block_list = response['message'][response['message'].index('[') + 1: response['message'].index(']')]
@@ -62,13 +163,28 @@ class HTTPRPCConnection:
             else:
                 raise RPC_Error(response['error']['code'], response)
 
+    async def post_raw(self, body: bytes):
+        """posts an encoded json-rpc request (or batch) and returns the decoded response body. At most
+        transport_config.max_in_flight posts are outstanding at once, any others wait here"""
+        async with self.in_flight:
+            async with self.http_connection.post(self.http_url, data=body, headers=self.JSON_HEADERS) as resp:
+                return self.codec.loads_rpc(await resp.read())
+
+    async def post_json(self, rpc_json):
+        return await self.post_raw(self.codec.dumps_bytes(rpc_json))
+
+    def create_rpc_json(self, request: RPCRequest) -> Dict:
+        return {"jsonrpc": "2.0", "method": request.request_name, "params": request.params,
+                "id": self.generate_request_id()}
+
+    async def send_raw_request(self, request: RPCRequest):
+        """sends the request and returns the undecoded result"""
+        response = await self.post_json(self.create_rpc_json(request))
+        if self.response_code_valid(response):
+            return response['result']
+
     async def send_request(self, request: RPCRequest):
-        request_id = self.generate_request_id()
-        rpc_json = {"jsonrpc": "2.0", "method": request.request_name, "params": request.params, "id": request_id}
-        async with self.http_connection.post(self.http_url, json=rpc_json) as resp:
-            response = await resp.json()
-            if self.response_code_valid(response):
-                return request.decode_response(response['result'])
+        return request.decode_response(await self.send_raw_request(request))
 
     async def smart_send_log_request(self, request: GetLogsRequest, lower_block: Optional[str] = None,
                                      upper_block: Optional[str] = None):
@@ -79,43 +195,111 @@ class HTTPRPCConnection:
         if lower_block is not None and upper_block is not None:
             rpc_json["params"][0]["fromBlock"] = lower_block
             rpc_json["params"][0]["toBlock"] = upper_block
-        async with self.http_connection.post(self.http_url, json=rpc_json) as resp:
-            response = await resp.json()
+        # the response is read before recursing so the sub requests don't wait on a slot this request is holding
+        response = await self.post_json(rpc_json)
+        try:
+            valid_resp = self.response_code_valid(response)
+        except BlockRangeError as err:
+            required_spread = int(err.upper_block, 16) - int(err.lower_block, 16)
+            from_block = int(rpc_json["params"][0]["fromBlock"], 16)
+            to_block = int(rpc_json["params"][0]["toBlock"], 16)
+            use_spread = max(required_spread // 2, 1)
+            coros_recurse = [self.smart_send_log_request(request, hex(i), hex(min(to_block, i + use_spread - 1)))
+                             for i in range(from_block, to_block + 1, use_spread)]
+            results = await asyncio.gather(*coros_recurse)
+            outs = []
+            for res in results:
+                outs += res
+            return outs
+        if valid_resp:
+            return request.decode_response(response['result'])
+
+    async def stream_log_request(self, request: GetLogsRequest, lower_block: Optional[str] = None,
+                                 upper_block: Optional[str] = None) -> AsyncIterator[LazyLog]:
+        """sends a log request and yields each log as soon as it has been received and parsed, rather than buffering
+        and parsing the whole response first. Raises BlockRangeError before yielding anything if too many logs are
+        requested. The response stays open, holding one of transport_config.max_streams stream slots and a pooled
+        socket, until the consumer finishes or closes the generator. Streams don't count towards max_in_flight, so
+        the consumer can send other requests while iterating, but opening more than max_streams streams at once from
+        within a stream's loop will wait forever"""
+        request_id = self.generate_request_id()
+        rpc_json = {"jsonrpc": "2.0", "method": request.request_name, "params": copy.deepcopy(request.params),
+                    "id": request_id}
+        if lower_block is not None and upper_block is not None:
+            rpc_json["params"][0]["fromBlock"] = lower_block
+            rpc_json["params"][0]["toBlock"] = upper_block
+        async with self.streams, self.http_connection.post(self.http_url, json=rpc_json) as resp:
+            parser = JsonArrayStreamParser("result")
+            async for chunk in resp.content.iter_chunked(self.STREAM_CHUNK_SIZE):
+                for raw_log in parser.feed(chunk):
+                    yield request.decode_log(raw_log)
+            parser.close()
+            if parser.fallback_response is not None and self.response_code_valid(parser.fallback_response):
+                for raw_log in parser.fallback_response['result'] or []:
+                    yield request.decode_log(raw_log)
+
+    async def smart_stream_log_request(self, request: GetLogsRequest, lower_block: Optional[str] = None,
+                                       upper_block: Optional[str] = None) -> AsyncIterator[LazyLog]:
+        """streaming version of smart_send_log_request. If too many logs are requested the range is split and the
+        sub ranges are streamed one after the other, so logs are still yielded in block order"""
+        try:
+            async for log in self.stream_log_request(request, lower_block, upper_block):
+                yield log
+            return
+        except BlockRangeError as err:
+            required_spread = int(err.upper_block, 16) - int(err.lower_block, 16)
+        from_block = int(lower_block if lower_block is not None else request.params[0]["fromBlock"], 16)
+        to_block = int(upper_block if upper_block is not None else request.params[0]["toBlock"], 16)
+        use_spread = max(required_spread // 2, 1)
+        for i in range(from_block, to_block + 1, use_spread):
+            async for log in self.smart_stream_log_request(request, hex(i), hex(min(to_block, i + use_spread - 1))):
+                yield log
+
+    @staticmethod
+    def match_batch_response(batch: List[Dict], response) -> List[Dict]:
+        """orders the responses to a batch by request id, as providers don't have to keep them in request order"""
+        if type(response) != list:
+            raise Batch_Error(f"Expected a list of responses to the batch, got {response}")
+        responses_by_id = {r.get('id'): r for r in response}
+        try:
+            return [responses_by_id[rpc_json['id']] for rpc_json in batch]
+        except KeyError as err:
+            raise Batch_Error(f"No response for request id {err.args[0]}")
+
+    async def send_batch_chunk(self, batch: List[Dict], encoded_batch: List[bytes]) -> List[Dict]:
+        body = b"[" + b",".join(encoded_batch) + b"]"
+        attempt = 0
+        while True:
             try:
-                valid_resp = self.response_code_valid(response)
-            except BlockRangeError as err:
-                required_spread = int(err.upper_block, 16) - int(err.lower_block, 16)
-                from_block = int(rpc_json["params"][0]["fromBlock"], 16)
-                to_block = int(rpc_json["params"][0]["toBlock"], 16)
-                use_spread = required_spread // 2
-                coros_recurse = [self.smart_send_log_request(request, hex(i), hex(min(to_block, i + use_spread - 1)))
-                                 for i in range(from_block, to_block, use_spread)]
-                results = await asyncio.gather(*coros_recurse)
-                outs = []
-                for res in results:
-                    outs += res
-                return outs
-            if valid_resp:
-                return request.decode_response(response['result'])
+                return self.match_batch_response(batch, await self.post_raw(body))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, Batch_Error):
+                if attempt >= self.batch_config.retries:
+                    raise
+                await asyncio.sleep(self.batch_config.retry_delay * 2 ** attempt)
+                attempt += 1
+
+    async def send_raw_batch(self, batch: List[Dict]) -> List[Dict]:
+        """sends a list of json-rpc request dicts, split into chunks according to batch_config, and returns the raw
+        responses in the same order as the requests. Request ids only need to be unique within a chunk"""
+        encoded_batch = [self.codec.dumps_bytes(rpc_json) for rpc_json in batch]
+        chunk_limit = asyncio.Semaphore(self.batch_config.max_concurrent_chunks)
+
+        async def send_chunk(start: int, end: int):
+            async with chunk_limit:
+                return await self.send_batch_chunk(batch[start:end], encoded_batch[start:end])
+
+        chunks = self.batch_config.split(encoded_batch)
+        results = await asyncio.gather(*[send_chunk(start, end) for start, end in chunks])
+        return [response for chunk_responses in results for response in chunk_responses]
+
+    async def send_batch_request_raw(self, batch_list: List[RPCRequest]) -> List:
+        """sends the requests as a batch and returns the undecoded results"""
+        response = await self.send_raw_batch([self.create_rpc_json(request) for request in batch_list])
+        return [r['result'] for r in response if self.response_code_valid(r)]
 
     async def send_batch_request(self, batch_list: List[RPCRequest]):
-        request_id_start = self.generate_request_id()
-        request_id = request_id_start
-        batch = []
-        for request in batch_list:
-            batch.append({"jsonrpc": "2.0", "method": request.request_name, "params": request.params, "id": request_id})
-            request_id = self.generate_request_id()
-        async with self.http_connection.post(self.http_url, json=batch) as resp:
-            response = await resp.json()
-            out = []
-            for batch_req, (index, r) in zip(batch_list, enumerate(response)):
-                if batch[index]['id'] != r['id']:
-                    raise Batch_Error()
-                if self.response_code_valid(r):
-                    out.append(batch_req.decode_response(r['result']))
-                else:
-                    out.append(batch_req.handle_error(r))
-            return out
+        results = await self.send_batch_request_raw(batch_list)
+        return [batch_req.decode_response(result) for batch_req, result in zip(batch_list, results)]
 
     async def add_filter(self, request: FilterRequest):
         response = await self.send_request(request)
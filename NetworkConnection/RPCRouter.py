@@ -0,0 +1,251 @@
+import asyncio
+import random
+from collections import deque
+from typing import List, Optional, Dict, Set, Callable, Awaitable, AsyncIterator
+from NetworkConnection.BaseRPCRequests import RPCRequest, CallRequest, GetLogsRequest, FilterRequest, LazyLog
+from NetworkConnection.ConnectionWrapper import ConnectionWrapper
+from NetworkConnection.RPCConnection import HTTPRPCConnection
+from NetworkConnection.RequestScheduler import is_transient
+from Utilities.CalldataBuilder import SLOT0_SELECTOR
+
+
+class EndpointStats:
+    """Latency and error rate of an endpoint over its last window requests"""
+
+    __slots__ = ("name", "latencies", "outcomes", "consecutive_errors", "down_until", "requests", "errors")
+
+    def __init__(self, name: str, window: int = 200):
+        self.name: str = name
+        self.latencies: deque = deque(maxlen=window)
+        # True for a success, False for an error
+        self.outcomes: deque = deque(maxlen=window)
+        self.consecutive_errors: int = 0
+        self.down_until: float = 0
+        self.requests: int = 0
+        self.errors: int = 0
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_errors = 0
+
+    def record_error(self):
+        self.requests += 1
+        self.errors += 1
+        self.outcomes.append(False)
+        self.consecutive_errors += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self.percentile(0.5)
+
+    @property
+    def p99(self) -> Optional[float]:
+        return self.percentile(0.99)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self) -> float:
+        """lower is better, endpoints with no latency data yet score 0 so they get tried"""
+        p50 = self.p50
+        if p50 is None:
+            return 0
+        return p50 * (1 + 10 * self.error_rate)
+
+    def to_dict(self) -> Dict:
+        return {"p50": self.p50, "p99": self.p99, "error_rate": self.error_rate, "requests": self.requests,
+                "errors": self.errors}
+
+
+class RPCRouter(ConnectionWrapper):
+    """Spreads requests across several connections (e.g. infura and alchemy) with the same interface as a single
+    connection. Each request goes to the better of two randomly picked healthy endpoints, scored on p50 latency and
+    error rate. Transient errors fail over to the next best endpoint and an endpoint with max_consecutive_errors in a
+    row is skipped for cooldown seconds. Latency critical requests (calls to slot0 at the head by default, or anything
+    sent with hedge=True) are hedged: if the first endpoint hasn't answered within its p99 latency (or hedge_delay
+    before there is any data) the request is also sent to a second endpoint and the first response wins. Anything
+    else is passed through to the first connection."""
+
+    __slots__ = ("connections", "endpoint_stats", "hedge_selectors", "hedge_delay", "cooldown",
+                 "max_consecutive_errors", "random", "hedged", "hedges_won", "failovers", "filter_endpoints")
+
+    def __init__(self, connections: List[HTTPRPCConnection], names: Optional[List[str]] = None,
+                 hedge_selectors: Optional[Set[bytes]] = None, hedge_delay: float = 0.05, cooldown: float = 5,
+                 max_consecutive_errors: int = 3, window: int = 200, seed: Optional[int] = None):
+        if not connections:
+            raise ValueError("At least one connection is needed")
+        if names is None:
+            names = [getattr(c, "http_url", str(i)) for i, c in enumerate(connections)]
+        super().__init__(connections[0])
+        self.connections: List[HTTPRPCConnection] = connections
+        self.endpoint_stats: List[EndpointStats] = [EndpointStats(name, window) for name in names]
+        self.hedge_selectors: Set[bytes] = hedge_selectors if hedge_selectors is not None else {SLOT0_SELECTOR}
+        self.hedge_delay: float = hedge_delay
+        self.cooldown: float = cooldown
+        self.max_consecutive_errors: int = max_consecutive_errors
+        self.random: random.Random = random.Random(seed)
+        self.hedged: int = 0
+        self.hedges_won: int = 0
+        self.failovers: int = 0
+        # filter id -> index of the endpoint that installed it
+        self.filter_endpoints: Dict[str, int] = {}
+
+    async def __aenter__(self):
+        for connection in self.connections:
+            connection.enter()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for connection in self.connections:
+            await connection.clean_up()
+
+    def stats(self) -> Dict:
+        return {"endpoints": {s.name: s.to_dict() for s in self.endpoint_stats}, "hedged": self.hedged,
+                "hedges_won": self.hedges_won, "failovers": self.failovers}
+
+    def should_hedge(self, request: RPCRequest) -> bool:
+        if not isinstance(request, CallRequest) or request.block_number is not None:
+            return False
+        data = request.params[0].get("data", "")
+        return bytes.fromhex(data[2:10]) in self.hedge_selectors if len(data) >= 10 else False
+
+    def rank(self) -> List[int]:
+        """orders the endpoints to try, the better of two random healthy endpoints first then the rest by score"""
+        now = asyncio.get_running_loop().time()
+        healthy = [i for i, s in enumerate(self.endpoint_stats) if s.down_until <= now]
+        down = sorted((i for i, s in enumerate(self.endpoint_stats) if s.down_until > now),
+                      key=lambda i: self.endpoint_stats[i].down_until)
+        by_score = sorted(healthy, key=lambda i: self.endpoint_stats[i].score())
+        if len(healthy) > 1:
+            first, second = self.random.sample(healthy, 2)
+            best = min(first, second, key=lambda i: self.endpoint_stats[i].score())
+            by_score.remove(best)
+            by_score.insert(0, best)
+        return by_score + down
+
+    def best_endpoint(self) -> int:
+        """the healthy endpoint with the best score, or the one coming back soonest if all are down"""
+        now = asyncio.get_running_loop().time()
+        return min(range(len(self.endpoint_stats)),
+                   key=lambda i: (self.endpoint_stats[i].down_until > now, self.endpoint_stats[i].down_until,
+                                  self.endpoint_stats[i].score()))
+
+    def get_hedge_delay(self, index: int) -> float:
+        p99 = self.endpoint_stats[index].p99
+        return p99 if p99 is not None else self.hedge_delay
+
+    async def timed_call(self, index: int, call: Callable[[HTTPRPCConnection], Awaitable]):
+        stats = self.endpoint_stats[index]
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            result = await call(self.connections[index])
+        except Exception as err:
+            if is_transient(err):
+                stats.record_error()
+                if stats.consecutive_errors >= self.max_consecutive_errors:
+                    stats.down_until = loop.time() + self.cooldown
+            else:
+                # e.g. a revert, the endpoint did its job
+                stats.record_success(loop.time() - start)
+            raise
+        stats.record_success(loop.time() - start)
+        return result
+
+    async def route(self, call: Callable[[HTTPRPCConnection], Awaitable], hedge: bool = False):
+        order = iter(self.rank())
+        pending: Dict[asyncio.Task, int] = {}
+        last_error = None
+
+        def launch() -> bool:
+            index = next(order, None)
+            if index is None:
+                return False
+            pending[asyncio.ensure_future(self.timed_call(index, call))] = index
+            return True
+
+        launch()
+        primary = next(iter(pending.values()))
+        try:
+            while pending:
+                timeout = self.get_hedge_delay(primary) if hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # the primary is slow, race it against the next endpoint
+                    hedge = False
+                    if launch():
+                        self.hedged += 1
+                    continue
+                for task in done:
+                    index = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as err:
+                        if not is_transient(err):
+                            raise
+                        last_error = err
+                        continue
+                    if index != primary:
+                        self.hedges_won += 1
+                    return result
+                if not pending:
+                    hedge = False
+                    if launch():
+                        self.failovers += 1
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    async def send_raw_request(self, request: RPCRequest, hedge: Optional[bool] = None):
+        if hedge is None:
+            hedge = self.should_hedge(request)
+        return await self.route(lambda connection: connection.send_raw_request(request), hedge)
+
+    async def send_request(self, request: RPCRequest, hedge: Optional[bool] = None):
+        return request.decode_response(await self.send_raw_request(request, hedge))
+
+    async def send_batch_request_raw(self, batch_list: List[RPCRequest]) -> List:
+        return await self.route(lambda connection: connection.send_batch_request_raw(batch_list))
+
+    async def send_batch_request(self, batch_list: List[RPCRequest]):
+        results = await self.send_batch_request_raw(batch_list)
+        return [request.decode_response(result) for request, result in zip(batch_list, results)]
+
+    async def smart_send_log_request(self, request: GetLogsRequest, lower_block: Optional[str] = None,
+                                     upper_block: Optional[str] = None):
+        return await self.route(lambda connection: connection.smart_send_log_request(request, lower_block,
+                                                                                     upper_block))
+
+    async def smart_stream_log_request(self, request: GetLogsRequest, lower_block: Optional[str] = None,
+                                       upper_block: Optional[str] = None) -> AsyncIterator[LazyLog]:
+        # logs already yielded can't be taken back, so a stream stays on one endpoint
+        index = self.best_endpoint()
+        async for log in self.connections[index].smart_stream_log_request(request, lower_block, upper_block):
+            yield log
+
+    async def add_filter(self, request: FilterRequest):
+        installed_on = []
+
+        async def install(connection: HTTPRPCConnection):
+            await connection.add_filter(request)
+            installed_on.append(self.connections.index(connection))
+
+        await self.route(install)
+        # filters only exist on the endpoint that installed them
+        self.filter_endpoints[request.filter_id] = installed_on[0]
+
+    async def poll_filter(self, filter_request: FilterRequest):
+        index = self.filter_endpoints[filter_request.get_filter_id()]
+        return await self.timed_call(index, lambda connection: connection.poll_filter(filter_request))
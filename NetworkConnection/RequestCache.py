@@ -0,0 +1,155 @@
+import asyncio
+import sqlite3
+from collections import OrderedDict
+from typing import List, Optional, Dict, Set, Tuple, Any
+from NetworkConnection.BaseRPCRequests import RPCRequest
+from NetworkConnection.ConnectionWrapper import ConnectionWrapper
+from NetworkConnection.RPCConnection import HTTPRPCConnection
+import Utilities.JsonCodec as json_codec
+
+
+class RequestCache(ConnectionWrapper):
+    """Caches the raw results of requests whose result can never change, i.e. those with a cache_key such as calls
+    pinned to a block. Identical requests made while the first is still in flight share its result rather than being
+    sent again. At most max_entries results are held in memory, the least recently used being evicted first. If a path
+    is given results are also written to a sqlite database there, so re-running a backfill costs no rpc calls.
+    Requests without a cache_key and anything other than send_request/send_batch_request are passed straight through
+    to the connection (which can itself be a RequestCoalescer)."""
+
+    __slots__ = ("max_entries", "results", "in_flight", "fetching", "path", "db", "hits", "misses", "shared")
+
+    _NOT_FOUND = object()
+
+    def __init__(self, connection: HTTPRPCConnection, max_entries: int = 100000, path: Optional[str] = None):
+        super().__init__(connection)
+        self.max_entries: int = max_entries
+        self.results: OrderedDict = OrderedDict()
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.fetching: Set[asyncio.Task] = set()
+        self.path: Optional[str] = path
+        self.db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+            self.db.commit()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.shared: int = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        while self.fetching:
+            await asyncio.gather(*self.fetching, return_exceptions=True)
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "shared": self.shared, "entries": len(self.results)}
+
+    def lookup(self, key: str) -> Any:
+        """gets a cached raw result, or _NOT_FOUND"""
+        try:
+            result = self.results[key]
+            self.results.move_to_end(key)
+            return result
+        except KeyError:
+            pass
+        if self.db is not None:
+            row = self.db.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                result = json_codec.loads(row[0])
+                self.store(key, result)
+                return result
+        return self._NOT_FOUND
+
+    def store(self, key: str, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+
+    def persist(self, items: List[Tuple[str, Any]]):
+        if self.db is not None and items:
+            self.db.executemany("INSERT OR REPLACE INTO results (key, result) VALUES (?, ?)",
+                                [(key, json_codec.dumps(result)) for key, result in items])
+            self.db.commit()
+
+    def get_or_fetch(self, requests: List[RPCRequest]) -> List[asyncio.Future]:
+        """gets a future for the raw result of each request, sending one batch for every request which is neither
+        cached nor already in flight"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        to_fetch = []
+        for request in requests:
+            key = request.cache_key()
+            if key is not None:
+                result = self.lookup(key)
+                if result is not self._NOT_FOUND:
+                    self.hits += 1
+                    future = loop.create_future()
+                    future.set_result(result)
+                    futures.append(future)
+                    continue
+                if key in self.in_flight:
+                    self.shared += 1
+                    futures.append(self.in_flight[key])
+                    continue
+                self.misses += 1
+            future = loop.create_future()
+            if key is not None:
+                self.in_flight[key] = future
+            to_fetch.append((request, key, future))
+            futures.append(future)
+        if to_fetch:
+            # fetched in a separate task so that a cancelled caller doesn't cancel requests shared with other callers
+            task = loop.create_task(self.fetch(to_fetch))
+            self.fetching.add(task)
+            task.add_done_callback(self.fetching.discard)
+        return futures
+
+    async def fetch(self, to_fetch: List[Tuple[RPCRequest, Optional[str], asyncio.Future]]):
+        try:
+            if len(to_fetch) == 1:
+                results = [await self.connection.send_raw_request(to_fetch[0][0])]
+            else:
+                results = await self.connection.send_batch_request_raw([request for request, _, _ in to_fetch])
+        except asyncio.CancelledError:
+            for _, key, future in to_fetch:
+                self.in_flight.pop(key, None)
+                future.cancel()
+            raise
+        except Exception as err:
+            for _, key, future in to_fetch:
+                self.in_flight.pop(key, None)
+                future.set_exception(err)
+                # mark as retrieved, the callers waiting on it (if any) still get the exception
+                future.exception()
+            return
+        fetched = []
+        for (_, key, future), result in zip(to_fetch, results):
+            if key is not None:
+                self.in_flight.pop(key, None)
+                self.store(key, result)
+                fetched.append((key, result))
+            future.set_result(result)
+        self.persist(fetched)
+
+    async def send_raw_request(self, request: RPCRequest):
+        return await asyncio.shield(self.get_or_fetch([request])[0])
+
+    async def send_request(self, request: RPCRequest):
+        return request.decode_response(await self.send_raw_request(request))
+
+    async def send_batch_request_raw(self, batch_list: List[RPCRequest]) -> List:
+        futures = self.get_or_fetch(batch_list)
+        return [await asyncio.shield(future) for future in futures]
+
+    async def send_batch_request(self, batch_list: List[RPCRequest]):
+        results = await self.send_batch_request_raw(batch_list)
+        return [request.decode_response(result) for request, result in zip(batch_list, results)]
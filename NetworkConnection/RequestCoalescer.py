@@ -0,0 +1,98 @@
+import asyncio
+from typing import List, Tuple, Optional, Set
+from NetworkConnection.BaseRPCRequests import RPCRequest
+from NetworkConnection.ConnectionWrapper import ConnectionWrapper
+from NetworkConnection.RPCConnection import HTTPRPCConnection
+
+
+class RequestCoalescer(ConnectionWrapper):
+    """Collects the requests sent by concurrent callers and sends them to the connection as json-rpc batches. A batch
+    is sent once max_batch requests are waiting or window seconds after the first request arrived, whichever comes
+    first. Each caller awaits its own future so errors (e.g. a reverted call) only affect the request that caused them.
+    Anything other than send_request and send_raw_request is passed straight through to the connection, so a coalescer
+    can be used in place of the connection, e.g. by BlockchainConnectionManager. Batches are built from the raw
+    json-rpc dicts to keep errors per request, so only HTTPRPCConnection is supported."""
+
+    __slots__ = ("window", "max_batch", "pending", "flush_handle", "dispatching", "batches_sent", "requests_sent")
+
+    def __init__(self, connection: HTTPRPCConnection, window: float = 0.002, max_batch: int = 100):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        if not isinstance(connection, HTTPRPCConnection):
+            raise TypeError(f"RequestCoalescer needs an HTTPRPCConnection, not {type(connection).__name__}")
+        super().__init__(connection)
+        self.window: float = window
+        self.max_batch: int = max_batch
+        self.pending: List[Tuple[RPCRequest, asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.dispatching: Set[asyncio.Task] = set()
+        self.batches_sent: int = 0
+        self.requests_sent: int = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.drain()
+
+    async def send_request(self, request: RPCRequest):
+        return request.decode_response(await self.send_raw_request(request))
+
+    async def send_raw_request(self, request: RPCRequest):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((request, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        """sends everything that is waiting without waiting for the window to close"""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        task = asyncio.get_running_loop().create_task(self.dispatch(batch))
+        self.dispatching.add(task)
+        task.add_done_callback(self.dispatching.discard)
+
+    async def drain(self):
+        """sends everything that is waiting and waits for every batch to complete"""
+        self.flush()
+        while self.dispatching:
+            await asyncio.gather(*self.dispatching, return_exceptions=True)
+
+    async def dispatch(self, batch: List[Tuple[RPCRequest, asyncio.Future]]):
+        self.batches_sent += 1
+        self.requests_sent += len(batch)
+        if len(batch) == 1:
+            request, future = batch[0]
+            try:
+                result = await self.connection.send_raw_request(request)
+            except Exception as err:
+                if not future.done():
+                    future.set_exception(err)
+                return
+            if not future.done():
+                future.set_result(result)
+            return
+        try:
+            responses = await self.connection.send_raw_batch([self.connection.create_rpc_json(request)
+                                                               for request, _ in batch])
+        except Exception as err:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(err)
+            return
+        for (request, future), response in zip(batch, responses):
+            if future.done():
+                # the caller was cancelled
+                continue
+            try:
+                if self.connection.response_code_valid(response):
+                    future.set_result(response['result'])
+            except Exception as err:
+                future.set_exception(err)
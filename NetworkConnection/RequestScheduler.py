@@ -0,0 +1,190 @@
+import asyncio
+import random
+from typing import Dict, Optional, List, Callable, Awaitable
+import aiohttp
+from NetworkConnection.BaseRPCRequests import RPCRequest, RPC_Error, GetLogsRequest
+from NetworkConnection.ConnectionWrapper import ConnectionWrapper
+from NetworkConnection.RPCConnection import HTTPRPCConnection, RateLimitError, ExecutionRevertError, Batch_Error, \
+    BlockRangeError
+
+# compute units charged by alchemy for each method, anything missing is charged the scheduler's default_cost
+ALCHEMY_COMPUTE_UNITS: Dict[str, int] = {
+    "eth_blockNumber": 10,
+    "eth_chainId": 0,
+    "eth_call": 26,
+    "eth_estimateGas": 87,
+    "eth_feeHistory": 10,
+    "eth_gasPrice": 19,
+    "eth_getBalance": 19,
+    "eth_getBlockByHash": 16,
+    "eth_getBlockByNumber": 16,
+    "eth_getCode": 26,
+    "eth_getFilterChanges": 20,
+    "eth_getLogs": 75,
+    "eth_getStorageAt": 17,
+    "eth_getTransactionByHash": 17,
+    "eth_getTransactionReceipt": 15,
+    "eth_newBlockFilter": 20,
+    "eth_newFilter": 20,
+    "eth_sendRawTransaction": 250,
+    "eth_subscribe": 10,
+    "alchemy_getTransactionReceipts": 250,
+}
+
+
+class RetryBudgetExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    """Allows rate units per second on average with bursts of up to capacity units. acquire waits until enough units
+    are available, a cost above the capacity is charged as the whole capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "last_refill", "waited")
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity must be positive")
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.last_refill: Optional[float] = None
+        self.waited: float = 0
+
+    def refill(self, now: float):
+        if self.last_refill is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def acquire(self, cost: float):
+        loop = asyncio.get_running_loop()
+        cost = min(cost, self.capacity)
+        self.refill(loop.time())
+        # units are taken straight away so later callers queue behind this one
+        self.tokens -= cost
+        if self.tokens < 0:
+            delay = -self.tokens / self.rate
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+    def drain(self):
+        """empties the bucket, e.g. after the provider says we are being throttled anyway"""
+        self.tokens = min(self.tokens, 0)
+
+
+class RetryBudget:
+    """Limits retries to a fraction of the requests made, so a struggling provider isn't hit by a retry storm. Each
+    request deposits ratio tokens (up to max_tokens) and each retry withdraws one"""
+
+    __slots__ = ("ratio", "max_tokens", "tokens")
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10, max_tokens: float = 100):
+        self.ratio: float = ratio
+        self.max_tokens: float = max_tokens
+        self.tokens: float = min_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def is_transient(err: Exception) -> bool:
+    """whether resending the same request might succeed"""
+    if isinstance(err, (RateLimitError, aiohttp.ClientError, asyncio.TimeoutError, Batch_Error)):
+        return True
+    if isinstance(err, (ExecutionRevertError, BlockRangeError)):
+        return False
+    if isinstance(err, RPC_Error):
+        # -32000 covers both reverts and transient node errors such as "header not found"
+        message = str(err).lower()
+        return err.id in (-32000, -32603) and "revert" not in message
+    return False
+
+
+class RequestScheduler(ConnectionWrapper):
+    """Rate limits and retries the requests sent through a connection. Requests are paced by a token bucket which can
+    be charged per method (e.g. ALCHEMY_COMPUTE_UNITS), a batch costing the sum of its requests. Transient errors are
+    retried with jittered exponential backoff, as long as the retry budget allows. Anything other than sending requests
+    is passed straight through to the connection."""
+
+    __slots__ = ("bucket", "compute_units", "default_cost", "max_retries", "base_delay", "max_delay", "budget",
+                 "random", "requests", "retries", "rate_limited", "failures", "budget_exhausted")
+
+    def __init__(self, connection: HTTPRPCConnection, rate: float = 25, capacity: Optional[float] = None,
+                 compute_units: Optional[Dict[str, int]] = None, default_cost: int = 1, max_retries: int = 5,
+                 base_delay: float = 0.1, max_delay: float = 10, retry_budget: Optional[RetryBudget] = None,
+                 seed: Optional[int] = None):
+        super().__init__(connection)
+        self.bucket: TokenBucket = TokenBucket(rate, capacity if capacity is not None else rate)
+        self.compute_units: Dict[str, int] = compute_units if compute_units is not None else {}
+        self.default_cost: int = default_cost
+        self.max_retries: int = max_retries
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.budget: RetryBudget = retry_budget if retry_budget is not None else RetryBudget()
+        self.random: random.Random = random.Random(seed)
+        self.requests: int = 0
+        self.retries: int = 0
+        self.rate_limited: int = 0
+        self.failures: int = 0
+        self.budget_exhausted: int = 0
+
+    def stats(self) -> Dict[str, float]:
+        return {"requests": self.requests, "retries": self.retries, "rate_limited": self.rate_limited,
+                "failures": self.failures, "budget_exhausted": self.budget_exhausted,
+                "throttled_seconds": self.bucket.waited}
+
+    def cost(self, requests: List[RPCRequest]) -> int:
+        return sum(self.compute_units.get(r.request_name, self.default_cost) for r in requests)
+
+    def backoff(self, attempt: int) -> float:
+        """full jitter, a uniformly random delay up to the exponential backoff"""
+        return self.random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def schedule(self, cost: int, call: Callable[[], Awaitable]):
+        """runs call once the rate limit allows, retrying it on transient errors"""
+        self.requests += 1
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            await self.bucket.acquire(cost)
+            try:
+                return await call()
+            except Exception as err:
+                if not is_transient(err):
+                    raise
+                if isinstance(err, RateLimitError):
+                    self.rate_limited += 1
+                    self.bucket.drain()
+                if attempt >= self.max_retries:
+                    self.failures += 1
+                    raise
+                if not self.budget.withdraw():
+                    self.budget_exhausted += 1
+                    raise RetryBudgetExceeded(f"retry budget exhausted, last error = {err!r}") from err
+                self.retries += 1
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+
+    async def send_raw_request(self, request: RPCRequest):
+        return await self.schedule(self.cost([request]), lambda: self.connection.send_raw_request(request))
+
+    async def send_request(self, request: RPCRequest):
+        return request.decode_response(await self.send_raw_request(request))
+
+    async def send_batch_request_raw(self, batch_list: List[RPCRequest]) -> List:
+        return await self.schedule(self.cost(batch_list), lambda: self.connection.send_batch_request_raw(batch_list))
+
+    async def send_batch_request(self, batch_list: List[RPCRequest]):
+        results = await self.send_batch_request_raw(batch_list)
+        return [request.decode_response(result) for request, result in zip(batch_list, results)]
+
+    async def smart_send_log_request(self, request: GetLogsRequest, lower_block: Optional[str] = None,
+                                     upper_block: Optional[str] = None):
+        return await self.schedule(self.cost([request]),
+                                   lambda: self.connection.smart_send_log_request(request, lower_block, upper_block))
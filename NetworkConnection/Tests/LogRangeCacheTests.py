@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+import Utilities.FunctionCallBuilder as fcb
+from NetworkConnection.BaseRPCRequests import GetLogsRequest
+from NetworkConnection.LogRangeCache import LogRangeCache
+from NetworkConnection.RPCConnection import HTTPRPCConnection
+from NetworkConnection.Tests.RPCConnectionTests import FakeRPCServer, log_range_handler
+
+HEAD_BLOCK = 1000
+
+
+def chain_handler(body):
+    if body["method"] == "eth_blockNumber":
+        return hex(HEAD_BLOCK)
+    return log_range_handler(50, 1)(body)
+
+
+class LogRangeCacheTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = FakeRPCServer(chain_handler)
+        await self.server.start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "logs.sqlite")
+        self.swap_event = fcb.create_event_abi("Swap", fcb.get_abi("V3LiquidityPool"))
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+        self.directory.cleanup()
+
+    def fetched_ranges(self):
+        return [(int(r["params"][0]["fromBlock"], 16), int(r["params"][0]["toBlock"], 16))
+                for r in self.server.requests if r["method"] == "eth_getLogs"]
+
+    def test_block_range(self):
+        request = GetLogsRequest(100, 139, [self.swap_event])
+        self.assertEqual(request.block_range(), (100, 139))
+        self.assertEqual(request.block_range("0x80", "0x90"), (128, 144))
+        self.assertIsNone(GetLogsRequest(100, "latest", [self.swap_event]).block_range())
+        self.assertIsNone(request.block_range("earliest", "0x90"))
+
+    async def test_only_gaps_are_fetched(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            async with LogRangeCache(conn, self.path) as cache:
+                await cache.smart_send_log_request(GetLogsRequest(100, 139, [self.swap_event]))
+                await cache.smart_send_log_request(GetLogsRequest(180, 199, [self.swap_event]))
+                self.server.requests.clear()
+                logs = await cache.smart_send_log_request(GetLogsRequest(90, 209, [self.swap_event]))
+        self.assertEqual([log.block_number for log in logs], list(range(90, 210)))
+        self.assertEqual(self.fetched_ranges(), [(90, 99), (140, 179), (200, 209)])
+        self.assertEqual(logs[15].decoded_data[4], 201818)
+
+    async def test_persists_between_runs(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            async with LogRangeCache(conn, self.path) as cache:
+                first = await cache.smart_send_log_request(GetLogsRequest(0, 299, [self.swap_event]))
+            self.server.requests.clear()
+            async with LogRangeCache(conn, self.path, finalised_block=900) as cache:
+                second = await cache.send_request(GetLogsRequest(0, 299, [self.swap_event]))
+                other_filter = await cache.send_request(GetLogsRequest(0, 9, [self.swap_event],
+                                                                       "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"))
+        self.assertEqual(first, second)
+        self.assertEqual([(l.block_number, l.transaction_hash, l.data) for l in first],
+                         [(l.block_number, l.transaction_hash, l.data) for l in second])
+        self.assertEqual(self.fetched_ranges(), [(0, 9)])
+        self.assertEqual(cache.stats(), {"blocks_served": 300, "blocks_fetched": 10})
+        self.assertEqual(len(other_filter), 10)
+
+    async def test_unfinalised_blocks_not_cached(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            async with LogRangeCache(conn, self.path, finality_depth=64) as cache:
+                await cache.smart_send_log_request(GetLogsRequest(920, 959, [self.swap_event]))
+                self.server.requests.clear()
+                logs = await cache.smart_send_log_request(GetLogsRequest(920, 959, [self.swap_event]))
+        self.assertEqual(len(logs), 40)
+        self.assertEqual(self.fetched_ranges(), [(937, 959)])
+
+
+if __name__ == '__main__':
+    unittest.main()
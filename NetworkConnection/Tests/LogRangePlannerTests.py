@@ -0,0 +1,88 @@
+import unittest
+import Utilities.FunctionCallBuilder as fcb
+from NetworkConnection.BaseRPCRequests import GetLogsRequest
+from NetworkConnection.LogRangePlanner import LogRangePlanner
+from NetworkConnection.RPCConnection import HTTPRPCConnection, BlockRangeError, ExecutionRevertError
+from NetworkConnection.Tests.RPCConnectionTests import FakeRPCServer, make_raw_log
+
+MAX_LOGS = 100
+
+
+def logs_in_block(block_number: int) -> int:
+    """sparse before block 5000, dense afterwards"""
+    if block_number < 5000:
+        return 1 if block_number % 20 == 0 else 0
+    return 3
+
+
+def density_handler(max_logs: int):
+    """eth_getLogs handler which errors like alchemy when a range has more than max_logs logs"""
+    def handler(body):
+        params = body["params"][0]
+        from_block = int(params["fromBlock"], 16)
+        to_block = int(params["toBlock"], 16)
+        logs = [make_raw_log(b, i) for b in range(from_block, to_block + 1) for i in range(logs_in_block(b))]
+        if len(logs) > max_logs:
+            suggested_to = int(logs[max_logs - 1]["blockNumber"], 16)
+            return {"error": {"code": -32005, "message": f"query returned more than 10000 results. Try with this "
+                                                         f"block range [{hex(from_block)}, {hex(suggested_to)}]."}}
+        return logs
+    return handler
+
+
+class LogRangePlannerTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = FakeRPCServer(density_handler(MAX_LOGS), latency=0.005)
+        await self.server.start()
+        self.swap_event = fcb.create_event_abi("Swap", fcb.get_abi("V3LiquidityPool"))
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_logs_complete_and_in_order(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            planner = LogRangePlanner(conn, max_logs=MAX_LOGS, initial_window=500, max_concurrency=3)
+            logs = await planner.smart_send_log_request(GetLogsRequest(0, 7999, [self.swap_event]))
+        expected = [(b, i) for b in range(8000) for i in range(logs_in_block(b))]
+        self.assertEqual([(log.block_number, log.log_index) for log in logs], expected)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertGreater(planner.splits, 0)
+        self.assertEqual(planner.stats()["windows_sent"], len(self.server.requests))
+
+    async def test_density_sizes_windows(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            planner = LogRangePlanner(conn, max_logs=MAX_LOGS, initial_window=100, max_concurrency=1)
+            await planner.smart_send_log_request(GetLogsRequest(5000, 5999, [self.swap_event]))
+            splits = planner.splits
+            self.server.requests.clear()
+            await planner.smart_send_log_request(GetLogsRequest(6000, 7999, [self.swap_event]))
+        # the density is known by now, so windows are sized to half the cap and no further splits are needed
+        self.assertEqual(planner.splits, splits)
+        self.assertEqual(planner.window_size(GetLogsRequest(0, 0, [self.swap_event]).filter_key()), 16)
+        self.assertLessEqual(len(self.server.requests), 2000 // 16 + 1)
+
+    async def test_single_block_overflow_raises(self):
+        server = FakeRPCServer(density_handler(2))
+        await server.start()
+        async with HTTPRPCConnection(server.url) as conn:
+            planner = LogRangePlanner(conn, max_logs=2, initial_window=10)
+            with self.assertRaises(BlockRangeError):
+                await planner.smart_send_log_request(GetLogsRequest(5000, 5009, [self.swap_event]))
+        await server.stop()
+
+    async def test_only_transient_errors_retried(self):
+        server = FakeRPCServer(lambda body: {"error": {"code": 3, "message": "execution reverted"}}, failures=1)
+        await server.start()
+        async with HTTPRPCConnection(server.url) as conn:
+            planner = LogRangePlanner(conn, max_logs=MAX_LOGS, retry_delay=0.01)
+            with self.assertRaises(ExecutionRevertError):
+                await planner.smart_send_log_request(GetLogsRequest(0, 99, [self.swap_event]))
+        await server.stop()
+        # the rate limited attempt is retried, the revert is not
+        self.assertEqual(planner.retries, 1)
+        self.assertEqual(planner.windows_sent, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from eth_abi import encode
+import Utilities.FunctionCallBuilder as fcb
+from NetworkConnection.MempoolPipeline import MempoolPipeline, decode_swap_intents, DEFAULT_ROUTERS
+from NetworkConnection.Tests.WebsocketsRPCConnectionTests import FakeWebsocketServer
+from NetworkConnection.WebsocketsRPCConnection import WebsocketsRPCConnection
+from Web3Types.SimpleTypes import Address, HexBytes
+
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+SENDER = "0x1111111111111111111111111111111111111111"
+V2_ROUTER = str(DEFAULT_ROUTERS[0])
+UNIVERSAL_ROUTER = str(DEFAULT_ROUTERS[1])
+
+
+def make_tx(index, to, data, value=0):
+    return {"hash": "0x" + index.to_bytes(32, "big").hex(), "from": SENDER, "to": to, "value": hex(value),
+            "input": "0x" + data.hex()}
+
+
+def v2_router_tx(index, function_name, args, value=0):
+    function = fcb.get_abi('router').get_function(function_name)
+    return make_tx(index, V2_ROUTER, bytes(function.selector) + encode(function.input_types, args), value)
+
+
+def universal_router_tx(index, command, amounts, deadline=None):
+    swap = encode(["address", "uint256", "uint256", "address[]", "bool"], [SENDER, amounts[0], amounts[1], [WETH, USDC], True])
+    if deadline is None:
+        function = fcb.get_abi('universalRouter').get_function('execute', 2)
+        args = [bytes([0x0b, command]), [b"\x00" * 64, swap]]
+    else:
+        function = fcb.get_abi('universalRouter').get_function('execute', 3)
+        args = [bytes([0x0b, command]), [b"\x00" * 64, swap], deadline]
+    return make_tx(index, UNIVERSAL_ROUTER, bytes(function.selector) + encode(function.input_types, args))
+
+
+def make_corpus(size):
+    corpus = []
+    for i in range(size):
+        kind = i % 4
+        if kind == 0:
+            corpus.append(v2_router_tx(i, "swapExactTokensForTokens", [1000 + i, 900, [WETH, USDC], SENDER, 99]))
+        elif kind == 1:
+            corpus.append(v2_router_tx(i, "swapETHForExactTokens", [500, [WETH, USDC], SENDER, 99], value=10 ** 18))
+        elif kind == 2:
+            corpus.append(universal_router_tx(i, 9, (700, 800), deadline=99))
+        else:
+            # not a router
+            corpus.append(make_tx(i, SENDER, b""))
+    return corpus
+
+
+class DecodeSwapIntentsTests(unittest.TestCase):
+
+    def test_router_swaps(self):
+        # the fourth transaction isn't to a router
+        (exact_in, eth_exact_out, universal_exact_out), failures = decode_swap_intents(make_corpus(4))
+        self.assertEqual(failures, 0)
+        self.assertEqual((exact_in.function_name, exact_in.amount_in, exact_in.amount_out_min, exact_in.deadline),
+                         ("swapExactTokensForTokens", 1000, 900, 99))
+        self.assertTrue(exact_in.exact_input)
+        self.assertEqual(exact_in.path, [Address(WETH), Address(USDC)])
+        self.assertEqual(exact_in.router, Address(V2_ROUTER))
+        self.assertEqual(exact_in.tx_hash, HexBytes("0x" + bytes(32).hex()))
+        self.assertEqual((eth_exact_out.amount_in, eth_exact_out.amount_out_min, eth_exact_out.exact_input),
+                         (10 ** 18, 500, False))
+        self.assertEqual((universal_exact_out.function_name, universal_exact_out.amount_in,
+                          universal_exact_out.amount_out_min, universal_exact_out.deadline),
+                         ("V2_SWAP_EXACT_OUT", 800, 700, 99))
+        self.assertEqual(universal_exact_out.recipient, Address(SENDER))
+
+    def test_malformed_calldata_skipped(self):
+        tx = make_corpus(1)[0]
+        tx["input"] = tx["input"][:20]
+        self.assertEqual(decode_swap_intents([tx]), ([], 1))
+
+    def test_programming_errors_not_hidden(self):
+        tx = make_corpus(1)[0]
+        del tx["hash"]
+        with self.assertRaises(KeyError):
+            decode_swap_intents([tx])
+
+
+class MempoolPipelineTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        asyncio.get_running_loop().set_debug(False)
+        self.corpus = {tx["hash"]: tx for tx in make_corpus(400)}
+        self.server = FakeWebsocketServer(self.handler)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    def handler(self, request):
+        # an eighth of the transactions have already been dropped from the mempool
+        tx = self.corpus.get(request["params"][0])
+        return {"jsonrpc": "2.0", "id": request["id"], "result": tx if int(tx["hash"], 16) % 8 != 4 else None}
+
+    async def publish(self, subscription):
+        for tx_hash in self.corpus:
+            await self.server.notify(subscription.get_subscription_id(), tx_hash)
+
+    async def test_hashes_fetched_in_batches(self):
+        async with WebsocketsRPCConnection(self.server.url) as conn:
+            pipeline = MempoolPipeline(conn, fetch_batch_size=50)
+            await pipeline.start()
+            await self.publish(pipeline.subscription)
+            await asyncio.sleep(0.05)
+            intents = await pipeline.poll()
+        self.assertEqual(len(intents), 250)
+        self.assertEqual(pipeline.stats(), {"hashes_seen": 400, "transactions_fetched": 350,
+                                            "router_transactions": 250, "intents": 250, "decode_failures": 0})
+        batches = [r for r in self.server.requests if type(r) == list]
+        self.assertEqual([len(b) for b in batches], [50] * 8)
+
+    async def test_process_pool_matches_inline(self):
+        with ProcessPoolExecutor(2) as executor:
+            async with WebsocketsRPCConnection(self.server.url) as conn:
+                pipeline = MempoolPipeline(conn, executor=executor, min_executor_batch=1)
+                await pipeline.start()
+                await self.publish(pipeline.subscription)
+                await asyncio.sleep(0.05)
+                intents = await pipeline.poll()
+        transactions = [tx for tx in self.corpus.values() if int(tx["hash"], 16) % 8 != 4]
+        self.assertEqual(intents, decode_swap_intents(transactions)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import unittest
+from aiohttp import web
+import Utilities.FunctionCallBuilder as fcb
+from NetworkConnection.BaseRPCRequests import GetLogsRequest, RPCRequest, RPC_Error
+from NetworkConnection.RPCConnection import HTTPRPCConnection, BlockRangeError, TransportConfig, BatchConfig, \
+    Batch_Error
+
+SWAP_TOPIC = "0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67"
+SWAP_DATA = "0x0000000000000000000000000000000000000000000000000000000077359400ffffffffffffffffffffffffffffffffffffffffffffffffefdf78616e9e6a8c0000000000000000000000000000000000005e2ec01dc1bd773f69f88e02cb360000000000000000000000000000000000000000000000012e2b29926a2e7ded000000000000000000000000000000000000000000000000000000000003145a"
+
+
+def make_raw_log(block_number: int, log_index: int):
+    return {"blockHash": "0x" + block_number.to_bytes(32, "big").hex(),
+            "blockNumber": hex(block_number),
+            "transactionIndex": hex(log_index),
+            "address": "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640",
+            "logIndex": hex(log_index),
+            "data": SWAP_DATA,
+            "removed": False,
+            "topics": [SWAP_TOPIC,
+                       "0x000000000000000000000000def1c0ded9bec7f1a1670819833240f027b25eff",
+                       "0x000000000000000000000000def1c0ded9bec7f1a1670819833240f027b25eff"],
+            "transactionHash": "0x" + (block_number * 1000 + log_index).to_bytes(32, "big").hex()}
+
+
+class FakeRPCServer:
+    """A local json-rpc server. handler takes a single decoded request and returns either the result or an error dict
+    (anything with an 'error' key is returned as the response body). Bodies are written out in small chunks, batch
+    responses are optionally reversed and the first failures posts are answered with a 429."""
+
+    def __init__(self, handler, chunk_size: int = 512, latency: float = 0, reverse_batches: bool = False,
+                 failures: int = 0):
+        self.handler = handler
+        self.chunk_size = chunk_size
+        self.latency = latency
+        self.reverse_batches = reverse_batches
+        self.failures = failures
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request: web.Request):
+        body = await request.json()
+        self.requests.append(body)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.failures > 0:
+                self.failures -= 1
+                return web.json_response({"jsonrpc": "2.0", "id": None,
+                                          "error": {"code": 429, "message": "rate limited"}}, status=429)
+            if type(body) == list:
+                response = [self.respond(b) for b in body]
+                if self.reverse_batches:
+                    response.reverse()
+            else:
+                response = self.respond(body)
+            stream = web.StreamResponse(headers={"Content-Type": "application/json"})
+            await stream.prepare(request)
+            encoded = json.dumps(response).encode()
+            for i in range(0, len(encoded), self.chunk_size):
+                await stream.write(encoded[i:i + self.chunk_size])
+            await stream.write_eof()
+            return stream
+        finally:
+            self.in_flight -= 1
+
+    def respond(self, body):
+        result = self.handler(body)
+        if type(result) == dict and "error" in result:
+            return {"jsonrpc": "2.0", "id": body["id"], "error": result["error"]}
+        return {"jsonrpc": "2.0", "id": body["id"], "result": result}
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def log_range_handler(max_blocks: int, logs_per_block: int):
+    """eth_getLogs handler which errors with a suggested range when more than max_blocks are requested"""
+    def handler(body):
+        params = body["params"][0]
+        from_block = int(params["fromBlock"], 16)
+        to_block = int(params["toBlock"], 16)
+        if to_block - from_block + 1 > max_blocks:
+            return {"error": {"code": -32005, "message": f"query returned more than 10000 results. Try with this "
+                                                         f"block range [{hex(from_block)}, "
+                                                         f"{hex(from_block + max_blocks - 1)}]."}}
+        return [make_raw_log(b, i) for b in range(from_block, to_block + 1) for i in range(logs_per_block)]
+    return handler
+
+
+class HTTPRPCConnectionStreamingTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.swap_event = fcb.create_event_abi("Swap", fcb.get_abi("V3LiquidityPool"))
+
+    async def test_stream_log_request(self):
+        server = FakeRPCServer(log_range_handler(1000, 3))
+        await server.start()
+        async with HTTPRPCConnection(server.url) as conn:
+            request = GetLogsRequest(100, 199, [self.swap_event])
+            logs = [log async for log in conn.stream_log_request(request)]
+            expected = await conn.send_request(request)
+        await server.stop()
+        self.assertEqual(len(logs), 300)
+        self.assertEqual(logs, expected)
+        self.assertEqual(logs[0].decoded_data[4], 201818)
+
+    async def test_requests_sent_while_streaming(self):
+        server = FakeRPCServer(log_range_handler(1000, 1))
+        await server.start()
+        async with HTTPRPCConnection(server.url, transport_config=TransportConfig(max_in_flight=1)) as conn:
+            blocks = []
+            async for log in conn.stream_log_request(GetLogsRequest(0, 4, [self.swap_event])):
+                # the stream doesn't hold the only in flight slot
+                block_logs = await asyncio.wait_for(conn.send_request(GetLogsRequest(log.block_number,
+                                                                                     log.block_number,
+                                                                                     [self.swap_event])), 1)
+                blocks.append(block_logs[0].block_number)
+        await server.stop()
+        self.assertEqual(blocks, list(range(5)))
+
+    async def test_stream_raises_block_range_error(self):
+        server = FakeRPCServer(log_range_handler(10, 1))
+        await server.start()
+        async with HTTPRPCConnection(server.url) as conn:
+            with self.assertRaises(BlockRangeError):
+                _ = [log async for log in conn.stream_log_request(GetLogsRequest(0, 99, [self.swap_event]))]
+        await server.stop()
+
+    async def test_smart_stream_splits_in_order(self):
+        server = FakeRPCServer(log_range_handler(10, 2))
+        await server.start()
+        async with HTTPRPCConnection(server.url) as conn:
+            logs = [log async for log in conn.smart_stream_log_request(GetLogsRequest(0, 99, [self.swap_event]))]
+        await server.stop()
+        self.assertEqual([(log.block_number, log.log_index) for log in logs],
+                         [(b, i) for b in range(100) for i in range(2)])
+
+
+class HTTPRPCConnectionTransportTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.swap_event = fcb.create_event_abi("Swap", fcb.get_abi("V3LiquidityPool"))
+
+    async def test_connector_uses_config(self):
+        config = TransportConfig(limit=10, limit_per_host=5, keepalive_timeout=15, max_in_flight=3)
+        async with HTTPRPCConnection("http://127.0.0.1:1/", transport_config=config) as conn:
+            self.assertEqual(conn.http_connection.connector.limit, 10)
+            self.assertEqual(conn.http_connection.connector.limit_per_host, 5)
+        with self.assertRaises(ValueError):
+            TransportConfig(max_in_flight=0)
+
+    async def test_log_splitting_is_bounded(self):
+        server = FakeRPCServer(log_range_handler(10, 1), latency=0.01)
+        await server.start()
+        async with HTTPRPCConnection(server.url, transport_config=TransportConfig(max_in_flight=4)) as conn:
+            logs = await conn.smart_send_log_request(GetLogsRequest(0, 400, [self.swap_event]))
+        await server.stop()
+        self.assertEqual([log.block_number for log in logs], list(range(401)))
+        self.assertGreater(len(server.requests), 40)
+        self.assertLessEqual(server.max_in_flight, 4)
+
+    async def test_concurrent_requests_are_bounded(self):
+        server = FakeRPCServer(log_range_handler(10, 1), latency=0.01)
+        await server.start()
+        async with HTTPRPCConnection(server.url, transport_config=TransportConfig(max_in_flight=2)) as conn:
+            results = await asyncio.gather(*[conn.send_request(GetLogsRequest(i, i, [self.swap_event]))
+                                             for i in range(20)])
+        await server.stop()
+        self.assertEqual([r[0].block_number for r in results], list(range(20)))
+        self.assertEqual(server.max_in_flight, 2)
+
+
+def echo_handler(body):
+    """echoes the first param back, or errors if it is negative"""
+    if body["params"][0] < 0:
+        return {"error": {"code": 3, "message": "execution reverted"}}
+    return body["params"][0]
+
+
+class HTTPRPCConnectionBatchTests(unittest.IsolatedAsyncioTestCase):
+
+    def test_split_by_size_and_bytes(self):
+        config = BatchConfig(max_batch_size=3, max_batch_bytes=25)
+        self.assertEqual(config.split([b"1234"] * 7), [(0, 3), (3, 6), (6, 7)])
+        self.assertEqual(config.split([b"1234567890"] * 5), [(0, 2), (2, 4), (4, 5)])
+        self.assertEqual(config.split([b"x" * 100, b"1", b"x" * 100]), [(0, 1), (1, 2), (2, 3)])
+        self.assertEqual(config.split([]), [])
+
+    def test_batch_size_limited_by_request_ids(self):
+        BatchConfig(max_batch_size=HTTPRPCConnection.MAX_REQUESTS)
+        with self.assertRaises(ValueError):
+            BatchConfig(max_batch_size=HTTPRPCConnection.MAX_REQUESTS + 1)
+
+    async def test_chunks_reassembled_in_order(self):
+        server = FakeRPCServer(echo_handler, reverse_batches=True)
+        await server.start()
+        config = BatchConfig(max_batch_size=7, max_concurrent_chunks=3)
+        async with HTTPRPCConnection(server.url, batch_config=config) as conn:
+            results = await conn.send_batch_request([RPCRequest("eth_echo", [i]) for i in range(100)])
+        await server.stop()
+        self.assertEqual(results, list(range(100)))
+        self.assertEqual(len(server.requests), 15)
+        self.assertTrue(all(len(batch) <= 7 for batch in server.requests))
+        self.assertLessEqual(server.max_in_flight, 3)
+
+    async def test_failed_chunks_are_retried(self):
+        server = FakeRPCServer(echo_handler, failures=2)
+        await server.start()
+        config = BatchConfig(max_batch_size=10, retries=2, retry_delay=0.01)
+        async with HTTPRPCConnection(server.url, batch_config=config) as conn:
+            results = await conn.send_batch_request([RPCRequest("eth_echo", [i]) for i in range(30)])
+        await server.stop()
+        self.assertEqual(results, list(range(30)))
+        self.assertEqual(len(server.requests), 5)
+
+    async def test_retries_exhausted(self):
+        server = FakeRPCServer(echo_handler, failures=3)
+        await server.start()
+        async with HTTPRPCConnection(server.url, batch_config=BatchConfig(retries=2, retry_delay=0.01)) as conn:
+            with self.assertRaises(Batch_Error):
+                await conn.send_batch_request([RPCRequest("eth_echo", [i]) for i in range(5)])
+        await server.stop()
+
+    async def test_request_errors_are_raised(self):
+        server = FakeRPCServer(echo_handler)
+        await server.start()
+        async with HTTPRPCConnection(server.url) as conn:
+            with self.assertRaises(RPC_Error):
+                await conn.send_batch_request([RPCRequest("eth_echo", [i]) for i in (1, -1, 2)])
+        await server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import time
+import unittest
+import Utilities.FunctionCallBuilder as fcb
+from NetworkConnection.BaseRPCRequests import RPCRequest, CallRequest, FilterRequest, GetLogsRequest
+from NetworkConnection.RPCConnection import HTTPRPCConnection, ExecutionRevertError
+from NetworkConnection.RPCRouter import RPCRouter
+from NetworkConnection.Tests.RPCConnectionTests import FakeRPCServer, echo_handler
+from Web3Types.SimpleTypes import Address
+from Web3Types.Transaction import SmartContractTransaction
+
+POOL_ADDRESS = Address("0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640")
+
+
+def chain_handler(body):
+    if body["method"] == "eth_call":
+        return "0x" + (1 << 96).to_bytes(32, "big").hex() + "00" * 32 * 6
+    if body["method"] == "eth_newFilter":
+        return "0xf1"
+    if body["method"] == "eth_getFilterChanges":
+        return [body["params"][0]]
+    if body["method"] == "eth_getLogs":
+        return [{"address": str(POOL_ADDRESS), "topics": [], "data": "0x", "blockHash": "0x00", "blockNumber": hex(i),
+                 "transactionIndex": "0x0", "logIndex": "0x0", "removed": False, "transactionHash": "0x00"}
+                for i in range(3)]
+    return echo_handler(body)
+
+
+def slot0_request(block_number=None):
+    transaction = SmartContractTransaction(fcb.get_abi_function("slot0", "V3LiquidityPool"), (), POOL_ADDRESS, 0)
+    return CallRequest(transaction, block_number)
+
+
+class RPCRouterTests(unittest.IsolatedAsyncioTestCase):
+
+    servers = []
+
+    async def start_servers(self, *server_kwargs):
+        self.servers = [FakeRPCServer(chain_handler, **kwargs) for kwargs in server_kwargs]
+        for server in self.servers:
+            await server.start()
+        return RPCRouter([HTTPRPCConnection(server.url) for server in self.servers], seed=1, hedge_delay=0.02)
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            await server.stop()
+
+    def test_should_hedge(self):
+        router = RPCRouter([HTTPRPCConnection("http://127.0.0.1:1/")])
+        self.assertTrue(router.should_hedge(slot0_request()))
+        self.assertFalse(router.should_hedge(slot0_request(18000000)))
+        self.assertFalse(router.should_hedge(RPCRequest("eth_echo", [1])))
+
+    def test_passthrough_to_first_connection(self):
+        router = RPCRouter([HTTPRPCConnection("http://127.0.0.1:1/"), HTTPRPCConnection("http://127.0.0.1:2/")],
+                           seed=1)
+        state = router.random.getstate()
+        # no running loop is needed and endpoint selection isn't disturbed
+        self.assertEqual(router.http_url, "http://127.0.0.1:1/")
+        self.assertFalse(hasattr(router, "not_an_attribute"))
+        self.assertEqual(router.random.getstate(), state)
+
+    async def test_fails_over_and_marks_endpoint_down(self):
+        router = await self.start_servers({"failures": 1000}, {})
+        async with router:
+            results = [await router.send_request(RPCRequest("eth_echo", [i])) for i in range(20)]
+        self.assertEqual(results, list(range(20)))
+        self.assertEqual(len(self.servers[0].requests), 3)
+        self.assertEqual(router.failovers, 3)
+        self.assertEqual(router.stats()["endpoints"][self.servers[0].url]["error_rate"], 1)
+        self.assertGreater(router.endpoint_stats[0].down_until, 0)
+
+    async def test_prefers_lower_latency(self):
+        router = await self.start_servers({"latency": 0.05}, {})
+        async with router:
+            for i in range(30):
+                await router.send_request(RPCRequest("eth_echo", [i]))
+        self.assertGreaterEqual(len(self.servers[1].requests), 27)
+        self.assertLess(router.endpoint_stats[1].p50, router.endpoint_stats[0].p50)
+
+    async def test_hedges_slow_primary(self):
+        router = await self.start_servers({"latency": 0.5}, {})
+        # make the slow server look fastest so it is picked first
+        router.endpoint_stats[0].record_success(0.001)
+        router.endpoint_stats[1].record_success(0.01)
+        async with router:
+            start = time.perf_counter()
+            sqrt_price = (await router.send_request(slot0_request()))[0]
+            elapsed = time.perf_counter() - start
+        self.assertEqual(sqrt_price, 1 << 96)
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual((router.hedged, router.hedges_won), (1, 1))
+        self.assertEqual(len(self.servers[1].requests), 1)
+
+    async def test_no_failover_for_reverts(self):
+        router = await self.start_servers({}, {})
+        async with router:
+            with self.assertRaises(ExecutionRevertError):
+                await router.send_request(RPCRequest("eth_echo", [-1]))
+            self.assertEqual(await router.send_batch_request([RPCRequest("eth_echo", [i]) for i in range(3)]),
+                             [0, 1, 2])
+        self.assertEqual(sum(len(s.requests) for s in self.servers), 2)
+        self.assertEqual(router.failovers, 0)
+
+    async def test_filters_and_log_streams(self):
+        router = await self.start_servers({}, {})
+        async with router:
+            log_filter = FilterRequest("eth_newFilter", [{"address": str(POOL_ADDRESS)}])
+            await router.add_filter(log_filter)
+            self.assertEqual(log_filter.filter_id, "0xf1")
+            self.assertEqual(await router.poll_filter(log_filter), ["0xf1"])
+            logs = [log async for log in router.smart_stream_log_request(GetLogsRequest(0, 99, None))]
+            self.assertEqual(len(logs), 3)
+        # a filter is polled on the endpoint that installed it
+        filter_server = next(s for s in self.servers if any(r["method"] == "eth_newFilter" for r in s.requests))
+        self.assertIn("eth_getFilterChanges", [r["method"] for r in filter_server.requests])
+
+
+if __name__ == '__main__':
+    unittest.main()
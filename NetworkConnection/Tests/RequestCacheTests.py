@@ -0,0 +1,86 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import Utilities.FunctionCallBuilder as fcb
+from NetworkConnection.BaseRPCRequests import RPCRequest, CallRequest, RPC_Error
+from NetworkConnection.RPCConnection import HTTPRPCConnection
+from NetworkConnection.RequestCache import RequestCache
+from NetworkConnection.RequestCoalescer import RequestCoalescer
+from NetworkConnection.Tests.RPCConnectionTests import FakeRPCServer
+from Web3Types.SimpleTypes import Address
+from Web3Types.Transaction import SmartContractTransaction
+
+POOL_ADDRESS = Address("0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640")
+
+
+def fee_handler(body):
+    """answers eth_call with the block number as a uint256, reverting for block 0"""
+    block = int(body["params"][1], 16) if body["params"][1] != "latest" else 1
+    if block == 0:
+        return {"error": {"code": 3, "message": "execution reverted"}}
+    return "0x" + block.to_bytes(32, "big").hex()
+
+
+def fee_request(block_number):
+    transaction = SmartContractTransaction(fcb.get_abi_function("fee", "V3LiquidityPool"), (), POOL_ADDRESS, 0)
+    return CallRequest(transaction, block_number)
+
+
+class RequestCacheTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = FakeRPCServer(fee_handler, latency=0.01)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    def test_cache_keys(self):
+        self.assertIsNone(fee_request(None).cache_key())
+        self.assertIsNone(RPCRequest("eth_blockNumber", []).cache_key())
+        self.assertEqual(fee_request(10).cache_key(), fee_request(10).cache_key())
+        self.assertNotEqual(fee_request(10).cache_key(), fee_request(11).cache_key())
+
+    async def test_in_flight_requests_are_shared(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            async with RequestCache(conn) as cache:
+                results = await asyncio.gather(*[cache.send_request(fee_request(5)) for _ in range(20)])
+                self.assertEqual(await cache.send_request(fee_request(5)), (5,))
+        self.assertEqual(results, [(5,)] * 20)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "shared": 19, "entries": 1})
+
+    async def test_batches_only_fetch_misses(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            async with RequestCache(conn) as cache:
+                self.assertEqual(await cache.send_batch_request([fee_request(b) for b in (1, 2)]), [(1,), (2,)])
+                results = await cache.send_batch_request([fee_request(b) for b in (1, 2, 3, 3, None)])
+        self.assertEqual(results, [(1,), (2,), (3,), (3,), (1,)])
+        self.assertEqual([len(batch) for batch in self.server.requests], [2, 2])
+
+    async def test_lru_eviction_and_errors_not_cached(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            async with RequestCache(conn, max_entries=2) as cache:
+                for block in (1, 2, 3):
+                    await cache.send_request(fee_request(block))
+                self.assertEqual(list(cache.results), [fee_request(2).cache_key(), fee_request(3).cache_key()])
+                for _ in range(2):
+                    with self.assertRaises(RPC_Error):
+                        await cache.send_request(fee_request(0))
+        self.assertEqual(len(self.server.requests), 5)
+
+    async def test_persisted_to_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "requests.sqlite")
+            async with HTTPRPCConnection(self.server.url) as conn:
+                async with RequestCache(conn, path=path) as cache:
+                    await cache.send_batch_request([fee_request(b) for b in range(1, 50)])
+                async with RequestCache(RequestCoalescer(conn), path=path) as cache:
+                    results = await asyncio.gather(*[cache.send_request(fee_request(b)) for b in range(1, 50)])
+        self.assertEqual(results, [(b,) for b in range(1, 50)])
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
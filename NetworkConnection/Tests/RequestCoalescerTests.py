@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+from NetworkConnection.BaseRPCRequests import RPCRequest, RPC_Error
+from NetworkConnection.RPCConnection import HTTPRPCConnection
+from NetworkConnection.RequestCoalescer import RequestCoalescer
+from NetworkConnection.WebsocketsRPCConnection import WebsocketsRPCConnection
+from NetworkConnection.Tests.RPCConnectionTests import FakeRPCServer, echo_handler
+
+
+class RequestCoalescerTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = FakeRPCServer(echo_handler, reverse_batches=True)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_concurrent_requests_are_batched(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            async with RequestCoalescer(conn, window=0.01, max_batch=1000) as coalescer:
+                results = await asyncio.gather(*[coalescer.send_request(RPCRequest("eth_echo", [i]))
+                                                 for i in range(200)])
+        self.assertEqual(results, list(range(200)))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(coalescer.batches_sent, 1)
+
+    async def test_max_batch_flushes_early(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            coalescer = RequestCoalescer(conn, window=10, max_batch=25)
+            results = await asyncio.wait_for(asyncio.gather(*[coalescer.send_request(RPCRequest("eth_echo", [i]))
+                                                              for i in range(100)]), 5)
+        self.assertEqual(results, list(range(100)))
+        self.assertEqual([len(batch) for batch in self.server.requests], [25] * 4)
+
+    async def test_errors_only_affect_their_caller(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            coalescer = RequestCoalescer(conn)
+            results = await asyncio.gather(*[coalescer.send_request(RPCRequest("eth_echo", [i]))
+                                             for i in (1, -1, 2)], return_exceptions=True)
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], RPC_Error)
+        self.assertEqual(results[2], 2)
+
+    async def test_single_request_and_passthrough(self):
+        async with HTTPRPCConnection(self.server.url) as conn:
+            coalescer = RequestCoalescer(conn)
+            self.assertEqual(await coalescer.send_request(RPCRequest("eth_echo", [5])), 5)
+            self.assertEqual(await coalescer.send_batch_request([RPCRequest("eth_echo", [6])]), [6])
+        self.assertEqual(type(self.server.requests[0]), dict)
+
+    def test_only_http_connections(self):
+        with self.assertRaises(TypeError):
+            RequestCoalescer(WebsocketsRPCConnection("ws://127.0.0.1:1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import time
+import unittest
+from NetworkConnection.BaseRPCRequests import RPCRequest
+from NetworkConnection.RPCConnection import HTTPRPCConnection, RateLimitError, ExecutionRevertError, BatchConfig
+from NetworkConnection.RequestScheduler import RequestScheduler, RetryBudget, RetryBudgetExceeded, TokenBucket, \
+    ALCHEMY_COMPUTE_UNITS
+from NetworkConnection.Tests.RPCConnectionTests import FakeRPCServer, echo_handler
+
+
+class TokenBucketTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_paces_after_burst(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+        start = time.perf_counter()
+        for _ in range(15):
+            await bucket.acquire(1)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+        # sleeps which overrun refill the bucket, so under load slightly less than 0.1s is waited
+        self.assertLessEqual(bucket.waited, 0.1 + 1e-9)
+        self.assertGreater(bucket.waited, 0.05)
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0.5, min_tokens=1, max_tokens=2)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.tokens, 2)
+
+
+class RequestSchedulerTests(unittest.IsolatedAsyncioTestCase):
+
+    async def start_server(self, **kwargs):
+        self.server = FakeRPCServer(echo_handler, **kwargs)
+        await self.server.start()
+        self.connection = HTTPRPCConnection(self.server.url, batch_config=BatchConfig(retries=0))
+        self.connection.enter()
+
+    async def asyncTearDown(self):
+        await self.connection.clean_up()
+        await self.server.stop()
+
+    async def test_rate_limited_requests_are_retried(self):
+        await self.start_server(failures=3)
+        scheduler = RequestScheduler(self.connection, rate=1000, base_delay=0.01, seed=1)
+        self.assertEqual(await scheduler.send_request(RPCRequest("eth_echo", [7])), 7)
+        self.assertEqual(await scheduler.send_batch_request([RPCRequest("eth_echo", [i]) for i in range(3)]),
+                         [0, 1, 2])
+        self.assertEqual(len(self.server.requests), 5)
+        stats = scheduler.stats()
+        self.assertEqual((stats["requests"], stats["retries"], stats["rate_limited"]), (2, 3, 3))
+
+    async def test_compute_units_pace_requests(self):
+        await self.start_server()
+        scheduler = RequestScheduler(self.connection, rate=2600, capacity=26, compute_units=ALCHEMY_COMPUTE_UNITS)
+        self.assertEqual(scheduler.cost([RPCRequest("eth_call", []), RPCRequest("eth_getLogs", []),
+                                         RPCRequest("eth_unknown", [])]), 26 + 75 + 1)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[scheduler.send_request(RPCRequest("eth_call", [i])) for i in range(20)])
+        self.assertEqual(results, list(range(20)))
+        # the first call uses the burst capacity, the other 19 are paced at 100 calls a second
+        self.assertGreaterEqual(time.perf_counter() - start, 0.18)
+        self.assertGreater(scheduler.stats()["throttled_seconds"], 0)
+
+    async def test_reverts_are_not_retried(self):
+        await self.start_server()
+        scheduler = RequestScheduler(self.connection)
+        with self.assertRaises(ExecutionRevertError):
+            await scheduler.send_request(RPCRequest("eth_echo", [-1]))
+        self.assertEqual(scheduler.retries, 0)
+        self.assertEqual(len(self.server.requests), 1)
+
+    async def test_max_retries(self):
+        await self.start_server(failures=10)
+        scheduler = RequestScheduler(self.connection, rate=1000, max_retries=2, base_delay=0.001)
+        with self.assertRaises(RateLimitError):
+            await scheduler.send_request(RPCRequest("eth_echo", [1]))
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(scheduler.stats()["failures"], 1)
+
+    async def test_retry_budget_exhausted(self):
+        await self.start_server(failures=100)
+        scheduler = RequestScheduler(self.connection, rate=1000, base_delay=0.001,
+                                     retry_budget=RetryBudget(ratio=0, min_tokens=4))
+        results = await asyncio.gather(*[scheduler.send_request(RPCRequest("eth_echo", [i])) for i in range(3)],
+                                       return_exceptions=True)
+        self.assertEqual(sum(isinstance(r, RetryBudgetExceeded) for r in results), 3)
+        self.assertEqual(scheduler.stats()["retries"], 4)
+        self.assertEqual(len(self.server.requests), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
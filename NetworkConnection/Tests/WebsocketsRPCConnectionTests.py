@@ -0,0 +1,304 @@
+import asyncio
+import json
+import os
+import random
+import time
+import unittest
+import websockets
+from NetworkConnection.BaseRPCRequests import RPCRequest, RPC_Error, SubscriptionRequest
+from NetworkConnection.WebsocketsRPCConnection import WebsocketsRPCConnection, SubscriptionQueue, DROP_OLDEST, \
+    DROP_NEWEST, COALESCE_LATEST
+
+
+def ws_echo_handler(request):
+    """echoes params[0], a negative value is a revert and "eth_hang" is never answered"""
+    if request["method"] == "eth_hang":
+        return None
+    value = request["params"][0]
+    if isinstance(value, int) and value < 0:
+        return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": 3, "message": "execution reverted"}}
+    return {"jsonrpc": "2.0", "id": request["id"], "result": value}
+
+
+class FakeWebsocketServer:
+    """A local json-rpc websocket server which answers each request after a random delay of up to max_latency, so
+    responses come back out of order. eth_subscribe is handled by the server and notify pushes a result to a subscription.
+    delays holds a fixed delay for any method which should be answered slowly"""
+
+    def __init__(self, handler, max_latency=0.0, seed=0):
+        self.handler = handler
+        self.max_latency = max_latency
+        self.random = random.Random(seed)
+        self.server = None
+        self.connections = set()
+        self.subscriptions = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.tasks = set()
+        self.block_number = 0
+        self.delays = {}
+
+    @property
+    def url(self):
+        port = next(iter(self.server.sockets)).getsockname()[1]
+        return f"ws://127.0.0.1:{port}"
+
+    async def start(self):
+        self.server = await websockets.serve(self.serve, "127.0.0.1", 0)
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def drop(self):
+        """closes every client connection while still accepting new ones"""
+        for connection in list(self.connections):
+            await connection.close()
+
+    async def notify(self, subscription_id, result):
+        message = json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+                              "params": {"subscription": subscription_id, "result": result}})
+        await self.subscriptions[subscription_id].send(message)
+
+    async def respond(self, connection, request, response):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.max_latency:
+                await asyncio.sleep(self.random.uniform(0, self.max_latency))
+            if type(request) == dict and request["method"] in self.delays:
+                await asyncio.sleep(self.delays[request["method"]])
+            if response is not None:
+                await connection.send(json.dumps(response))
+        finally:
+            self.in_flight -= 1
+
+    def answer(self, connection, request):
+        if request["method"] == "eth_subscribe":
+            subscription_id = hex(len(self.subscriptions) + 1)
+            self.subscriptions[subscription_id] = connection
+            return {"jsonrpc": "2.0", "id": request["id"], "result": subscription_id}
+        if request["method"] == "eth_blockNumber":
+            return {"jsonrpc": "2.0", "id": request["id"], "result": hex(self.block_number)}
+        return self.handler(request)
+
+    async def serve(self, connection):
+        self.connections.add(connection)
+        try:
+            async for message in connection:
+                request = json.loads(message)
+                self.requests.append(request)
+                if type(request) == list:
+                    response = [self.answer(connection, r) for r in reversed(request)]
+                    if any(r is None for r in response):
+                        response = None
+                else:
+                    response = self.answer(connection, request)
+                if response is None:
+                    # hang until the connection is closed, still counting towards in_flight
+                    self.in_flight += 1
+                    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                    continue
+                task = asyncio.create_task(self.respond(connection, request, response))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.connections.discard(connection)
+
+
+class SubscriptionQueueTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_policies(self):
+        expected = {DROP_OLDEST: [7, 8, 9], DROP_NEWEST: [0, 1, 2], COALESCE_LATEST: [9]}
+        for policy, kept in expected.items():
+            queue = SubscriptionQueue(3, policy)
+            for i in range(10):
+                queue.put_nowait(i)
+            self.assertEqual(await queue.get_all(), kept)
+            self.assertEqual(queue.stats(), {"policy": policy, "queued": 0, "received": 10, "dropped": 10 - len(kept)})
+
+    async def test_get_waits_for_put(self):
+        queue = SubscriptionQueue(3)
+        getting = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        self.assertFalse(getting.done())
+        queue.put_nowait(1)
+        self.assertEqual(await asyncio.wait_for(getting, 1), 1)
+        with self.assertRaises(ValueError):
+            SubscriptionQueue(3, "block")
+
+
+class WebsocketsRPCConnectionTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # the test case runs the loop in debug mode, which is around 20x slower for the load test
+        asyncio.get_running_loop().set_debug(False)
+        self.server = FakeWebsocketServer(ws_echo_handler, max_latency=0.005)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_out_of_order_responses(self):
+        async with WebsocketsRPCConnection(self.server.url) as conn:
+            results = await asyncio.gather(*[conn.send_request(RPCRequest("eth_echo", [i])) for i in range(200)])
+        self.assertEqual(results, list(range(200)))
+        self.assertEqual(len(conn.pending_requests), 0)
+
+    async def test_backpressure(self):
+        """never more than max_pending_requests outstanding"""
+        async with WebsocketsRPCConnection(self.server.url, max_pending_requests=16) as conn:
+            results = await asyncio.gather(*[conn.send_request(RPCRequest("eth_echo", [i])) for i in range(500)])
+        self.assertEqual(results, list(range(500)))
+        self.assertLessEqual(self.server.max_in_flight, 16)
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+    async def test_load_with_backpressure(self):
+        """thousands of concurrent calls over one socket, never more than max_pending_requests outstanding"""
+        async with WebsocketsRPCConnection(self.server.url, max_pending_requests=256) as conn:
+            start = time.perf_counter()
+            results = await asyncio.gather(*[conn.send_request(RPCRequest("eth_echo", [i])) for i in range(5000)])
+            elapsed = time.perf_counter() - start
+        print(f"5000 websocket requests in {elapsed:.2f}s ({5000 / elapsed:.0f}/s)")
+        self.assertEqual(results, list(range(5000)))
+        self.assertLessEqual(self.server.max_in_flight, 256)
+        self.assertEqual(len({r["id"] for r in self.server.requests}), 5000)
+
+    async def test_ids_skip_pending_requests(self):
+        async with WebsocketsRPCConnection(self.server.url, max_pending_requests=2, request_timeout=30) as conn:
+            hanging = asyncio.ensure_future(conn.send_request(RPCRequest("eth_hang", [0])))
+            await asyncio.sleep(0.05)
+            # ids wrap at 200, so the hanging request's id comes round again many times
+            results = await asyncio.gather(*[conn.send_request(RPCRequest("eth_echo", [i])) for i in range(1000)])
+            self.assertEqual(results, list(range(1000)))
+            self.assertFalse(hanging.done())
+            hanging.cancel()
+
+    async def test_ids_given_after_waiting_for_a_slot(self):
+        """far more callers than ids wait for the two slots, none of them can take the slow request's id"""
+        self.server.delays["eth_slow"] = 0.5
+        async with WebsocketsRPCConnection(self.server.url, max_pending_requests=2, request_timeout=2) as conn:
+            requests = [RPCRequest("eth_slow" if i == 2 else "eth_echo", [i]) for i in range(400)]
+            results = await asyncio.gather(*[conn.send_request(r) for r in requests])
+        self.assertEqual(results, list(range(400)))
+
+    async def test_batch_larger_than_id_space(self):
+        async with WebsocketsRPCConnection(self.server.url, max_pending_requests=1) as conn:
+            with self.assertRaises(ValueError):
+                await conn.send_batch_request([RPCRequest("eth_echo", [i]) for i in range(102)])
+            self.assertEqual(await conn.send_batch_request([RPCRequest("eth_echo", [i]) for i in range(101)]),
+                             list(range(101)))
+
+    async def test_timeout_frees_slot(self):
+        async with WebsocketsRPCConnection(self.server.url, max_pending_requests=1, request_timeout=0.05) as conn:
+            with self.assertRaises(asyncio.TimeoutError):
+                await conn.send_request(RPCRequest("eth_hang", [0]))
+            self.assertEqual(conn.pending_requests, {})
+            self.assertEqual(await conn.send_request(RPCRequest("eth_echo", [7])), 7)
+
+    async def test_batches_and_errors(self):
+        async with WebsocketsRPCConnection(self.server.url) as conn:
+            results = await asyncio.gather(conn.send_batch_request([RPCRequest("eth_echo", [i]) for i in range(10)]),
+                                           conn.send_request(RPCRequest("eth_echo", [-1])), return_exceptions=True)
+        self.assertEqual(results[0], list(range(10)))
+        self.assertIsInstance(results[1], RPC_Error)
+
+    async def test_closed_socket_fails_pending(self):
+        async with WebsocketsRPCConnection(self.server.url, request_timeout=5, reconnect=False) as conn:
+            hanging = asyncio.ensure_future(conn.send_request(RPCRequest("eth_hang", [0])))
+            await asyncio.sleep(0.05)
+            await self.server.drop()
+            with self.assertRaises(websockets.ConnectionClosed):
+                await asyncio.wait_for(hanging, 1)
+            with self.assertRaises(ConnectionError):
+                await conn.send_request(RPCRequest("eth_echo", [1]))
+
+    async def wait_for_reconnection(self, conn, count=1):
+        while conn.reconnections < count:
+            await asyncio.sleep(0.01)
+
+    async def test_reconnect_resubscribes_and_reports_gap(self):
+        gaps = []
+
+        async def on_reconnect(gap):
+            gaps.append(gap)
+
+        async with WebsocketsRPCConnection(self.server.url, reconnect_delay=0.01, on_reconnect=on_reconnect) as conn:
+            heads = SubscriptionRequest(["newHeads"])
+            await conn.subscribe_to_events(heads)
+            old_id = heads.get_subscription_id()
+            await self.server.notify(old_id, {"number": "0x10"})
+            self.assertEqual(await asyncio.wait_for(conn.poll_subscription(heads), 1), {"number": "0x10"})
+            self.server.block_number = 0x14
+            await self.server.drop()
+            await asyncio.wait_for(self.wait_for_reconnection(conn), 2)
+            await asyncio.sleep(0)
+            self.assertNotEqual(heads.get_subscription_id(), old_id)
+            self.assertEqual(conn.block_gaps, [(0x11, 0x14)])
+            self.assertEqual(gaps, [(0x11, 0x14)])
+            # the new subscription feeds the same queue
+            polling = asyncio.ensure_future(conn.poll_subscription(heads))
+            await self.server.notify(heads.get_subscription_id(), {"number": "0x15"})
+            self.assertEqual(await asyncio.wait_for(polling, 1), {"number": "0x15"})
+            self.assertEqual(conn.last_head_block, 0x15)
+
+    async def test_requests_during_reconnection(self):
+        async with WebsocketsRPCConnection(self.server.url, reconnect_delay=0.05) as conn:
+            hanging = asyncio.ensure_future(conn.send_request(RPCRequest("eth_hang", [0])))
+            await asyncio.sleep(0.02)
+            await self.server.drop()
+            with self.assertRaises(websockets.ConnectionClosed):
+                await asyncio.wait_for(hanging, 1)
+            # waits for the new socket rather than failing
+            self.assertEqual(await asyncio.wait_for(conn.send_request(RPCRequest("eth_echo", [3])), 2), 3)
+            self.assertEqual(conn.reconnections, 1)
+            self.assertEqual(conn.block_gaps, [])
+
+    async def test_gives_up_after_max_attempts(self):
+        async with WebsocketsRPCConnection(self.server.url, reconnect_delay=0.01, max_reconnect_attempts=2) as conn:
+            await self.server.stop()
+            await self.server.drop()
+            with self.assertRaises(OSError):
+                await asyncio.wait_for(conn.running_receive_loop, 2)
+            with self.assertRaises(ConnectionError):
+                await conn.send_request(RPCRequest("eth_echo", [1]))
+        await self.server.start()
+
+    async def test_subscription(self):
+        async with WebsocketsRPCConnection(self.server.url) as conn:
+            subscription = SubscriptionRequest(["newHeads"])
+            await conn.subscribe_to_events(subscription)
+            await self.server.notify(subscription.get_subscription_id(), {"number": "0x1"})
+            self.assertEqual(await asyncio.wait_for(conn.poll_subscription(subscription), 1), {"number": "0x1"})
+            # heads aren't coalesced unless asked for
+            for i in range(3):
+                await self.server.notify(subscription.get_subscription_id(), {"number": hex(i)})
+            for i in range(3):
+                self.assertEqual(await asyncio.wait_for(conn.poll_subscription(subscription), 1), {"number": hex(i)})
+
+    async def test_flooded_subscription_does_not_stall_requests(self):
+        async with WebsocketsRPCConnection(self.server.url) as conn:
+            pending = SubscriptionRequest(["newPendingTransactions"])
+            heads = SubscriptionRequest(["newHeads"])
+            await conn.subscribe_to_events(pending, maxsize=10)
+            await conn.subscribe_to_events(heads, COALESCE_LATEST)
+            for i in range(1000):
+                await self.server.notify(pending.get_subscription_id(), hex(i))
+            for i in range(5):
+                await self.server.notify(heads.get_subscription_id(), {"number": hex(i)})
+            # nobody is reading the subscriptions, requests are still answered
+            self.assertEqual(await asyncio.wait_for(conn.send_request(RPCRequest("eth_echo", [1])), 1), 1)
+            self.assertEqual(await conn.poll_subscription_as_list(pending), [hex(i) for i in range(990, 1000)])
+            self.assertEqual(await conn.poll_subscription_as_list(heads), [{"number": "0x4"}])
+            stats = conn.subscription_stats()
+            self.assertEqual(stats[pending.get_subscription_id()]["dropped"], 990)
+            self.assertEqual(stats[heads.get_subscription_id()]["dropped"], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
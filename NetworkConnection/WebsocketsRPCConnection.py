@@ -1,23 +1,118 @@
 import asyncio
-import json
+import copy
+from collections import deque
+from typing import Dict, Set, Tuple, Callable, Awaitable
 import websockets as ws
 from NetworkConnection.BaseRPCRequests import *
-from NetworkConnection.RPCConnection import Batch_Error, ExecutionRevertError, BlockRangeError
+from NetworkConnection.RPCConnection import Batch_Error, ExecutionRevertError, BlockRangeError, RateLimitError
+from Utilities.JsonCodec import JsonCodec, get_codec
+
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+COALESCE_LATEST = "coalesce_latest"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE_LATEST)
+
+
+class SubscriptionQueue:
+    """A bounded queue of subscription messages which never blocks the writer. When it is full a new message either
+    replaces the oldest (drop_oldest) or is discarded (drop_newest), with coalesce_latest only the latest message is
+    ever kept (e.g. for newHeads where only the current head matters). Dropped messages are counted."""
+
+    __slots__ = ("maxsize", "policy", "buffer", "not_empty", "received", "dropped")
+
+    def __init__(self, maxsize: int = 1000, policy: str = DROP_OLDEST):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy}, expected one of {OVERFLOW_POLICIES}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize: int = maxsize if policy != COALESCE_LATEST else 1
+        self.policy: str = policy
+        self.buffer: deque = deque()
+        self.not_empty: asyncio.Event = asyncio.Event()
+        self.received: int = 0
+        self.dropped: int = 0
+
+    def qsize(self) -> int:
+        return len(self.buffer)
+
+    def empty(self) -> bool:
+        return not self.buffer
+
+    def put_nowait(self, item):
+        self.received += 1
+        if len(self.buffer) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return
+            self.buffer.popleft()
+        self.buffer.append(item)
+        self.not_empty.set()
+
+    async def wait_not_empty(self):
+        while not self.buffer:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+
+    async def get(self):
+        await self.wait_not_empty()
+        return self.buffer.popleft()
+
+    async def get_all(self) -> List:
+        """waits for at least one message then takes everything queued"""
+        await self.wait_not_empty()
+        items = list(self.buffer)
+        self.buffer.clear()
+        return items
+
+    def stats(self) -> Dict:
+        return {"policy": self.policy, "queued": len(self.buffer), "received": self.received, "dropped": self.dropped}
 
 
 class WebsocketsRPCConnection:
-    def __init__(self, websocket_url, max_pending_requests=1000):
+    """Multiplexes json-rpc requests and subscriptions over a single websocket. Each request registers a future under
+    its id before it is sent and the receive loop resolves it, so responses can arrive in any order. At most
+    max_pending_requests requests are outstanding at once (others wait for a slot) and a request with no response
+    after request_timeout seconds raises asyncio.TimeoutError.
+    If reconnect is True a dropped socket is reopened with exponential backoff (requests in flight when it dropped
+    fail, new ones wait for the reconnection) and every subscription is re-issued, its new id being mapped to the
+    existing queue. If there is a newHeads subscription the blocks missed while disconnected are added to block_gaps
+    as (from_block, to_block) and passed to on_reconnect, e.g. to backfill pools with update_v3_pools_from_chain."""
+
+    def __init__(self, websocket_url, max_pending_requests=1000, codec: Optional[JsonCodec] = None,
+                 request_timeout: Optional[float] = 30, reconnect: bool = True, reconnect_delay: float = 0.1,
+                 max_reconnect_delay: float = 30, max_reconnect_attempts: Optional[int] = None,
+                 on_reconnect: Optional[Callable[[Optional[Tuple[int, int]]], Awaitable]] = None):
         self.websocket_connection = None
         self.url = websocket_url
         self.max_pending_requests = max_pending_requests
+        self.request_timeout: Optional[float] = request_timeout
         self.current_request_id = 0
-        self.pending_requests = {}
-        self.received_responses = {}
+        # request id -> future resolved with the response, every id of a batch maps to the batch's future
+        self.pending_requests: Dict[int, asyncio.Future] = {}
+        self.request_slots: asyncio.Semaphore = None
         self.subscription_responses = {}
+        # subscription id -> request, so subscriptions can be re-issued after a reconnection
+        self.subscriptions: Dict[str, SubscriptionRequest] = {}
         self.running_receive_loop = None
+        self.codec: JsonCodec = codec if codec is not None else get_codec()
+        self.reconnect: bool = reconnect
+        self.reconnect_delay: float = reconnect_delay
+        self.max_reconnect_delay: float = max_reconnect_delay
+        self.max_reconnect_attempts: Optional[int] = max_reconnect_attempts
+        self.on_reconnect = on_reconnect
+        # set while the socket is usable, requests made while reconnecting wait on it
+        self.connected: asyncio.Event = None
+        self.reconnections: int = 0
+        self.last_head_block: Optional[int] = None
+        self.block_gaps: List[Tuple[int, int]] = []
+        self.callbacks: Set[asyncio.Task] = set()
 
     async def __aenter__(self):
+        self.request_slots = asyncio.Semaphore(self.max_pending_requests)
+        self.connected = asyncio.Event()
         self.websocket_connection = await ws.connect(self.url)
+        self.connected.set()
         self.running_receive_loop = asyncio.create_task(self.consumer_loop())
         await asyncio.sleep(0)
         return self
@@ -27,6 +122,8 @@ class WebsocketsRPCConnection:
 
     async def clean_up(self):
         self.running_receive_loop.cancel()
+        for task in self.callbacks:
+            task.cancel()
         await self.websocket_connection.close()
 
     async def setup_websocket(self):
@@ -45,6 +142,9 @@ class WebsocketsRPCConnection:
                 raise ExecutionRevertError(3, response['error']['message'])
             elif response['error']['code'] == -32000:
                 raise RPC_Error(response['error']['code'], response)
+            elif response['error']['code'] == 429 or (response['error']['code'] == -32005
+                                                       and '[' not in response['error'].get('message', '')):
+                raise RateLimitError(response['error']['code'], response)
             elif response['error']['code'] == -32005:
                 response = response['error']
                 block_list = response['message'][response['message'].index('[') + 1: response['message'].index(']')]
@@ -54,64 +154,181 @@ class WebsocketsRPCConnection:
             else:
                 raise RPC_Error(response['error']['code'], response)
 
+    def handle_message(self, message):
+        response = self.codec.loads_rpc(message)
+        if type(response) == list:
+            future = next((self.pending_requests[r['id']] for r in response
+                           if r.get('id') in self.pending_requests), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        elif 'id' in response:
+            future = self.pending_requests.get(response['id'])
+            if future is not None and not future.done():
+                future.set_result(response)
+        else:
+            subscription_id = response['params']['subscription']
+            if subscription_id not in self.subscription_responses:
+                # sent before an unsubscribe or reconnection took effect
+                return
+            subscription = self.subscriptions.get(subscription_id)
+            if subscription is not None and subscription.params[0] == "newHeads":
+                self.last_head_block = int(response['params']['result']['number'], 16)
+            # never blocks, a slow subscriber loses messages rather than stalling every response on the socket
+            self.subscription_responses[subscription_id].put_nowait(response['params'])
+
+    def fail_pending(self, err: Exception):
+        # nothing sent on the old socket will ever get a response. Each gets a copy without the traceback, which
+        # holds this (still running) loop's frame
+        for future in self.pending_requests.values():
+            if not future.done():
+                future.set_exception(copy.copy(err))
+
     async def consumer_loop(self):
+        try:
+            while True:
+                try:
+                    while True:
+                        self.handle_message(await self.websocket_connection.recv())
+                except ws.ConnectionClosed as err:
+                    self.connected.clear()
+                    self.fail_pending(err)
+                    if not self.reconnect:
+                        raise
+                    await self.reconnect_websocket()
+        finally:
+            # wakes any requests waiting for a reconnection, they then see the loop has stopped
+            self.connected.set()
+
+    async def reconnect_websocket(self):
+        """reopens the socket with exponential backoff, then re-issues the subscriptions"""
+        attempt = 0
         while True:
-            message = await self.websocket_connection.recv()
-            response = json.loads(message)
+            await asyncio.sleep(min(self.max_reconnect_delay, self.reconnect_delay * 2 ** attempt))
+            attempt += 1
+            try:
+                self.websocket_connection = await ws.connect(self.url)
+                head = await self.resubscribe()
+                break
+            except (OSError, asyncio.TimeoutError, ws.WebSocketException, RPC_Error):
+                if self.websocket_connection is not None:
+                    await self.websocket_connection.close()
+                if self.max_reconnect_attempts is not None and attempt >= self.max_reconnect_attempts:
+                    raise
+        self.reconnections += 1
+        gap = None
+        if self.last_head_block is not None and head > self.last_head_block:
+            gap = (self.last_head_block + 1, head)
+            self.block_gaps.append(gap)
+        self.connected.set()
+        if self.on_reconnect is not None:
+            # run separately as it will probably make requests on this connection
+            task = asyncio.create_task(self.on_reconnect(gap))
+            self.callbacks.add(task)
+            task.add_done_callback(self.callbacks.discard)
+
+    async def resubscribe(self) -> int:
+        """re-issues every subscription on the new socket, along with an eth_blockNumber, returning the head block.
+        This runs before the receive loop resumes so it reads the response itself."""
+        old_ids = list(self.subscriptions)
+        requests = [self.subscriptions[old_id] for old_id in old_ids] + [BlockNumberRequest()]
+        batch = [{"jsonrpc": "2.0", "method": request.request_name, "params": request.params, "id": request_id}
+                 for request, request_id in zip(requests, self.generate_request_ids(len(requests)))]
+        await self.websocket_connection.send(self.codec.dumps(batch))
+        while True:
+            response = self.codec.loads_rpc(await asyncio.wait_for(self.websocket_connection.recv(),
+                                                                   self.request_timeout))
             if type(response) == list:
-                response_id = response[0]['id']
-                self.received_responses[response_id] = response
-                self.pending_requests[response_id].set()
-            else:
-                try:
-                    response_id = response['id']
-                    self.received_responses[response_id] = response
-                    self.pending_requests[response_id].set()
-                except KeyError:
-                    subscription_id = response['params']['subscription']
-                    await self.subscription_responses[subscription_id].put(response['params'])
+                break
+        responses_by_id = {r.get('id'): r for r in response}
+        results = []
+        for rpc_json in batch:
+            if rpc_json['id'] not in responses_by_id:
+                raise Batch_Error(f"No response for request id {rpc_json['id']}")
+            if self.response_code_valid(responses_by_id[rpc_json['id']]):
+                results.append(responses_by_id[rpc_json['id']]['result'])
+        # built afresh as a new id can be the same as a different subscription's old id
+        subscriptions = {}
+        subscription_responses = {}
+        for old_id, new_id in zip(old_ids, results):
+            subscription = self.subscriptions[old_id]
+            subscription.set_subscription_id(new_id)
+            subscriptions[new_id] = subscription
+            subscription_responses[new_id] = self.subscription_responses[old_id]
+        self.subscriptions = subscriptions
+        self.subscription_responses = subscription_responses
+        return int(results[-1], 16)
 
-    async def send_request(self, request: RPCRequest, d=False):
-        request_id = self.generate_request_id()
-        rpc_json = {"jsonrpc": "2.0", "method": request.request_name, "params": request.params, "id": request_id}
-        await self.websocket_connection.send(json.dumps(rpc_json))
-        self.pending_requests[request_id] = asyncio.Event()
-        await self.pending_requests[request_id].wait()
-        self.pending_requests.pop(request_id)
-        response = self.received_responses[request_id]
-        self.received_responses.pop(request_id)
+    async def send_json(self, rpc_json):
+        """sends a request (or batch) and waits for its response. Ids are given to the requests once a slot is free,
+        in the same step as registering the future, so two requests waiting for a slot can't be given the same id
+        and a fast response can't be missed"""
+        requests = rpc_json if type(rpc_json) == list else [rpc_json]
+        async with self.request_slots:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            request_ids = self.generate_request_ids(len(requests))
+            for request, request_id in zip(requests, request_ids):
+                request['id'] = request_id
+                self.pending_requests[request_id] = future
+            try:
+                message = self.codec.dumps(rpc_json)
+                while True:
+                    if not self.connected.is_set():
+                        await asyncio.wait_for(self.connected.wait(), self.request_timeout)
+                    if self.running_receive_loop.done():
+                        raise ConnectionError("websocket receive loop has stopped")
+                    if future.done():
+                        # failed along with everything else pending when the socket dropped, but it is being resent
+                        future = loop.create_future()
+                        for request_id in request_ids:
+                            self.pending_requests[request_id] = future
+                    websocket_connection = self.websocket_connection
+                    try:
+                        await websocket_connection.send(message)
+                        break
+                    except ws.ConnectionClosed:
+                        # the socket dropped before the receive loop noticed, nothing was sent so wait and resend
+                        if not self.reconnect:
+                            raise
+                        if self.websocket_connection is websocket_connection:
+                            self.connected.clear()
+                return await asyncio.wait_for(future, self.request_timeout)
+            finally:
+                for request_id in request_ids:
+                    self.pending_requests.pop(request_id, None)
+
+    async def send_raw_request(self, request: RPCRequest):
+        rpc_json = {"jsonrpc": "2.0", "method": request.request_name, "params": request.params}
+        response = await self.send_json(rpc_json)
         if self.response_code_valid(response):
-            return request.decode_response(response['result']) if not d else response['result']
+            return response['result']
+
+    async def send_request(self, request: RPCRequest, d=False):
+        result = await self.send_raw_request(request)
+        return request.decode_response(result) if not d else result
 
     async def send_batch_request(self, batch_list: List[RPCRequest]):
-        request_id_start = self.generate_request_id()
-        request_id = request_id_start
-        batch = []
-        for request in batch_list:
-            batch.append({"jsonrpc": "2.0", "method": request.request_name, "params": request.params, "id": request_id})
-            request_id = self.generate_request_id()
-        await self.websocket_connection.send(json.dumps(batch))
-        self.pending_requests[request_id_start] = asyncio.Event()
-        await self.pending_requests[request_id_start].wait()
-        self.pending_requests.pop(request_id_start)
-        response = self.received_responses[request_id_start]
-        self.received_responses.pop(request_id_start)
+        batch = [{"jsonrpc": "2.0", "method": request.request_name, "params": request.params} for request in batch_list]
+        # send_json fills in the ids
+        response = await self.send_json(batch)
+        responses_by_id = {r.get('id'): r for r in response}
         out = []
-        for batch_req, (index, resp) in zip(batch_list, enumerate(response)):
-            if batch[index]['id'] != resp['id']:
-                raise Batch_Error()
-            valid = self.response_code_valid(resp)
-            if valid is None:
-                out.append(None)
-            elif valid:
+        for batch_req, rpc_json in zip(batch_list, batch):
+            if rpc_json['id'] not in responses_by_id:
+                raise Batch_Error(f"No response for request id {rpc_json['id']}")
+            resp = responses_by_id[rpc_json['id']]
+            if self.response_code_valid(resp):
                 out.append(batch_req.decode_response(resp['result']))
-            else:
-                out.append(batch_req.handle_error(resp))
         return out
 
-    async def subscribe_to_events(self, request: SubscriptionRequest):
+    async def subscribe_to_events(self, request: SubscriptionRequest, policy: str = DROP_OLDEST,
+                                  maxsize: Optional[int] = None):
+        """subscribes, queueing up to maxsize (default max_pending_requests) messages. By default the oldest messages
+        are dropped when full, COALESCE_LATEST keeps only the latest message e.g. for newHeads"""
+        queue = SubscriptionQueue(maxsize if maxsize is not None else self.max_pending_requests, policy)
         response = await self.send_request(request, True)
-        self.subscription_responses[response] = asyncio.Queue(self.max_pending_requests)
+        self.subscription_responses[response] = queue
+        self.subscriptions[response] = request
         request.set_subscription_id(response)
 
     async def poll_subscription(self, subscription: SubscriptionRequest):
@@ -119,13 +336,12 @@ class WebsocketsRPCConnection:
         return subscription.decode_response(response['result'])
 
     async def poll_subscription_as_list(self, subscription: SubscriptionRequest):
-        size = self.subscription_responses[subscription.get_subscription_id()].qsize()
-        if size == 0:
-            response = await self.subscription_responses[subscription.get_subscription_id()].get()
-            return [subscription.decode_response(response['result'])]
-        else:
-            responses = (await self.subscription_responses[subscription.get_subscription_id()].get() for _ in range(size))
-            return [subscription.decode_response(response['result']) async for response in responses]
+        """waits for at least one message then returns every queued message"""
+        responses = await self.subscription_responses[subscription.get_subscription_id()].get_all()
+        return [subscription.decode_response(response['result']) for response in responses]
+
+    def subscription_stats(self) -> Dict[str, Dict]:
+        return {subscription_id: queue.stats() for subscription_id, queue in self.subscription_responses.items()}
 
     async def add_filter(self, request: FilterRequest):
         response = await self.send_request(request)
@@ -135,9 +351,19 @@ class WebsocketsRPCConnection:
         response = await self.send_request(filter_request.get_filter_changes_request())
         return filter_request.decode_response(response)
 
-    def generate_request_id(self):
-        cur_id = self.current_request_id
-        self.current_request_id += 1
-        if self.current_request_id > (self.max_pending_requests * 100):
-            self.current_request_id = 0
-        return cur_id
\ No newline at end of file
+    def generate_request_ids(self, count: int) -> List[int]:
+        """gets the next count ids which aren't in use by a pending request, without awaiting so the caller can
+        register them before anything else runs"""
+        id_space = self.max_pending_requests * 100 + 1
+        if count > id_space - len(self.pending_requests):
+            raise ValueError(f"Can't give {count} requests ids, only {id_space - len(self.pending_requests)} of "
+                             f"{id_space} ids are free")
+        request_ids = []
+        while len(request_ids) < count:
+            cur_id = self.current_request_id
+            self.current_request_id += 1
+            if self.current_request_id >= id_space:
+                self.current_request_id = 0
+            if cur_id not in self.pending_requests:
+                request_ids.append(cur_id)
+        return request_ids
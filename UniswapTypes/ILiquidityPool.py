@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Union, List
 from Web3Types.SimpleTypes import Address
 from UniswapTypes.RToken import RToken
 
@@ -31,6 +31,16 @@ class ILiquidityPool:
         """Method that simulates the result of a swap without altering internal liquidity"""
         pass
 
+    def simulate_swap_exact_out(self, token0_out: int, token1_out: int) -> int:
+        """Method that simulates the input needed for a swap giving exactly token0_out or token1_out, without altering
+        internal liquidity"""
+        pass
+
+    def simulate_swap_many(self, amounts: List[int], direction: bool) -> List[int]:
+        """Method that simulates a swap of each amount of token0 (direction True) or token1 (direction False) in,
+        giving the same outputs as calling simulate_swap for each"""
+        pass
+
     def swap(self, token0_in: int, token1_in: int) -> int:
         """Method that performs a swap and changes pool liquidity"""
         pass
@@ -1,4 +1,4 @@
-import json
+import Utilities.JsonCodec as json_codec
 from UniswapTypes.PancakeswapV2LP import pancake_v2_from_json
 from UniswapTypes.ShibaswapV2LP import shiba_v2_from_json
 from UniswapTypes.SushiswapV2LP import sushi_v2_from_json
@@ -8,7 +8,7 @@ from UniswapTypes.XchangeV2LP import xchange_v2_from_json
 
 
 def decode_json_lp(lp_str: str):
-    lp_json = json.loads(lp_str)
+    lp_json = json_codec.loads(lp_str)
     if lp_json['type'] == "UniswapV2LP":
         lp = v2_from_json(lp_str)
     elif lp_json['type'] == "PancakeswapV2LP":
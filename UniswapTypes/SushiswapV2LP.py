@@ -1,4 +1,4 @@
-import json
+import Utilities.JsonCodec as json_codec
 
 from UniswapTypes.RToken import RToken
 from UniswapTypes.UniswapV2LP import UniswapV2LP
@@ -10,7 +10,7 @@ class SushiswapV2LP(UniswapV2LP):
     __slots__ = ("reserves0", "reserves1", "fees_as_fraction")
 
     def to_json(self) -> str:
-        return json.dumps({
+        return json_codec.dumps({
             "address": str(self.address),
             "token0": str(self.token0),
             "token1": str(self.token1),
@@ -21,7 +21,7 @@ class SushiswapV2LP(UniswapV2LP):
 
 
 def sushi_v2_from_json(json_str: str) -> SushiswapV2LP:
-    obj_dict = json.loads(json_str)
+    obj_dict = json_codec.loads(json_str)
     return SushiswapV2LP(Address(obj_dict["address"]),
                          RToken(obj_dict["token0"]),
                          RToken(obj_dict["token1"]),
@@ -1,3 +1,4 @@
+import json
 import unittest
 from UniswapTypes.RToken import *
 from UniswapTypes.UniswapV2LP import *
@@ -82,6 +83,29 @@ class UniswapV2LPTests(unittest.TestCase):
                          17184584621057525854377, 28307786847252)
         self.assertEqual(lp.simulate_swap(0, amount_in), actual_result)
 
+    def test_simulate_swap_many(self):
+        lp = UniswapV2LP("0x0d4a11d5EEaaC28EC3F61d100daF4d40471f1852", WETH_TOKEN, USDC_TOKEN,
+                         17184584621057525854377, 28307786847252)
+        amounts = [10 ** i + i for i in range(30)] + [5, 3]
+        self.assertEqual(lp.simulate_swap_many(amounts, True), [lp.simulate_swap(a, 0) for a in amounts])
+        self.assertEqual(lp.simulate_swap_many(amounts, False), [lp.simulate_swap(0, a) for a in amounts])
+        with self.assertRaises(SwapError):
+            lp.simulate_swap_many([1, 0], True)
+
+    def test_simulate_swap_exact_out(self):
+        lp = UniswapV2LP("0x0d4a11d5EEaaC28EC3F61d100daF4d40471f1852", WETH_TOKEN, USDC_TOKEN,
+                         17184584621057525854377, 28307786847252)
+        # getAmountIn from the v2 library: reserveIn * amountOut * 1000 / ((reserveOut - amountOut) * 997) + 1
+        self.assertEqual(lp.simulate_swap_exact_out(0, 1642335),
+                         17184584621057525854377 * 1642335 * 1000 // ((28307786847252 - 1642335) * 997) + 1)
+        for amount_out in [1, 10 ** 6, 10 ** 12, 28307786847251]:
+            amount_in = lp.simulate_swap_exact_out(0, amount_out)
+            self.assertGreaterEqual(lp.simulate_swap(amount_in, 0), amount_out)
+        amount_in = lp.simulate_swap_exact_out(10 ** 18, 0)
+        self.assertGreaterEqual(lp.simulate_swap(0, amount_in), 10 ** 18)
+        with self.assertRaises(InsufficientReserves):
+            lp.simulate_swap_exact_out(0, 28307786847252)
+
     def test_save_and_load_to_json_v2(self):
         lp = UniswapV2LP("0x0d4a11d5EEaaC28EC3F61d100daF4d40471f1852", WETH_TOKEN, USDC_TOKEN,
                          17184584621057525854377, 28307786847252)
@@ -0,0 +1,315 @@
+import os
+import random
+import time
+import unittest
+from UniswapTypes.RToken import RToken
+from UniswapTypes.UniswapV3LP import UniswapV3LP, UninitialisedSlotError, InsufficientLiquidity
+import Utilities.EthereumMaths as em
+
+USDC_TOKEN = RToken("0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48")
+WETH_TOKEN = RToken("0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2")
+USDC_WETH_500 = "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"
+
+
+class ScanningV3LP(UniswapV3LP):
+    """the pool with the original min/max and bit by bit next tick search, to check against and benchmark"""
+
+    __slots__ = ()
+
+    def get_next_tick(self, current_tick: int, spacing: int, direction: bool) -> int:
+        if current_tick >= max(self.slots_dict.keys()) or current_tick <= min(self.slots_dict.keys()):
+            raise UninitialisedSlotError("No tick above or below current_tick exists in this liquidity pool!")
+        bitmap_tick_key = (current_tick // spacing) // 256
+        bitmap_tick_index = (current_tick // spacing) % 256 + (1 if direction else -1)
+        while True:
+            current_bitmap = self.slot_bitmap[bitmap_tick_key]
+            t = (1 << bitmap_tick_index) & current_bitmap if bitmap_tick_index >= 0 else 0
+            while t == 0 and ((bitmap_tick_index > 0 and not direction) or (bitmap_tick_index < 255 and direction)):
+                bitmap_tick_index += 1 if direction else -1
+                t = (1 << bitmap_tick_index) & current_bitmap
+            if t != 0:
+                return (bitmap_tick_index * spacing) + (bitmap_tick_key * spacing * 256)
+            bitmap_tick_index = 0 if direction else 255
+            bitmap_tick_key += 1 if direction else -1
+
+
+def walk_simulate_swap(lp: UniswapV3LP, token0_in: int, token1_in: int) -> int:
+    """the original simulate_swap, walking the ticks from the current price on every call"""
+    direction = token1_in > 0
+    amount_remaining = token1_in if direction else token0_in
+    current_tick, current_price, current_liquidity = lp.current_tick, lp.sqrtPriceX96, lp.liquidity
+    total_out = 0
+    while amount_remaining > 0:
+        try:
+            tick_above = lp.get_next_tick(current_tick, lp.tick_spacing, direction)
+            skip = False
+        except UninitialisedSlotError:
+            tick_above = 887272 if direction else -887272
+            skip = True
+        amount_in, amount_out, new_price, fee = em.computeSwapStep(current_price, em.getSqrtRatioAtTick(tick_above),
+                                                                   current_liquidity, amount_remaining, lp.fee)
+        amount_remaining -= (amount_in + fee)
+        total_out += amount_out
+        if skip:
+            break
+        current_tick, current_price = tick_above, new_price
+        current_liquidity += lp.slots_dict[tick_above][0] if direction else -lp.slots_dict[tick_above][0]
+    return total_out
+
+
+def make_deep_pool(positions: int, seed: int = 0, pool_type=UniswapV3LP) -> UniswapV3LP:
+    """a usdc/weth 0.05% like pool with positions minted in ranges spread around the current tick"""
+    rng = random.Random(seed)
+    current_tick = 201000
+    lp = pool_type(USDC_WETH_500, USDC_TOKEN, WETH_TOKEN, 10, 500)
+    lp.initialize_event(em.getSqrtRatioAtTick(current_tick) + 12345, current_tick)
+    for _ in range(positions):
+        lower = current_tick + rng.randrange(-3000, 3000) * 10
+        upper = lower + rng.randrange(1, 400) * 10
+        lp.mint_event(lower, upper, rng.randrange(10 ** 15, 10 ** 18), 0, 0)
+    # wide positions so there is liquidity everywhere near the price
+    lp.mint_event(current_tick - 40000, current_tick + 40000, 10 ** 18, 0, 0)
+    return lp
+
+
+def copy_pool(lp: UniswapV3LP, pool_type=UniswapV3LP) -> UniswapV3LP:
+    return pool_type(lp.address, lp.token0, lp.token1, lp.tick_spacing, lp.fee, lp.current_tick, lp.liquidity,
+                     lp.sqrtPriceX96, lp.reserves0, lp.reserves1, lp.slots_dict, lp.slot_bitmap)
+
+
+class SortedTickIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.lp = make_deep_pool(2000)
+
+    def test_sorted_ticks_follow_mints_and_burns(self):
+        self.assertEqual(self.lp.sorted_ticks, sorted(self.lp.slots_dict))
+        rng = random.Random(1)
+        minted = []
+        for _ in range(200):
+            lower = 201000 + rng.randrange(-500, 500) * 10
+            upper = lower + rng.randrange(1, 50) * 10
+            liquidity = rng.randrange(1, 10 ** 18)
+            self.lp.mint_event(lower, upper, liquidity, 0, 0)
+            minted.append((lower, upper, liquidity))
+        self.assertEqual(self.lp.sorted_ticks, sorted(self.lp.slots_dict))
+        for lower, upper, liquidity in minted:
+            self.lp.burn_event(lower, upper, liquidity, 0, 0)
+        self.assertEqual(self.lp.sorted_ticks, sorted(self.lp.slots_dict))
+        self.assertEqual(copy_pool(self.lp).sorted_ticks, self.lp.sorted_ticks)
+
+    def test_next_tick_matches_bit_by_bit_search(self):
+        scanning = copy_pool(self.lp, ScanningV3LP)
+        rng = random.Random(2)
+        lowest, highest = self.lp.sorted_ticks[0], self.lp.sorted_ticks[-1]
+        for tick in [rng.randrange(lowest + 1, highest) for _ in range(2000)] + self.lp.sorted_ticks[1:-1]:
+            self.assertEqual(self.lp.get_next_tick(tick, 10, True), scanning.get_next_tick(tick, 10, True))
+            # the bit by bit search skipped the tick at the start of the word when current_tick isn't on a multiple of
+            # the spacing, so only compare from initialised ticks going left
+            if tick in self.lp.slots_dict:
+                self.assertEqual(self.lp.get_next_tick(tick, 10, False), scanning.get_next_tick(tick, 10, False))
+
+    def test_next_tick_is_strict(self):
+        ticks = self.lp.sorted_ticks
+        self.assertEqual(self.lp.get_next_tick(ticks[10], 10, True), ticks[11])
+        self.assertEqual(self.lp.get_next_tick(ticks[10], 10, False), ticks[9])
+        self.assertEqual(self.lp.get_next_tick(ticks[10] + 5, 10, False), ticks[10])
+        self.assertEqual(self.lp.get_next_tick(ticks[10] + 5, 10, True), ticks[11])
+        with self.assertRaises(UninitialisedSlotError):
+            self.lp.get_next_tick(ticks[-1], 10, True)
+        with self.assertRaises(UninitialisedSlotError):
+            self.lp.get_next_tick(ticks[0], 10, False)
+
+    def test_next_tick_off_the_spacing(self):
+        lp = UniswapV3LP(USDC_WETH_500, USDC_TOKEN, WETH_TOKEN, 60, 3000)
+        lp.initialize_event(em.getSqrtRatioAtTick(-1), -1)
+        lp.mint_event(-120, 60, 10 ** 18, 0, 0)
+        lp.mint_event(-60, 0, 10 ** 18, 0, 0)
+        scanning = copy_pool(lp, ScanningV3LP)
+        # going right both searches give the first initialised tick above the current tick
+        self.assertEqual(lp.get_next_tick(-1, 60, True), 0)
+        self.assertEqual(scanning.get_next_tick(-1, 60, True), 0)
+        self.assertEqual(lp.get_next_tick(-60, 60, True), 0)
+        self.assertEqual(scanning.get_next_tick(-60, 60, True), 0)
+        # on an initialised tick going left both skip the current tick, as the swap has already crossed it
+        self.assertEqual(lp.get_next_tick(-60, 60, False), -120)
+        self.assertEqual(scanning.get_next_tick(-60, 60, False), -120)
+        self.assertEqual(lp.get_next_tick(0, 60, False), -60)
+        self.assertEqual(scanning.get_next_tick(0, 60, False), -60)
+        # between ticks going left the initialised tick at or below the current tick is next, like the pool contract's
+        # nextInitializedTickWithinOneWord(lte=true). The bit by bit search skipped it and went on to -120
+        self.assertEqual(lp.get_next_tick(-1, 60, False), -60)
+        self.assertEqual(scanning.get_next_tick(-1, 60, False), -120)
+        self.assertEqual(lp.get_next_tick(-61, 60, False), -120)
+
+    def test_deep_pool_swap_matches_bit_by_bit_search(self):
+        scanning = copy_pool(self.lp, ScanningV3LP)
+        for amount in (10 ** 21, 10 ** 22, 10 ** 23):
+            self.assertEqual(self.lp.simulate_swap(0, amount), scanning.simulate_swap(0, amount))
+            self.assertEqual(self.lp.simulate_swap(amount, 0), scanning.simulate_swap(amount, 0))
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+    def test_benchmark_deep_pool_swap(self):
+        scanning = copy_pool(self.lp, ScanningV3LP)
+        amounts = [10 ** 21, 10 ** 22, 10 ** 23]
+        t1 = time.perf_counter()
+        expected = [scanning.simulate_swap(0, a) for a in amounts] + [scanning.simulate_swap(a, 0) for a in amounts]
+        t2 = time.perf_counter()
+        results = [self.lp.simulate_swap(0, a) for a in amounts] + [self.lp.simulate_swap(a, 0) for a in amounts]
+        t3 = time.perf_counter()
+        print(f"{len(self.lp.sorted_ticks)} ticks, bit by bit: {t2 - t1}, sorted index: {t3 - t2}")
+        self.assertEqual(results, expected)
+
+
+class SimulateSwapManyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.lp = make_deep_pool(2000)
+
+    def test_matches_simulate_swap(self):
+        rng = random.Random(3)
+        # includes amounts running past every tick, duplicates, zero and amounts ending exactly on a tick
+        amounts = [rng.randrange(1, 10 ** rng.randrange(2, 26)) for _ in range(60)] + [10 ** 30, 10 ** 30, 0, 7]
+        one_tick = self.lp.get_next_tick(self.lp.current_tick, 10, False)
+        amount_in, _, _, fee = em.computeSwapStep(self.lp.sqrtPriceX96, em.getSqrtRatioAtTick(one_tick),
+                                                  self.lp.liquidity, 10 ** 30, self.lp.fee)
+        amounts.append(amount_in + fee)
+        self.assertEqual(self.lp.simulate_swap_many(amounts, True),
+                         [walk_simulate_swap(self.lp, a, 0) for a in amounts])
+        self.assertEqual(self.lp.simulate_swap_many(amounts, False),
+                         [walk_simulate_swap(self.lp, 0, a) for a in amounts])
+        self.assertEqual([self.lp.simulate_swap(a, 0) for a in amounts],
+                         [walk_simulate_swap(self.lp, a, 0) for a in amounts])
+        self.assertEqual(self.lp.simulate_swap_many([], True), [])
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+    def test_benchmark_against_walking(self):
+        amounts = [10 ** 18 * (i + 1) for i in range(50)]
+        t1 = time.perf_counter()
+        single = [walk_simulate_swap(self.lp, a, 0) for a in amounts]
+        t2 = time.perf_counter()
+        many = self.lp.simulate_swap_many(amounts, True)
+        t3 = time.perf_counter()
+        print(f"walking: {t2 - t1}, simulate_swap_many: {t3 - t2}")
+        self.assertEqual(single, many)
+
+
+class SwapCurveTests(unittest.TestCase):
+
+    def setUp(self):
+        self.lp = make_deep_pool(2000)
+
+    def test_curve_extended_lazily(self):
+        self.lp.simulate_swap(10 ** 12, 0)
+        steps = len(self.lp.curves[True].prices)
+        self.assertFalse(self.lp.curves[True].complete)
+        self.assertNotIn(False, self.lp.curves)
+        self.lp.simulate_swap(10 ** 14, 0)
+        self.assertGreater(len(self.lp.curves[True].prices), steps)
+        # past every tick the swap stops at the end of the tick range
+        self.assertEqual(self.lp.simulate_swap(10 ** 40, 0), walk_simulate_swap(self.lp, 10 ** 40, 0))
+        self.assertTrue(self.lp.curves[True].complete)
+
+    def test_events_invalidate_curve(self):
+        rng = random.Random(4)
+        amounts = [rng.randrange(1, 10 ** rng.randrange(10, 24)) for _ in range(20)]
+        self.lp.simulate_swap_many(amounts, True)
+        self.lp.simulate_swap_many(amounts, False)
+        self.lp.mint_event(200000, 202000, 10 ** 19, 0, 0)
+        self.assertEqual(self.lp.curves, {})
+        self.assertEqual(self.lp.simulate_swap_many(amounts, False), [walk_simulate_swap(self.lp, 0, a) for a in amounts])
+        self.lp.burn_event(200000, 202000, 10 ** 19, 0, 0)
+        self.assertEqual(self.lp.simulate_swap_many(amounts, False), [walk_simulate_swap(self.lp, 0, a) for a in amounts])
+        tick = self.lp.sorted_ticks[len(self.lp.sorted_ticks) // 3]
+        self.lp.swap_event(0, 0, em.getSqrtRatioAtTick(tick), self.lp.liquidity, tick)
+        self.assertEqual(self.lp.simulate_swap_many(amounts, True), [walk_simulate_swap(self.lp, a, 0) for a in amounts])
+        self.lp.initialize_event(em.getSqrtRatioAtTick(201000), 201000)
+        self.assertEqual(self.lp.curves, {})
+
+    def test_virtual_reserves_with_bounds(self):
+        for direction, max_input in ((True, 10 ** 14), (False, 10 ** 23)):
+            bounds = self.lp.get_virtual_reserves_with_bounds(direction, max_input)
+            # both directions give (reserves0, reserves1)
+            self.assertEqual(bounds[0], (0, self.lp.get_virtual_reserves()))
+            self.assertGreater(len(bounds), 10)
+            thresholds = [threshold for threshold, _ in bounds]
+            self.assertEqual(thresholds, sorted(thresholds))
+            self.assertLess(thresholds[-1], max_input)
+
+    def test_warm_curve_matches_walking(self):
+        rng = random.Random(5)
+        amounts = [rng.randrange(1, 10 ** 24) for _ in range(200)]
+        self.lp.simulate_swap(0, max(amounts))
+        self.assertEqual([self.lp.simulate_swap(0, a) for a in amounts],
+                         [walk_simulate_swap(self.lp, 0, a) for a in amounts])
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+    def test_benchmark_warm_curve(self):
+        rng = random.Random(5)
+        amounts = [rng.randrange(1, 10 ** 24) for _ in range(200)]
+        self.lp.simulate_swap(0, max(amounts))
+        t1 = time.perf_counter()
+        walked = [walk_simulate_swap(self.lp, 0, a) for a in amounts]
+        t2 = time.perf_counter()
+        quoted = [self.lp.simulate_swap(0, a) for a in amounts]
+        t3 = time.perf_counter()
+        print(f"walking: {t2 - t1}, cached curve: {t3 - t2}")
+        self.assertEqual(walked, quoted)
+
+
+class SimulateSwapExactOutTests(unittest.TestCase):
+
+    def setUp(self):
+        self.lp = make_deep_pool(2000)
+
+    def test_single_range_matches_sqrt_price_math(self):
+        """inside one range the input follows from the v3-core SqrtPriceMath formulas, rounding in the pool's favour"""
+        q96 = 1 << 96
+        liquidity = 10 ** 21
+        lp = UniswapV3LP(USDC_WETH_500, USDC_TOKEN, WETH_TOKEN, 10, 500)
+        lp.initialize_event(q96, 0)
+        lp.mint_event(-60000, 60000, liquidity, 0, 0)
+
+        def ceil_div(a, b):
+            return -(-a // b)
+
+        for amount_out in (1, 10 ** 6, 10 ** 15, 10 ** 20):
+            # token1 out, the price moves down by the output over the liquidity rounded up
+            price = q96 - ceil_div(amount_out * q96, liquidity)
+            amount_in = ceil_div(ceil_div(liquidity * q96 * (q96 - price), q96), price)
+            self.assertEqual(lp.simulate_swap_exact_out(0, amount_out),
+                             amount_in + ceil_div(amount_in * 500, 10 ** 6 - 500))
+            # token0 out, the price moves up
+            price = ceil_div(liquidity * q96 * q96, liquidity * q96 - amount_out * q96)
+            amount_in = ceil_div(liquidity * (price - q96), q96)
+            self.assertEqual(lp.simulate_swap_exact_out(amount_out, 0),
+                             amount_in + ceil_div(amount_in * 500, 10 ** 6 - 500))
+
+    def test_input_is_minimal_across_ticks(self):
+        rng = random.Random(6)
+        for _ in range(100):
+            token1_out = rng.randrange(1, 10 ** rng.randrange(2, 24))
+            amount_in = self.lp.simulate_swap_exact_out(0, token1_out)
+            self.assertGreaterEqual(self.lp.simulate_swap(amount_in, 0), token1_out)
+            self.assertLess(self.lp.simulate_swap(amount_in - 1, 0), token1_out)
+            token0_out = rng.randrange(1, 10 ** rng.randrange(2, 15))
+            amount_in = self.lp.simulate_swap_exact_out(token0_out, 0)
+            self.assertGreaterEqual(self.lp.simulate_swap(0, amount_in), token0_out)
+            self.assertLess(self.lp.simulate_swap(0, amount_in - 1), token0_out)
+
+    def test_input_is_enough(self):
+        for token1_out in [10 ** 9, 10 ** 15, 10 ** 21]:
+            amount_in = self.lp.simulate_swap_exact_out(0, token1_out)
+            self.assertGreaterEqual(self.lp.simulate_swap(amount_in, 0), token1_out)
+            self.assertLess(self.lp.simulate_swap(amount_in * 99 // 100, 0), token1_out)
+
+    def test_more_than_pool_holds(self):
+        available = self.lp.get_swap_curve(True, 10 ** 40).amounts_out[-1]
+        self.assertGreater(self.lp.simulate_swap_exact_out(0, available), 0)
+        with self.assertRaises(InsufficientLiquidity):
+            self.lp.simulate_swap_exact_out(0, available + 1)
+        self.assertEqual(self.lp.simulate_swap_exact_out(0, 0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
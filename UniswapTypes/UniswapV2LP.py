@@ -1,8 +1,8 @@
-from typing import Union, Optional, Tuple
+from typing import Union, Optional, Tuple, List
 from UniswapTypes.ILiquidityPool import ILiquidityPool
 from UniswapTypes.RToken import RToken
 from Web3Types.SimpleTypes import Address
-import json
+import Utilities.JsonCodec as json_codec
 
 
 class SwapError(Exception):
@@ -25,6 +25,23 @@ def get_swap_out(reserves_in: int, reserves_out: int, token_in: int, fees_as_fra
     return numerator // denominator
 
 
+def get_swap_in(reserves_in: int, reserves_out: int, token_out: int, fees_as_fraction: Tuple[int, int]) -> int:
+    """Emulates getAmountIn from the Uniswap V2 library, the smallest input which gets token_out out"""
+    if token_out >= reserves_out:
+        raise InsufficientReserves(f"Can't take {token_out} out of reserves of {reserves_out}")
+    numerator = reserves_in * token_out * fees_as_fraction[1]
+    denominator = (reserves_out - token_out) * fees_as_fraction[0]
+    return numerator // denominator + 1
+
+
+def get_swap_outs(reserves_in: int, reserves_out: int, amounts_in: List[int], fees_as_fraction: Tuple[int, int]) -> \
+        List[int]:
+    """get_swap_out over many inputs, with the terms which don't depend on the input hoisted out"""
+    fee_numerator = fees_as_fraction[0]
+    scaled_reserves_in = reserves_in * fees_as_fraction[1]
+    return [(fee_numerator * a * reserves_out) // (scaled_reserves_in + fee_numerator * a) for a in amounts_in]
+
+
 class UniswapV2LP(ILiquidityPool):
     """Uniswap V2 liquidity pool representation"""
 
@@ -67,6 +84,31 @@ class UniswapV2LP(ILiquidityPool):
         else:
             raise SwapError("Must swap non-negative tokens")
 
+    def simulate_swap_exact_out(self, token0_out: int, token1_out: int) -> int:
+        """the amount of the other token which has to go in for token0_out or token1_out to come out"""
+        reserves0, reserves1 = self.get_reserves()
+        if reserves0 == 0 or reserves1 == 0:
+            raise SwapError("No reserves to swap!")
+        if token0_out != 0 and token1_out != 0:
+            raise SwapError("One token output must be zero")
+        elif token0_out > 0:
+            return get_swap_in(reserves1, reserves0, token0_out, self.fees_as_fraction)
+        elif token1_out > 0:
+            return get_swap_in(reserves0, reserves1, token1_out, self.fees_as_fraction)
+        else:
+            raise SwapError("Must swap non-negative tokens")
+
+    def simulate_swap_many(self, amounts: List[int], direction: bool) -> List[int]:
+        """simulate_swap for each amount in, of token0 if direction is True and token1 otherwise"""
+        reserves0, reserves1 = self.get_reserves()
+        if reserves0 == 0 or reserves1 == 0:
+            raise SwapError("No reserves to swap!")
+        if 0 in amounts:
+            raise SwapError("Must swap non-negative tokens")
+        if direction:
+            return get_swap_outs(reserves0, reserves1, amounts, self.fees_as_fraction)
+        return get_swap_outs(reserves1, reserves0, amounts, self.fees_as_fraction)
+
     def swap(self, token0_in: int, token1_in: int) -> int:
         reserves0, reserves1 = self.get_reserves()
         """if token0_in > reserves0 or token1_in > reserves1:
@@ -119,7 +161,7 @@ class UniswapV2LP(ILiquidityPool):
         self.reserves1 = reserves1
 
     def to_json(self) -> str:
-        return json.dumps({
+        return json_codec.dumps({
             "address": str(self.address),
             "token0": str(self.token0),
             "token1": str(self.token1),
@@ -130,7 +172,7 @@ class UniswapV2LP(ILiquidityPool):
 
 
 def v2_from_json(json_str: str) -> UniswapV2LP:
-    obj_dict = json.loads(json_str)
+    obj_dict = json_codec.loads(json_str)
     return UniswapV2LP(Address(obj_dict["address"]),
                        RToken(obj_dict["token0"]),
                        RToken(obj_dict["token1"]),
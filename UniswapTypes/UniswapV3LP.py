@@ -1,4 +1,5 @@
-import json
+import Utilities.JsonCodec as json_codec
+from bisect import bisect_left, bisect_right, insort
 from collections import defaultdict
 from typing import Union, Optional, Dict, Tuple, List
 from UniswapTypes.ILiquidityPool import ILiquidityPool
@@ -23,19 +24,46 @@ class NoLiquidity(Exception):
     pass
 
 
+class InsufficientLiquidity(Exception):
+    pass
+
+
 def calculate_virtual_reserves(liquidity, sqrtPriceX96):
     y_reserves = (sqrtPriceX96 * liquidity) >> 96
     x_reserves = (liquidity << 96) // sqrtPriceX96
     return x_reserves, y_reserves
 
 
+class SwapCurve:
+    """A swap from a pool's price through its initialised ticks in one direction, built only as far as quotes have
+    needed. Step i starts at sqrt price prices[i] with liquidities[i] and runs to targets[i], amounts_in[i] (fees
+    included) and amounts_out[i] being the totals swapped before it. tick, price and liquidity are where the next step
+    starts, and complete is set once a step runs to the end of the tick range"""
+
+    __slots__ = ("tick", "price", "liquidity", "prices", "targets", "liquidities", "amounts_in", "amounts_out",
+                 "complete")
+
+    def __init__(self, tick: int, price: int, liquidity: int):
+        self.tick: int = tick
+        self.price: int = price
+        self.liquidity: int = liquidity
+        self.prices: List[int] = []
+        self.targets: List[int] = []
+        self.liquidities: List[int] = []
+        self.amounts_in: List[int] = [0]
+        self.amounts_out: List[int] = [0]
+        self.complete: bool = False
+
+
 class UniswapV3LP(ILiquidityPool):
     """Class representing an Uniswap V3 liquidity pool. Note mutable variables should only be interacted with by using the
     set mutable variable's method. Also note that while pretty accurate, attributes reserves0 and reserves1 can get slightly
-    out after repeated updates - need to fix - probably impossible though"""
+    out after repeated updates - need to fix - probably impossible though. sorted_ticks holds the keys of slots_dict in
+    ascending order and is kept in sync by the slot setters and mint/burn events. Quotes come from a SwapCurve cached
+    per direction which is dropped whenever the price, liquidity or ticks change"""
 
     __slots__ = ("current_tick", "slots_dict", "slot_bitmap", "reserves0", "reserves1", "sqrtPriceX96", "liquidity",
-                 "tick_spacing", "fee")
+                 "tick_spacing", "fee", "sorted_ticks", "curves")
 
     def __init__(self, address: Union[str, Address], token0: RToken, token1: RToken,
                  tick_spacing: int, fee: int,
@@ -58,6 +86,8 @@ class UniswapV3LP(ILiquidityPool):
             self.slots_dict: Dict[int, Tuple[int, int]] = {}
         else:
             self.slots_dict: Dict[int, (int, int)] = initial_slots.copy()
+        self.sorted_ticks: List[int] = sorted(self.slots_dict)
+        self.curves: Dict[bool, SwapCurve] = {}
         if slot_bitmap is None:
             self.slot_bitmap: Dict[int, int] = {}
         else:
@@ -90,13 +120,22 @@ class UniswapV3LP(ILiquidityPool):
         self.sqrtPriceX96 = sqrtPriceX96
         self.reserves0 = reserves0
         self.reserves1 = reserves1
+        self.invalidate_swap_curves()
 
     def check_mutable_init(self) -> bool:
         return type(self.current_tick) == int and type(self.liquidity) == int and type(
             self.sqrtPriceX96) == int and type(self.reserves0) == int and type(self.reserves1) == int
 
     def set_slot_value(self, slot_num: int, net_liquidity: int, gross_liquidity: int):
+        if slot_num not in self.slots_dict:
+            insort(self.sorted_ticks, slot_num)
         self.slots_dict[slot_num] = (net_liquidity, gross_liquidity)
+        self.invalidate_swap_curves()
+
+    def remove_slot(self, slot_num: int):
+        self.slots_dict.pop(slot_num)
+        del self.sorted_ticks[bisect_left(self.sorted_ticks, slot_num)]
+        self.invalidate_swap_curves()
 
     def set_bitmap_value(self, bitmap_num: int, bitmap_value: int):
         self.slot_bitmap[bitmap_num] = bitmap_value
@@ -151,118 +190,124 @@ class UniswapV3LP(ILiquidityPool):
         x_reserves = (self.liquidity << 96) // self.sqrtPriceX96
         return x_reserves, y_reserves
 
-    # TODO TEST
     def get_next_tick(self, current_tick: int, spacing: int, direction: bool) -> int:
         """gets the next initialised tick from the current tick in the direction given by 'direction' - True = Right,
-        False = Left"""
-        min_tick_to_use = min(self.slots_dict.keys())
-        max_tick_to_use = max(self.slots_dict.keys())
-        if current_tick >= max_tick_to_use:
+        False = Left. The tick returned is strictly above or below current_tick, whether or not current_tick is a
+        multiple of the spacing"""
+        ticks = self.sorted_ticks
+        if not ticks or current_tick >= ticks[-1]:
             raise UninitialisedSlotError("No tick above current_tick exists in this liquidity pool!")
-        if current_tick <= min_tick_to_use:
+        if current_tick <= ticks[0]:
             raise UninitialisedSlotError("No tick below current_tick exists in this liquidity pool!")
-        bitmap_tick_key = (current_tick // spacing) // 256
-        bitmap_tick_index = (current_tick // spacing) % 256
         if direction:
-            bitmap_tick_index += 1
-        else:
-            bitmap_tick_index -= 1
-        while True:
-            if bitmap_tick_key not in self.slot_bitmap:
-                raise UninitialisedBitmapError(f"Attempted to get an uninitialised bitmap for lp {self.address}")
-            else:
-                current_bitmap = self.slot_bitmap[bitmap_tick_key]
-            t = (1 << bitmap_tick_index) & current_bitmap
-            while (t == 0 and bitmap_tick_index > 0 and not direction) or (
-                    t == 0 and bitmap_tick_index < 255 and direction):
-                if direction:
-                    bitmap_tick_index += 1
-                else:
-                    bitmap_tick_index -= 1
-                t = (1 << bitmap_tick_index) & current_bitmap
-            if t != 0:
-                return (bitmap_tick_index * spacing) + (bitmap_tick_key * spacing * 256)
-            else:
-                if direction:
-                    bitmap_tick_index = 0
-                    bitmap_tick_key += 1
-                else:
-                    bitmap_tick_index = 255
-                    bitmap_tick_key -= 1
-
-    # -- TODO Test
+            return ticks[bisect_right(ticks, current_tick)]
+        return ticks[bisect_left(ticks, current_tick) - 1]
+
+    def get_swap_curve(self, direction: bool, amount: int, exact_output: bool = False) -> SwapCurve:
+        """the cached swap curve for swapping token0 for token1 (True) or token1 for token0 (False), extended through
+        ticks until it covers an input (or output if exact_output) of amount or runs to the end of the tick range"""
+        curve = self.curves.get(direction)
+        if curve is None:
+            curve = self.curves[direction] = SwapCurve(self.current_tick, self.sqrtPriceX96, self.liquidity)
+        covered = curve.amounts_out if exact_output else curve.amounts_in
+        # the tick search direction is True when token1 goes in
+        right = not direction
+        while not curve.complete and covered[-1] < amount:
+            try:
+                next_tick = self.get_next_tick(curve.tick, self.tick_spacing, right)
+            except UninitialisedSlotError:
+                next_tick = 887272 if right else -887272
+                curve.complete = True
+            target = em.getSqrtRatioAtTickCached(next_tick)
+            amount_in, amount_out, new_price, fee = em.computeSwapStep(curve.price, target, curve.liquidity,
+                                                                       em.max_256_bits, self.fee)
+            curve.prices.append(curve.price)
+            curve.targets.append(target)
+            curve.liquidities.append(curve.liquidity)
+            curve.amounts_in.append(curve.amounts_in[-1] + amount_in + fee)
+            curve.amounts_out.append(curve.amounts_out[-1] + amount_out)
+            curve.tick = next_tick
+            curve.price = new_price
+            if not curve.complete:
+                curve.liquidity += self.slots_dict[next_tick][0] if right else -self.slots_dict[next_tick][0]
+        return curve
+
+    def invalidate_swap_curves(self):
+        self.curves = {}
+
+    def quote_swap_curve(self, curve: SwapCurve, amount: int) -> int:
+        """binary searches for the step the amount runs out in and finishes it with one swap step. A step which reaches
+        its target costs the same whatever the amount remaining, so this matches walking the ticks exactly"""
+        step = bisect_left(curve.amounts_in, amount, 1) - 1
+        if step == len(curve.prices):
+            # past the end of the tick range, the swap stops at the last step
+            step -= 1
+        amount_out = em.computeSwapStep(curve.prices[step], curve.targets[step], curve.liquidities[step],
+                                        amount - curve.amounts_in[step], self.fee)[1]
+        return curve.amounts_out[step] + amount_out
+
+    def quote_swap_curve_exact_out(self, curve: SwapCurve, amount: int) -> int:
+        """the input needed for an output of amount, found the same way as quote_swap_curve using SwapMath's exact
+        output branch for the last step"""
+        step = bisect_left(curve.amounts_out, amount, 1) - 1
+        if step == len(curve.prices):
+            raise InsufficientLiquidity(f"Pool {self.address} can't output {amount}, at most {curve.amounts_out[-1]}")
+        amount_in, _, _, fee = em.computeSwapStep(curve.prices[step], curve.targets[step], curve.liquidities[step],
+                                                  curve.amounts_out[step] - amount, self.fee)
+        return curve.amounts_in[step] + amount_in + fee
+
     def get_virtual_reserves_with_bounds(self, direction: bool, max_input: int) -> List[Tuple[int, Tuple[int, int]]]:
         """from the current price, gets a list of tuples with first element being the lower bound input amount needed to get
          to that tick, and the second element being the virtual reserves between the lower bound and the next bound in the list
          (or the max input if last element in the list). The direction parameter specifies whether we are swapping token0
          for token1 (True) or token1 for token0 (False)"""
-        price_at_current_tick = self.sqrtPriceX96
-        current_slot = self.current_tick
-        current_change = 0
+        curve = self.get_swap_curve(direction, max_input)
         out_list = []
-        current_liquidity = self.liquidity
-        direction = not direction
-
-        while current_change < max_input:
-            next_tick = self.get_next_tick(current_slot, self.tick_spacing, direction)
-            price_at_next_tick = em.getSqrtRatioAtTick(next_tick)
-            # Maybe roundup is required for this part
-            if direction:
-                amount_one_delta = em.getAmount1Delta(price_at_current_tick, price_at_next_tick, current_liquidity, True)
-                amount_one_delta_with_fee = (amount_one_delta * 1000000) // (1000000 - self.fee)
-                res0, res1 = calculate_virtual_reserves(current_liquidity, price_at_current_tick)
-                out_list.append((current_change, (res1, res0)))
-                current_change += amount_one_delta_with_fee
-                price_at_current_tick = price_at_next_tick
-                # change liquidity
-                current_liquidity += self.get_tick(next_tick)[0]
-                current_slot = next_tick
-
-            else:
-                amount_zero_delta = em.getAmount0Delta(price_at_next_tick, price_at_current_tick, current_liquidity, True)
-                amount_zero_delta_with_fee = (amount_zero_delta * 1000000) // (1000000 - self.fee)
-                out_list.append((current_change, calculate_virtual_reserves(current_liquidity, price_at_current_tick)))
-                current_change += amount_zero_delta_with_fee
-                price_at_current_tick = price_at_next_tick
-                # change liquidity
-                current_liquidity -= self.get_tick(next_tick)[0]
-                current_slot = next_tick
+        for step in range(len(curve.prices)):
+            if curve.amounts_in[step] >= max_input:
+                break
+            out_list.append((curve.amounts_in[step],
+                             calculate_virtual_reserves(curve.liquidities[step], curve.prices[step])))
         return out_list
 
     def swap(self, token0_in: int, token1_in: int) -> int:
         pass
 
     def simulate_swap(self, token0_in: int, token1_in: int) -> int:
-        # first get price at next tick
         if token0_in == 0 and token1_in == 0:
             return 0
         if token0_in <= 0 and token1_in <= 0:
             raise NotImplementedError("Only supports positive swaps!")
-        direction = token1_in > 0
-        amount_remaining = token1_in if direction else token0_in
-        current_tick = self.current_tick
-        current_price = self.sqrtPriceX96
-        current_liquidity = self.liquidity
-        if current_liquidity == 0:
+        if self.liquidity == 0:
             raise NoLiquidity("Zero liquidity available for the swap")
-        total_out = 0
-        skip = False
-        while amount_remaining > 0:
-            try:
-                tick_above = self.get_next_tick(current_tick, self.tick_spacing, direction)
-            except UninitialisedSlotError:
-                tick_above = 887272 if direction else -887272
-                skip = True
-            price_above = em.getSqrtRatioAtTick(tick_above)
-            amount_in, amount_out, new_price, fee = em.computeSwapStep(current_price, price_above, current_liquidity, amount_remaining, self.fee)
-            amount_remaining -= (amount_in + fee)
-            total_out += amount_out
-            if skip:
-                break
-            current_tick = tick_above
-            current_price = new_price
-            current_liquidity = current_liquidity + self.slots_dict[tick_above][0] if direction else current_liquidity - self.slots_dict[tick_above][0]
-        return total_out
+        direction = token1_in <= 0
+        amount = token0_in if direction else token1_in
+        return self.quote_swap_curve(self.get_swap_curve(direction, amount), amount)
+
+    def simulate_swap_exact_out(self, token0_out: int, token1_out: int) -> int:
+        """the amount of the other token which has to go in for exactly token0_out or token1_out to come out, as the
+        router's exact output swaps charge it"""
+        if token0_out == 0 and token1_out == 0:
+            return 0
+        if token0_out < 0 or token1_out < 0 or (token0_out > 0 and token1_out > 0):
+            raise NotImplementedError("Only supports a positive amount of one token out!")
+        if self.liquidity == 0:
+            raise NoLiquidity("Zero liquidity available for the swap")
+        # token1 out means token0 goes in
+        direction = token1_out > 0
+        amount = token1_out if direction else token0_out
+        return self.quote_swap_curve_exact_out(self.get_swap_curve(direction, amount, True), amount)
+
+    def simulate_swap_many(self, amounts: List[int], direction: bool) -> List[int]:
+        """simulate_swap for each amount in, of token0 if direction is True and token1 otherwise"""
+        if any(a < 0 for a in amounts):
+            raise NotImplementedError("Only supports positive swaps!")
+        if not any(amounts):
+            return [0] * len(amounts)
+        if self.liquidity == 0:
+            raise NoLiquidity("Zero liquidity available for the swap")
+        curve = self.get_swap_curve(direction, max(amounts))
+        return [self.quote_swap_curve(curve, a) if a else 0 for a in amounts]
 
     def simulate_swap_price(self, token0_in: int, token1_in: int) -> int:
         if token0_in == 0 and token1_in == 0:
@@ -282,7 +327,7 @@ class UniswapV3LP(ILiquidityPool):
             except UninitialisedSlotError:
                 tick_above = 887272 if direction else -887272
                 skip = True
-            price_above = em.getSqrtRatioAtTick(tick_above)
+            price_above = em.getSqrtRatioAtTickCached(tick_above)
             amount_in, amount_out, new_price, fee = em.computeSwapStep(current_price, price_above, current_liquidity, amount_remaining, self.fee)
             amount_remaining -= (amount_in + fee)
             if skip:
@@ -301,11 +346,13 @@ class UniswapV3LP(ILiquidityPool):
         self.reserves1 = 0
         self.liquidity = 0
         self.slot_bitmap = defaultdict(int)
+        self.invalidate_swap_curves()
 
     def mint_event(self, tick_lower: int, tick_upper: int, liquidity: int, amount0: int, amount1: int):
         """Update the liquidity pool based on a mint event"""
         if not self.check_mutable_init():
             raise UninitialisedMutableError("Mutable variables are not set for mint event")
+        self.invalidate_swap_curves()
         self.reserves0 += amount0
         self.reserves1 += amount1
         tick_lower_values = self.get_tick(tick_lower)
@@ -313,20 +360,21 @@ class UniswapV3LP(ILiquidityPool):
         if tick_upper > self.current_tick >= tick_lower:
             self.liquidity += liquidity
         if tick_lower_values[1] == 0:
-            self.slots_dict[tick_lower] = (liquidity, liquidity)
+            self.set_slot_value(tick_lower, liquidity, liquidity)
             self.toggle_bitmap_tick(tick_lower)
         else:
-            self.slots_dict[tick_lower] = (tick_lower_values[0] + liquidity, tick_lower_values[1] + liquidity)
+            self.set_slot_value(tick_lower, tick_lower_values[0] + liquidity, tick_lower_values[1] + liquidity)
         if tick_upper_values[1] == 0:
-            self.slots_dict[tick_upper] = (-liquidity, liquidity)
+            self.set_slot_value(tick_upper, -liquidity, liquidity)
             self.toggle_bitmap_tick(tick_upper)
         else:
-            self.slots_dict[tick_upper] = (tick_upper_values[0] - liquidity, tick_upper_values[1] + liquidity)
+            self.set_slot_value(tick_upper, tick_upper_values[0] - liquidity, tick_upper_values[1] + liquidity)
 
     def burn_event(self, tick_lower: int, tick_upper: int, liquidity: int, amount0: int, amount1: int):
         """Update the liquidity pool based on a burn event"""
         if not self.check_mutable_init():
             raise UninitialisedMutableError("Mutable variables are not set for mint event")
+        self.invalidate_swap_curves()
         # self.reserves0 -= amount0
         # self.reserves1 -= amount1
         tick_lower_values = self.get_tick(tick_lower)
@@ -336,15 +384,15 @@ class UniswapV3LP(ILiquidityPool):
         if tick_lower_values[1] == 0 or tick_upper_values[1] == 0:
             raise UninitialisedSlotError("Attempted to burn an uninitialised tick")
         if tick_lower_values[1] - liquidity == 0:
-            self.slots_dict.pop(tick_lower)
+            self.remove_slot(tick_lower)
             self.toggle_bitmap_tick(tick_lower)
         else:
-            self.slots_dict[tick_lower] = (tick_lower_values[0] - liquidity, tick_lower_values[1] - liquidity)
+            self.set_slot_value(tick_lower, tick_lower_values[0] - liquidity, tick_lower_values[1] - liquidity)
         if tick_upper_values[1] - liquidity == 0:
-            self.slots_dict.pop(tick_upper)
+            self.remove_slot(tick_upper)
             self.toggle_bitmap_tick(tick_upper)
         else:
-            self.slots_dict[tick_upper] = (tick_upper_values[0] + liquidity, tick_upper_values[1] - liquidity)
+            self.set_slot_value(tick_upper, tick_upper_values[0] + liquidity, tick_upper_values[1] - liquidity)
 
     def swap_event(self, amount0: int, amount1: int, sqrtPriceX96: int, liquidity: int, tick: int):
         """Update the liquidity pool based on a swap event"""
@@ -353,6 +401,7 @@ class UniswapV3LP(ILiquidityPool):
         self.sqrtPriceX96 = sqrtPriceX96
         self.liquidity = liquidity
         self.current_tick = tick
+        self.invalidate_swap_curves()
 
     def flash_event(self, paid0: int, paid1: int):
         self.reserves0 += paid0
@@ -363,7 +412,7 @@ class UniswapV3LP(ILiquidityPool):
         self.reserves1 -= reserves1
 
     def to_json(self) -> str:
-        return json.dumps({
+        return json_codec.dumps({
             "address": str(self.address),
             "token0": str(self.token0),
             "token1": str(self.token1),
@@ -381,7 +430,7 @@ class UniswapV3LP(ILiquidityPool):
 
 
 def v3_from_json(json_str: str) -> UniswapV3LP:
-    jd = json.loads(json_str)
+    jd = json_codec.loads(json_str)
     slot_bitmap = jd["slot_bitmap"]
     slot_bitmap = {int(k): v for k, v in slot_bitmap.items()}
     slots_dict = jd["slots_dict"]
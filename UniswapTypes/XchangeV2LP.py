@@ -1,4 +1,4 @@
-import json
+import Utilities.JsonCodec as json_codec
 from typing import Union, Optional
 from UniswapTypes.RToken import RToken
 from UniswapTypes.UniswapV2LP import UniswapV2LP
@@ -14,7 +14,7 @@ class XchangeV2LP(UniswapV2LP):
         self.fees_as_fraction = (100000 - 200, 100000)
 
     def to_json(self) -> str:
-        return json.dumps({
+        return json_codec.dumps({
             "address": str(self.address),
             "token0": str(self.token0),
             "token1": str(self.token1),
@@ -25,7 +25,7 @@ class XchangeV2LP(UniswapV2LP):
 
 
 def xchange_v2_from_json(json_str: str) -> XchangeV2LP:
-    obj_dict = json.loads(json_str)
+    obj_dict = json_codec.loads(json_str)
     return XchangeV2LP(Address(obj_dict["address"]),
                        RToken(obj_dict["token0"]),
                        RToken(obj_dict["token1"]),
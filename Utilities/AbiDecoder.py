@@ -0,0 +1,101 @@
+"""Decoders compiled from abi type lists. Static layouts (tuples of uintN, intN, address, bool and bytesN) are decoded
+by slicing 32 byte words and converting them with int.from_bytes, skipping eth_abi entirely. Layouts with a dynamic
+type return no decoder so the caller can fall back to eth_abi."""
+
+import re
+from typing import Dict, Tuple, Optional, Callable
+from eth_abi.exceptions import InsufficientDataBytes
+from Web3Types.SimpleTypes import HexBytes, Address
+
+_INT_TYPE = re.compile(r"^(u?)int(\d*)$")
+_BYTES_TYPE = re.compile(r"^bytes(\d+)$")
+
+
+def parse_static_type(arg_type: str) -> Optional[Tuple[str, int]]:
+    """splits a static word type into its kind (address, bool, uint, int or bytes) and its size, the bit width for
+    integers and the byte length for bytesN. None for anything which isn't a single static word. Shared with
+    CalldataBuilder so the encoder and decoder accept the same types"""
+    if arg_type == "address" or arg_type == "bool":
+        return arg_type, 0
+    int_match = _INT_TYPE.match(arg_type)
+    if int_match is not None:
+        return ("uint" if int_match.group(1) else "int"), int(int_match.group(2) or 256)
+    bytes_match = _BYTES_TYPE.match(arg_type)
+    if bytes_match is not None and 0 < int(bytes_match.group(1)) <= 32:
+        return "bytes", int(bytes_match.group(1))
+    return None
+
+
+def _decode_uint_word(word: bytes) -> int:
+    return int.from_bytes(word, "big")
+
+
+def _decode_int_word(word: bytes) -> int:
+    # abi encoded signed integers (including int24 and int128) are sign extended to the full word
+    return int.from_bytes(word, "big", signed=True)
+
+
+def _decode_bool_word(word: bytes) -> bool:
+    return int.from_bytes(word, "big") != 0
+
+
+def _decode_address_word(word: bytes) -> Address:
+    return Address(HexBytes(word[12:]))
+
+
+def _bytes_word_decoder(size: int) -> Callable:
+    def decode(word: bytes) -> bytes:
+        return word[:size]
+    return decode
+
+
+def get_word_decoder(arg_type: str) -> Optional[Callable]:
+    """gets a function that decodes a single 32 byte word of a static type, or None for dynamic types"""
+    static_type = parse_static_type(arg_type)
+    if static_type is None:
+        return None
+    kind, size = static_type
+    if kind == "address":
+        return _decode_address_word
+    if kind == "bool":
+        return _decode_bool_word
+    if kind == "uint":
+        return _decode_uint_word
+    if kind == "int":
+        return _decode_int_word
+    return _bytes_word_decoder(size)
+
+
+class StaticDecoder:
+    """Decodes a static layout of 32 byte words"""
+
+    __slots__ = ("types", "word_decoders", "size")
+
+    def __init__(self, types: Tuple[str, ...], word_decoders: Tuple[Callable, ...]):
+        self.types: Tuple[str, ...] = types
+        self.word_decoders: Tuple[Callable, ...] = word_decoders
+        self.size: int = 32 * len(word_decoders)
+
+    def decode(self, data: bytes) -> Tuple:
+        if len(data) < self.size:
+            raise InsufficientDataBytes(f"Tried to read {self.size} bytes, only got {len(data)} bytes.")
+        return tuple(decoder(data[i:i + 32]) for decoder, i in zip(self.word_decoders, range(0, self.size, 32)))
+
+    def decode_words(self, words) -> Tuple:
+        """decodes a sequence of individual words, e.g. the indexed topics of a log"""
+        return tuple(decoder(bytes(word)) for decoder, word in zip(self.word_decoders, words))
+
+
+# types -> decoder, None is cached for layouts which need eth_abi
+_STATIC_DECODERS: Dict[Tuple[str, ...], Optional[StaticDecoder]] = {}
+
+
+def get_static_decoder(types: Tuple[str, ...]) -> Optional[StaticDecoder]:
+    try:
+        return _STATIC_DECODERS[types]
+    except KeyError:
+        pass
+    word_decoders = tuple(get_word_decoder(t) for t in types)
+    decoder = None if None in word_decoders else StaticDecoder(types, word_decoders)
+    _STATIC_DECODERS[types] = decoder
+    return decoder
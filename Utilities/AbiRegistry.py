@@ -0,0 +1,234 @@
+import json
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Tuple, Optional, Iterator, Union
+from web3 import Web3
+from Web3Types.SimpleTypes import HexBytes
+
+
+class BadFunctionCall(Exception):
+    pass
+
+
+class ImmutableAbiError(AttributeError):
+    pass
+
+
+def _freeze(value):
+    """recursively converts json dicts and lists into read only mappings and tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def canonical_type(param: Mapping) -> str:
+    """gets the canonical type of an abi parameter, expanding tuple types into their component types"""
+    param_type = param['type']
+    if param_type.startswith("tuple"):
+        components = ",".join(canonical_type(c) for c in param['components'])
+        return f"({components}){param_type[5:]}"
+    return param_type
+
+
+@lru_cache(maxsize=None)
+def keccak_prototype(prototype: str) -> bytes:
+    """keccak hash of a function or event prototype, memoized as there are only a handful of distinct prototypes"""
+    return bytes(Web3.keccak(text=prototype))
+
+
+def topic_key(topic: Union[HexBytes, bytes, str]) -> bytes:
+    """normalises a topic given as a HexBytes, bytes or hex string so it can be used to index the topic tables"""
+    if isinstance(topic, str):
+        return bytes.fromhex(topic[2:])
+    return bytes(topic)
+
+
+class AbiEntry(Mapping):
+    """An immutable, compiled entry of a contract abi. Behaves exactly like the original abi dictionary so can be passed
+    to any of the FunctionCallBuilder helpers."""
+
+    __slots__ = ("_entry", "name", "entry_type", "input_types", "prototype")
+
+    def __init__(self, entry: Dict):
+        frozen = _freeze(entry)
+        object.__setattr__(self, "_entry", frozen)
+        object.__setattr__(self, "name", entry.get('name'))
+        object.__setattr__(self, "entry_type", entry['type'])
+        input_types = tuple(canonical_type(i) for i in entry.get('inputs', ()))
+        object.__setattr__(self, "input_types", input_types)
+        if self.name is None:
+            object.__setattr__(self, "prototype", None)
+        else:
+            object.__setattr__(self, "prototype", f"{self.name}({','.join(input_types)})")
+
+    def __setattr__(self, key, value):
+        raise ImmutableAbiError("Compiled abi entries are immutable")
+
+    def __getitem__(self, item):
+        return self._entry[item]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._entry)
+
+    def __len__(self) -> int:
+        return len(self._entry)
+
+    def __repr__(self):
+        return f"{self.entry_type} {self.prototype}"
+
+    def __eq__(self, other):
+        if isinstance(other, AbiEntry):
+            return self._entry == other._entry
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.entry_type, self.prototype))
+
+
+class AbiFunction(AbiEntry):
+    """Compiled abi function, including its 4 byte selector"""
+
+    __slots__ = ("output_types", "selector")
+
+    def __init__(self, entry: Dict):
+        super().__init__(entry)
+        object.__setattr__(self, "output_types", tuple(canonical_type(o) for o in entry.get('outputs', ())))
+        object.__setattr__(self, "selector", HexBytes(keccak_prototype(self.prototype)[:4]))
+
+
+class AbiEvent(AbiEntry):
+    """Compiled abi event, including its topic"""
+
+    __slots__ = ("indexed_types", "data_types", "topic")
+
+    def __init__(self, entry: Dict):
+        super().__init__(entry)
+        object.__setattr__(self, "indexed_types", tuple(canonical_type(i) for i in entry['inputs'] if i['indexed']))
+        object.__setattr__(self, "data_types", tuple(canonical_type(i) for i in entry['inputs'] if not i['indexed']))
+        object.__setattr__(self, "topic", HexBytes(keccak_prototype(self.prototype)))
+
+
+def compile_abi_entry(entry: Dict) -> AbiEntry:
+    if entry['type'] == 'function':
+        return AbiFunction(entry)
+    elif entry['type'] == 'event':
+        return AbiEvent(entry)
+    else:
+        return AbiEntry(entry)
+
+
+class AbiContract(Sequence):
+    """A compiled contract abi. Iterating gives the compiled entries in the same order as the abi file.
+    Functions are indexed by (name, number of inputs) and by selector, events by name and by topic."""
+
+    __slots__ = ("contract_type", "entries", "functions", "events", "functions_by_selector", "events_by_topic")
+
+    def __init__(self, contract_type: str, abi: list):
+        self.contract_type: str = contract_type
+        self.entries: Tuple[AbiEntry, ...] = tuple(compile_abi_entry(e) for e in abi)
+        self.functions: Dict[Tuple[str, Optional[int]], AbiFunction] = {}
+        self.events: Dict[str, AbiEvent] = {}
+        self.functions_by_selector: Dict[bytes, AbiFunction] = {}
+        self.events_by_topic: Dict[bytes, AbiEvent] = {}
+        for entry in self.entries:
+            if isinstance(entry, AbiFunction):
+                self.functions[(entry.name, len(entry.input_types))] = entry
+                # mirrors the linear search which returns the last function with a matching name
+                self.functions[(entry.name, None)] = entry
+                self.functions_by_selector[bytes(entry.selector)] = entry
+            elif isinstance(entry, AbiEvent):
+                self.events[entry.name] = entry
+                self.events_by_topic[bytes(entry.topic)] = entry
+
+    def __getitem__(self, item):
+        return self.entries[item]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[AbiEntry]:
+        return iter(self.entries)
+
+    def __repr__(self):
+        return f"abi for {self.contract_type}"
+
+    def get_function(self, function_name: str, input_params: Optional[int] = None) -> AbiFunction:
+        try:
+            return self.functions[(function_name, input_params)]
+        except KeyError:
+            raise BadFunctionCall("Couldn't find correct function")
+
+    def get_event(self, event_name: str) -> AbiEvent:
+        try:
+            return self.events[event_name]
+        except KeyError:
+            raise BadFunctionCall(f"Couldn't find event {event_name} in the {self.contract_type} abi")
+
+    def function_by_selector(self, selector: Union[HexBytes, bytes, str]) -> Optional[AbiFunction]:
+        return self.functions_by_selector.get(topic_key(selector)[:4])
+
+    def event_by_topic(self, topic: Union[HexBytes, bytes, str]) -> Optional[AbiEvent]:
+        return self.events_by_topic.get(topic_key(topic))
+
+
+class AbiRegistry:
+    """Process wide store of compiled contract abis. The abi file is only read the first time a contract is requested,
+    after which all lookups are dictionary accesses. hits and misses count contract lookups so that it is easy to
+    check nothing is re-reading the abi file."""
+
+    __slots__ = ("abi_filename", "_raw_abis", "_contracts", "_events_by_topic", "hits", "misses")
+
+    def __init__(self, abi_filename: str):
+        self.abi_filename: str = abi_filename
+        self._raw_abis: Optional[Dict] = None
+        self._contracts: Dict[str, AbiContract] = {}
+        self._events_by_topic: Optional[Dict[bytes, AbiEvent]] = None
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get_contract(self, contract_type: str) -> AbiContract:
+        try:
+            contract = self._contracts[contract_type]
+            self.hits += 1
+            return contract
+        except KeyError:
+            self.misses += 1
+        contract = AbiContract(contract_type, self._load_raw_abis()[contract_type])
+        self._contracts[contract_type] = contract
+        return contract
+
+    def get_function(self, contract_type: str, function_name: str, input_params: Optional[int] = None) -> AbiFunction:
+        return self.get_contract(contract_type).get_function(function_name, input_params)
+
+    def get_event(self, contract_type: str, event_name: str) -> AbiEvent:
+        return self.get_contract(contract_type).get_event(event_name)
+
+    def event_by_topic(self, topic: Union[HexBytes, bytes, str]) -> Optional[AbiEvent]:
+        """reverse lookup from a log topic to its event over every contract in the abi file. Events shared between
+        contracts (e.g. Transfer) resolve to the first contract in the file that declares them"""
+        if self._events_by_topic is None:
+            events_by_topic = {}
+            for contract_type in self.contract_types():
+                for key, event in self.get_contract(contract_type).events_by_topic.items():
+                    events_by_topic.setdefault(key, event)
+            self._events_by_topic = events_by_topic
+        return self._events_by_topic.get(topic_key(topic))
+
+    def _load_raw_abis(self) -> Dict:
+        if self._raw_abis is None:
+            with open(self.abi_filename) as abi:
+                self._raw_abis = json.loads(abi.read())
+        return self._raw_abis
+
+    def contract_types(self):
+        return self._load_raw_abis().keys()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "contracts": len(self._contracts)}
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,145 @@
+"""Fast path calldata encoding for functions whose inputs are all static 32 byte words (uintN, intN, address, bool
+and bytesN). These skip eth_abi entirely and write the precomputed selector followed by each word straight into a
+bytes buffer. Anything with a dynamic input falls back to FunctionCallBuilder.create_function_call."""
+
+from typing import Dict, Tuple, Optional, Callable, Union
+import Utilities.FunctionCallBuilder as fcb
+from Utilities.AbiDecoder import parse_static_type
+from Utilities.AbiRegistry import AbiFunction, BadFunctionCall
+from Web3Types.SimpleTypes import HexBytes, Address
+
+_ADDRESS_PADDING = bytes(12)
+
+
+def _uint_word_encoder(bits: int) -> Callable:
+    upper = 1 << bits
+
+    def encode(value: int) -> bytes:
+        if not 0 <= value < upper:
+            raise BadFunctionCall(f"{value} is out of bounds for uint{bits}")
+        return value.to_bytes(32, "big")
+    return encode
+
+
+def _int_word_encoder(bits: int) -> Callable:
+    lower = -(1 << (bits - 1))
+    upper = 1 << (bits - 1)
+
+    def encode(value: int) -> bytes:
+        if not lower <= value < upper:
+            raise BadFunctionCall(f"{value} is out of bounds for int{bits}")
+        return value.to_bytes(32, "big", signed=True)
+    return encode
+
+
+def _bytes_word_encoder(size: int) -> Callable:
+    def encode(value: Union[bytes, HexBytes, str]) -> bytes:
+        value = bytes.fromhex(value[2:]) if isinstance(value, str) else bytes(value)
+        if len(value) > size:
+            raise BadFunctionCall(f"{len(value)} bytes is too long for bytes{size}")
+        return value + bytes(32 - len(value))
+    return encode
+
+
+def _encode_bool_word(value: bool) -> bytes:
+    if type(value) != bool:
+        raise BadFunctionCall(f"{value} is not a bool")
+    return (1 if value else 0).to_bytes(32, "big")
+
+
+def _encode_address_word(value: Union[Address, HexBytes, bytes, str]) -> bytes:
+    value = bytes.fromhex(value[2:]) if isinstance(value, str) else bytes(value)
+    if len(value) != 20:
+        raise BadFunctionCall(f"Addresses are 20 bytes long, given address = {len(value)} bytes!")
+    return _ADDRESS_PADDING + value
+
+
+def get_word_encoder(arg_type: str) -> Optional[Callable]:
+    """gets a function that encodes a single static argument into a 32 byte word, or None for dynamic types"""
+    static_type = parse_static_type(arg_type)
+    if static_type is None:
+        return None
+    kind, size = static_type
+    if kind == "address":
+        return _encode_address_word
+    if kind == "bool":
+        return _encode_bool_word
+    if kind == "uint":
+        return _uint_word_encoder(size)
+    if kind == "int":
+        return _int_word_encoder(size)
+    return _bytes_word_encoder(size)
+
+
+class StaticCallEncoder:
+    """Encodes calls to a single function with only static word arguments"""
+
+    __slots__ = ("selector", "word_encoders")
+
+    def __init__(self, selector: bytes, word_encoders: Tuple[Callable, ...]):
+        self.selector: bytes = selector
+        self.word_encoders: Tuple[Callable, ...] = word_encoders
+
+    def encode(self, args: Tuple) -> HexBytes:
+        if len(args) != len(self.word_encoders):
+            raise BadFunctionCall("Incorrect number of arguments")
+        buffer = bytearray(self.selector)
+        for word_encoder, arg in zip(self.word_encoders, args):
+            buffer += word_encoder(arg)
+        return HexBytes(bytes(buffer))
+
+
+# selector -> encoder, None is cached for functions which need the generic path
+_STATIC_ENCODERS: Dict[bytes, Optional[StaticCallEncoder]] = {}
+
+
+def get_static_encoder(abi_function: AbiFunction) -> Optional[StaticCallEncoder]:
+    selector = bytes(abi_function.selector)
+    try:
+        return _STATIC_ENCODERS[selector]
+    except KeyError:
+        pass
+    word_encoders = tuple(get_word_encoder(t) for t in abi_function.input_types)
+    encoder = None if None in word_encoders else StaticCallEncoder(selector, word_encoders)
+    _STATIC_ENCODERS[selector] = encoder
+    return encoder
+
+
+def encode_function_call(abi_function: Dict, *args) -> HexBytes:
+    """Drop in replacement for FunctionCallBuilder.create_function_call which takes the fast path whenever possible"""
+    if isinstance(abi_function, AbiFunction):
+        encoder = get_static_encoder(abi_function)
+        if encoder is not None:
+            return encoder.encode(args)
+    return fcb.create_function_call(abi_function, *args)
+
+
+# Specialised encoders for the calls issued in bulk when loading and updating pools
+SLOT0_SELECTOR = bytes(fcb.get_abi_function("slot0", "V3LiquidityPool").selector)
+TICK_BITMAP_SELECTOR = bytes(fcb.get_abi_function("tickBitmap", "V3LiquidityPool").selector)
+TICKS_SELECTOR = bytes(fcb.get_abi_function("ticks", "V3LiquidityPool").selector)
+GET_RESERVES_SELECTOR = bytes(fcb.get_abi_function("getReserves", "liquidityPool").selector)
+BALANCE_OF_SELECTOR = bytes(fcb.get_abi_function("balanceOf", "token").selector)
+
+_encode_int16_word = _int_word_encoder(16)
+_encode_int24_word = _int_word_encoder(24)
+
+
+def encode_slot0() -> HexBytes:
+    return HexBytes(SLOT0_SELECTOR)
+
+
+def encode_get_reserves() -> HexBytes:
+    return HexBytes(GET_RESERVES_SELECTOR)
+
+
+def encode_tick_bitmap(word_position: int) -> HexBytes:
+    return HexBytes(TICK_BITMAP_SELECTOR + _encode_int16_word(word_position))
+
+
+def encode_ticks(tick: int) -> HexBytes:
+    return HexBytes(TICKS_SELECTOR + _encode_int24_word(tick))
+
+
+def encode_balance_of(owner: Union[Address, HexBytes, bytes, str]) -> HexBytes:
+    return HexBytes(BALANCE_OF_SELECTOR + _encode_address_word(owner))
@@ -1,7 +1,15 @@
-from typing import Tuple
+from functools import lru_cache
+from typing import Tuple, List, Iterable
 
 max_256_bits = 0xffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff
 
+MIN_TICK = -887272
+MAX_TICK = 887272
+
+# sqrt prices are uint160 so each entry of a precomputed table takes 20 bytes
+SQRT_RATIO_BYTES = 20
+SQRT_RATIO_CACHE_SIZE = 1 << 16
+
 
 class MathError(Exception):
     pass
@@ -57,6 +65,41 @@ def getSqrtRatioAtTick(tick: int) -> int:
     return sqrtPriceX96
 
 
+# (spacing, index of tick 0, packed sqrt ratios of every multiple of spacing in the tick range)
+sqrt_ratio_tables: List[Tuple[int, int, bytes]] = []
+
+
+def precompute_sqrt_ratios(spacings: Iterable[int] = (1, 10, 60, 200)):
+    """packs the sqrt ratio of every tick which is a multiple of each spacing into a table shared by all pools. A
+    spacing which is a multiple of one already tabled is skipped, so (10, 60, 200) builds a single table of about 3.5MB
+    while spacing 1 takes ten times that and several seconds to build"""
+    for spacing in sorted(spacings):
+        if any(spacing % tabled == 0 for tabled, _, _ in sqrt_ratio_tables):
+            continue
+        offset = MAX_TICK // spacing
+        table = b"".join(getSqrtRatioAtTick(tick).to_bytes(SQRT_RATIO_BYTES, "big")
+                         for tick in range(-offset * spacing, MAX_TICK + 1, spacing))
+        sqrt_ratio_tables.append((spacing, offset, table))
+        sqrt_ratio_tables.sort()
+
+
+def clear_sqrt_ratio_cache():
+    sqrt_ratio_tables.clear()
+    _cached_sqrt_ratio.cache_clear()
+
+
+_cached_sqrt_ratio = lru_cache(maxsize=SQRT_RATIO_CACHE_SIZE)(getSqrtRatioAtTick)
+
+
+def getSqrtRatioAtTickCached(tick: int) -> int:
+    """getSqrtRatioAtTick read from the precomputed tables when tick is on one, otherwise from a bounded lru cache"""
+    for spacing, offset, table in sqrt_ratio_tables:
+        if tick % spacing == 0:
+            start = (tick // spacing + offset) * SQRT_RATIO_BYTES
+            return int.from_bytes(table[start:start + SQRT_RATIO_BYTES], "big")
+    return _cached_sqrt_ratio(tick)
+
+
 def div_round_up(num1: int, num2: int):
     res = num1 // num2
     return res + 1 if num1 % num2 != 0 else res
@@ -116,6 +159,8 @@ def getNextSqrtPriceFromAmount0RoundingUp(sqrtPX96: int, liquidity: int, amount:
         return res
     else:
         product = amount * sqrtPX96
+        if product > max_256_bits or numerator1 <= product:
+            raise MathError("Output amount is more than the virtual reserves of token0")
         denominator = numerator1 - product
         res_num = numerator1 * sqrtPX96
         res_den = denominator
@@ -135,6 +180,8 @@ def getNextSqrtPriceFromAmount1RoundingDown(sqrtPX96: int, liquidity: int, amoun
         denominator = liquidity
         res = numerator // denominator
         quotient = res + 1 if numerator % denominator != 0 else res
+        if sqrtPX96 <= quotient:
+            raise MathError("Output amount is more than the virtual reserves of token1")
         return sqrtPX96 - quotient
 
 
@@ -143,8 +190,16 @@ def getNextSqrtPriceFromInput(currentPrice: int, liquidity: int, amount_in: int,
         if direction else getNextSqrtPriceFromAmount1RoundingDown(currentPrice, liquidity, amount_in, True)
 
 
+def getNextSqrtPriceFromOutput(currentPrice: int, liquidity: int, amount_out: int, direction: bool) -> int:
+    return getNextSqrtPriceFromAmount1RoundingDown(currentPrice, liquidity, amount_out, False) \
+        if direction else getNextSqrtPriceFromAmount0RoundingUp(currentPrice, liquidity, amount_out, False)
+
+
 def computeSwapStep(sqrtRatioCurrentX96: int, sqrtRatioTargetX96: int, liquidity: int, amountRemaining: int,
                     feePips: int) -> Tuple[int, int, int, int]:
+    """as in SwapMath, a negative amountRemaining is the exact amount out still wanted"""
+    if amountRemaining < 0:
+        return computeSwapStepExactOut(sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, -amountRemaining, feePips)
     zeroForOne = sqrtRatioCurrentX96 >= sqrtRatioTargetX96
     amountRemainingLessFee = (amountRemaining * (1000000 - feePips)) // 1000000
     amountIn = getAmount0Delta(sqrtRatioTargetX96, sqrtRatioCurrentX96, liquidity, True) if zeroForOne else \
@@ -171,3 +226,30 @@ def computeSwapStep(sqrtRatioCurrentX96: int, sqrtRatioTargetX96: int, liquidity
     else:
         feeAmount = div_round_up((amount_in * feePips), 1000000 - feePips)
     return amount_in, amount_out, sqrtRatioNextX96, feeAmount
+
+
+def computeSwapStepExactOut(sqrtRatioCurrentX96: int, sqrtRatioTargetX96: int, liquidity: int, amountOutRemaining: int,
+                            feePips: int) -> Tuple[int, int, int, int]:
+    zeroForOne = sqrtRatioCurrentX96 >= sqrtRatioTargetX96
+    amountOut = getAmount1Delta(sqrtRatioTargetX96, sqrtRatioCurrentX96, liquidity, False) if zeroForOne else \
+        getAmount0Delta(sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, False)
+    if amountOutRemaining >= amountOut:
+        sqrtRatioNextX96 = sqrtRatioTargetX96
+    else:
+        sqrtRatioNextX96 = getNextSqrtPriceFromOutput(
+            sqrtRatioCurrentX96,
+            liquidity,
+            amountOutRemaining,
+            zeroForOne)
+    if zeroForOne:
+        amount_in = getAmount0Delta(sqrtRatioNextX96, sqrtRatioCurrentX96, liquidity, True)
+        if sqrtRatioNextX96 != sqrtRatioTargetX96:
+            amountOut = getAmount1Delta(sqrtRatioNextX96, sqrtRatioCurrentX96, liquidity, False)
+    else:
+        amount_in = getAmount1Delta(sqrtRatioCurrentX96, sqrtRatioNextX96, liquidity, True)
+        if sqrtRatioNextX96 != sqrtRatioTargetX96:
+            amountOut = getAmount0Delta(sqrtRatioCurrentX96, sqrtRatioNextX96, liquidity, False)
+    # the output is capped at the amount wanted
+    amount_out = min(amountOut, amountOutRemaining)
+    feeAmount = div_round_up((amount_in * feePips), 1000000 - feePips)
+    return amount_in, amount_out, sqrtRatioNextX96, feeAmount
@@ -1,25 +1,25 @@
-import json
 from typing import Dict, Tuple, List
 from eth_abi.exceptions import InsufficientDataBytes
 from Web3Types.SimpleTypes import *
 from web3 import Web3
 from eth_abi import encode, decode
 from Definitions import ROOT_DIR
+from Utilities.AbiRegistry import AbiRegistry, AbiContract, AbiEntry, AbiFunction, AbiEvent, BadFunctionCall, \
+    canonical_type, keccak_prototype
+from Utilities.AbiDecoder import get_static_decoder
 
 ABI_FILENAME = ROOT_DIR + '/Files/abi.json'
 
+ABI_REGISTRY = AbiRegistry(ABI_FILENAME)
 
-class BadFunctionCall(Exception):
-    pass
 
-
-def get_abi(contract_type: str) -> Dict:
-    with open(ABI_FILENAME) as abi:
-        json_object = json.loads(abi.read())[contract_type]
-        return json_object
+def get_abi(contract_type: str) -> AbiContract:
+    return ABI_REGISTRY.get_contract(contract_type)
 
 
 def get_function_from_abi(abi: Dict, function_name: str, input_params=None):
+    if isinstance(abi, AbiContract):
+        return abi.get_function(function_name, input_params)
     function = None
     for f in abi:
         if f['type'] == 'function':
@@ -40,9 +40,19 @@ def create_function_call_abi(abi: Dict, function_name: str) -> HexBytes:
 
 
 def get_abi_function(function_name: str, contract_type: str) -> Dict:
-    with open(ABI_FILENAME) as abi:
-        json_object = json.loads(abi.read())[contract_type]
-        return get_function_from_abi(json_object, function_name)
+    return ABI_REGISTRY.get_function(contract_type, function_name)
+
+
+def get_prototype(abi_entry: Dict) -> str:
+    if isinstance(abi_entry, AbiEntry):
+        return abi_entry.prototype
+    return abi_entry['name'] + "(" + ",".join(canonical_type(i) for i in abi_entry['inputs']) + ")"
+
+
+def get_function_selector(abi_function: Dict) -> HexBytes:
+    if isinstance(abi_function, AbiFunction):
+        return abi_function.selector
+    return HexBytes(keccak_prototype(get_prototype(abi_function))[:4])
 
 
 def create_function_ident(abi: Dict, function_name: str, input_length=None) -> HexBytes:
@@ -50,16 +60,7 @@ def create_function_ident(abi: Dict, function_name: str, input_length=None) -> H
         function = get_function_from_abi(abi, function_name)
     else:
         function = get_function_from_abi(abi, function_name, input_length)
-    arguments = "("
-    for i in function['inputs'][:-1]:
-        arg_type = i['type']
-        arguments += arg_type
-        arguments += ","
-    if len(function['inputs']) > 0:
-        arguments += function['inputs'][-1]['type']
-    arguments += ")"
-    function_prototype = function['name'] + arguments
-    return HexBytes(bytes(Web3.keccak(text=function_prototype))[:4])
+    return get_function_selector(function)
 
 
 def pad_val(value: str, positive: bool):
@@ -75,27 +76,19 @@ def pad_val(value: str, positive: bool):
 
 def create_function_call(abi_function: Dict, *args) -> HexBytes:
     function = abi_function
-    arguments = "("
     if len(args) != len(function['inputs']):
         raise BadFunctionCall("Incorrect number of arguments")
     """if function['inputs'][0]['type'] == "int16":
         val = encode_packed(["int16"], [args[0]]).hex()
         encoded_args = pad_val(val, False)
     else:"""
-    encoded_args = encode([i['type'] for i in function['inputs']], [str(a) if type(a) == Address else bytes(a) if type(a) == HexBytes else a for a in args]).hex()
-    for i in function['inputs'][:-1]:
-        arg_type = i['type']
-        arguments += arg_type
-        arguments += ","
-    if len(function['inputs']) > 0:
-        arguments += function['inputs'][-1]['type']
-    arguments += ")"
-    function_prototype = function['name'] + arguments
-    function_selector = Web3.keccak(text=function_prototype).hex()[:10]
-    return HexBytes(function_selector + encoded_args)
+    encoded_args = encode([i['type'] for i in function['inputs']], [str(a) if type(a) == Address else bytes(a) if type(a) == HexBytes else a for a in args])
+    return HexBytes(bytes(get_function_selector(function)) + encoded_args)
 
 
 def create_event_abi(event_name: str, contract_abi: Dict):
+    if isinstance(contract_abi, AbiContract):
+        return contract_abi.get_event(event_name)
     event = None
     for f in contract_abi:
         if f['type'] == 'event':
@@ -107,19 +100,16 @@ def create_event_abi(event_name: str, contract_abi: Dict):
 
 
 def create_event_topic(event_abi):
-    arguments = "("
-    for i in event_abi['inputs'][:-1]:
-        arg_type = i['type']
-        arguments += arg_type
-        arguments += ","
-    if len(event_abi['inputs']) > 0:
-        arguments += event_abi['inputs'][-1]['type']
-    arguments += ")"
-    function_prototype = event_abi['name'] + arguments
-    return HexBytes(bytes(Web3.keccak(text=function_prototype)))
+    if isinstance(event_abi, AbiEvent):
+        return event_abi.topic
+    return HexBytes(keccak_prototype(get_prototype(event_abi)))
 
 
 def decode_event_output(output: HexBytes, event_abi: Dict) -> Tuple:
+    static_decoder = get_static_decoder(event_abi.data_types if isinstance(event_abi, AbiEvent) else
+                                        tuple(f['type'] for f in event_abi['inputs'] if not f['indexed']))
+    if static_decoder is not None:
+        return static_decoder.decode(bytes(output))
     function_abi_outputs = event_abi['inputs']
     types = [f['type'] for f in function_abi_outputs if f['indexed'] == False]
     outs = decode(types, bytes(output))
@@ -128,6 +118,10 @@ def decode_event_output(output: HexBytes, event_abi: Dict) -> Tuple:
 
 
 def decode_topic_data(topics: List[HexBytes], event_abi: Dict) -> List:
+    static_decoder = get_static_decoder(event_abi.indexed_types if isinstance(event_abi, AbiEvent) else
+                                        tuple(f['type'] for f in event_abi['inputs'] if f['indexed']))
+    if static_decoder is not None:
+        return list(static_decoder.decode_words(topics[1:]))
     indexed_function_output_types = [f['type'] for f in event_abi['inputs'] if f['indexed']]
     outs = [decode([typ], bytes(val))[0] for typ, val in zip(indexed_function_output_types, topics[1:])]
     outs = list(Address(o) if t == "address" else (
@@ -137,6 +131,13 @@ def decode_topic_data(topics: List[HexBytes], event_abi: Dict) -> List:
 
 
 def decode_function_output(output: HexBytes, function_abi: Dict) -> Tuple:
+    static_decoder = get_static_decoder(function_abi.output_types if isinstance(function_abi, AbiFunction) else
+                                        tuple(f['type'] for f in function_abi['outputs']))
+    if static_decoder is not None:
+        try:
+            return static_decoder.decode(bytes(output))
+        except InsufficientDataBytes:
+            return None
     function_abi_outputs = function_abi['outputs']
     types = [f['type'] for f in function_abi_outputs]
     try:
@@ -150,71 +151,37 @@ def decode_function_output(output: HexBytes, function_abi: Dict) -> Tuple:
 def decode_function_input_abi(input_data: HexBytes, function_name, contract_abi, input_length=None) -> Tuple:
     function = get_function_from_abi(contract_abi, function_name, input_params=input_length)
     types = [f['type'] for f in function['inputs']]
-    outs = decode(types, bytes(input_data))
-    outs = tuple(Address(o) if t == "address" else ([Address(q) for q in o] if t == "address[]" else (list(o) if t[-2:] == "[]" else o)) for t, o in zip(types, outs))
+    outs = convert_abi_values(types, decode(types, bytes(input_data)))
     return outs
 
 
 def decode_function_input_abi_with_names(input_data: HexBytes, function_name, contract_abi, input_length=None) -> Dict:
     function = get_function_from_abi(contract_abi, function_name, input_params=input_length)
     types = [f['type'] for f in function['inputs']]
-    outs = decode(types, bytes(input_data))
-    outs = tuple(Address(o) if t == "address" else ([Address(q) for q in o] if t == "address[]" else (list(o) if t[-2:] == "[]" else o)) for t, o in zip(types, outs))
+    outs = convert_abi_values(types, decode(types, bytes(input_data)))
     outs = {name["name"]: value for name, value in zip(function['inputs'], outs)}
     return outs
 
 
+def convert_abi_values(types, values) -> Tuple:
+    return tuple(Address(o) if t == "address" else ([Address(q) for q in o] if t == "address[]" else (list(o) if t[-2:] == "[]" else o)) for t, o in zip(types, values))
+
+
+ROUTER_SWAP_FUNCTIONS = ("swapETHForExactTokens", "swapExactETHForTokens", "swapExactTokensForETH",
+                         "swapTokensForExactETH", "swapExactTokensForTokens", "swapTokensForExactTokens")
+
+# 4 byte selector -> compiled function, built once rather than on every decode
+ROUTER_SELECTORS: Dict[bytes, AbiFunction] = {bytes(f.selector): f for f in
+                                              (get_abi('router').get_function(name) for name in ROUTER_SWAP_FUNCTIONS)}
+
+
 def decode_router_transaction_input(data: HexBytes):
-    router_abi = get_abi('router')
-    codes = {
-        create_function_ident(router_abi, 'swapETHForExactTokens'): "swapETHForExactTokens",
-        create_function_ident(router_abi, 'swapExactETHForTokens'): "swapExactETHForTokens",
-        create_function_ident(router_abi, 'swapExactTokensForETH'): "swapExactTokensForETH",
-        create_function_ident(router_abi, 'swapTokensForExactETH'): "swapTokensForExactETH",
-        create_function_ident(router_abi, 'swapExactTokensForTokens'): "swapExactTokensForTokens",
-        create_function_ident(router_abi, 'swapTokensForExactTokens'): "swapTokensForExactTokens"
-    }
-    try:
-        function_name = codes[data[:4]]
-    except KeyError:
-        return None, None
-    function_input = data[4:]
-    decoded = decode_function_input_abi(function_input, function_name, router_abi)
-    return function_name, decoded
-
-
-def decode_universal_router_transaction_input(data: HexBytes):
-    router_abi = get_abi('universalRouter')
-    codes = {
-        create_function_ident(router_abi, 'execute', 3): "execute_deadline",
-        create_function_ident(router_abi, 'execute', 2): "execute_no_deadline"
-    }
-    router_commands = {
-        8: "V2_SWAP_EXACT_IN",
-        9: "V2_SWAP_EXACT_OUT"
-    }
-    try:
-        function_name = codes[data[:4]]
-    except KeyError:
+    data = bytes(data)
+    function = ROUTER_SELECTORS.get(data[:4])
+    if function is None:
         return None, None
-    function_input = data[4:]
-    if function_name == "execute_deadline":
-        commands, inputs, deadline = decode_function_input_abi(function_input, 'execute', router_abi, 3)
-        sep_commands = [int(x) for x in commands]
-        for i, s in zip(inputs, sep_commands):
-            if s in router_commands:
-                recipient, amountIn, amountOutMin, path, payerIsUser = decode(["address", "uint256", "uint256", "address[]", "bool"], i)
-                print(recipient, amountIn, amountOutMin, path, payerIsUser)
-                return function_name, router_commands[s], (recipient, amountIn, amountOutMin, [Address(s)for s in path], payerIsUser, deadline)
-    else:
-        commands, inputs = decode_function_input_abi(function_input, 'execute', router_abi, 2)
-        sep_commands = [int(x) for x in commands]
-        for i, s in zip(inputs, sep_commands):
-            if s in router_commands.values():
-                recipient, amountIn, amountOutMin, path, payerIsUser = decode(
-                    ["address", "uint256", "uint256", "address[]", "bool"], i)
-                print(recipient, amountIn, amountOutMin, path, payerIsUser)
-                return function_name, router_commands[s], (recipient, amountIn, amountOutMin, [Address(s) for s in path], payerIsUser)
+    decoded = convert_abi_values(function.input_types, decode(function.input_types, data[4:]))
+    return function.name, decoded
 
 
 if __name__ == '__main__':
@@ -0,0 +1,116 @@
+"""Pluggable json encoding and decoding. The fastest installed backend (orjson, then msgspec) is used by default, with
+the standard library json module as the fallback. The fast backends only handle 64 bit integers and orjson silently
+turns larger integers into floats when decoding, so loads hands any payload containing a big integer (pool reserves,
+sqrt prices etc.) to the standard library instead. Json-rpc payloads encode numbers as hex strings so loads_rpc skips
+that check, which would otherwise cost more than the decode itself on large responses."""
+
+import json
+import re
+from typing import Callable, Dict, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class UnknownCodecError(Exception):
+    pass
+
+
+# a json number with at least 19 digits might not fit in 64 bits, negatives below the int64 minimum having only 19
+_BIG_INT = re.compile(rb'[\[:,]\s*-?\d{19}')
+_BIG_INT_STR = re.compile(r'[\[:,]\s*-?\d{19}')
+
+
+class JsonCodec:
+    """Wraps a backend's dumps and loads. dumps always returns a str (as expected by aiohttp and websockets),
+    dumps_bytes returns the backend's native bytes where possible, and loads accepts either str or bytes"""
+
+    __slots__ = ("name", "_dumps_bytes", "_loads", "_exact")
+
+    def __init__(self, name: str, dumps_bytes: Callable, loads: Callable, exact: bool = False):
+        self.name: str = name
+        self._dumps_bytes: Callable = dumps_bytes
+        self._loads: Callable = loads
+        # exact backends handle arbitrarily large integers so never need to fall back
+        self._exact: bool = exact
+
+    def dumps_bytes(self, obj) -> bytes:
+        if self._exact:
+            return self._dumps_bytes(obj)
+        try:
+            return self._dumps_bytes(obj)
+        except (TypeError, OverflowError, ValueError):
+            return json.dumps(obj).encode()
+
+    def dumps(self, obj) -> str:
+        if self._exact:
+            return json.dumps(obj)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, data: Union[str, bytes, bytearray]):
+        if self._exact:
+            return json.loads(data)
+        if (_BIG_INT_STR if isinstance(data, str) else _BIG_INT).search(data) is not None:
+            return json.loads(data)
+        return self._loads(data)
+
+    def loads_rpc(self, data: Union[str, bytes, bytearray]):
+        """loads for json-rpc payloads, where any integer larger than 64 bits is hex encoded"""
+        return self._loads(data)
+
+    def __repr__(self):
+        return f"JsonCodec({self.name})"
+
+
+STDLIB_CODEC = JsonCodec("json", lambda obj: json.dumps(obj).encode(), json.loads, exact=True)
+
+CODECS: Dict[str, JsonCodec] = {"json": STDLIB_CODEC}
+
+if msgspec is not None:
+    _msgspec_encoder = msgspec.json.Encoder()
+    _msgspec_decoder = msgspec.json.Decoder()
+    CODECS["msgspec"] = JsonCodec("msgspec", _msgspec_encoder.encode, _msgspec_decoder.decode)
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+    CODECS["orjson"] = JsonCodec("orjson", lambda obj: orjson.dumps(obj, option=_ORJSON_OPTIONS), orjson.loads)
+
+_PREFERENCE = ("orjson", "msgspec", "json")
+
+
+def get_codec(name: Optional[str] = None) -> JsonCodec:
+    """gets the named codec, or the fastest installed one if no name is given"""
+    if name is None:
+        return next(CODECS[n] for n in _PREFERENCE if n in CODECS)
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise UnknownCodecError(f"Json codec {name} is not installed, available codecs = {list(CODECS)}")
+
+
+DEFAULT_CODEC: JsonCodec = get_codec()
+
+
+def set_default_codec(name: str):
+    """changes the codec used by dumps/loads and by connections created afterwards"""
+    global DEFAULT_CODEC
+    DEFAULT_CODEC = get_codec(name)
+
+
+def dumps(obj) -> str:
+    return DEFAULT_CODEC.dumps(obj)
+
+
+def loads(data: Union[str, bytes, bytearray]):
+    return DEFAULT_CODEC.loads(data)
+
+
+def loads_rpc(data: Union[str, bytes, bytearray]):
+    return DEFAULT_CODEC.loads_rpc(data)
@@ -0,0 +1,89 @@
+import codecs
+import json
+import re
+from typing import List, Optional, Dict
+
+
+class JsonStreamError(Exception):
+    pass
+
+
+_WHITESPACE = " \t\n\r"
+
+
+class JsonArrayStreamParser:
+    """Incrementally parses the elements of a top level array (by default the 'result' array of a json-rpc response)
+    from chunks of bytes, so elements can be used before the whole body has been received. If the key is missing or is
+    not an array (e.g. an error response) the body is buffered and parsed in full, and made available in
+    fallback_response once the stream is closed."""
+
+    __slots__ = ("_key_pattern", "_text_decoder", "_json_decoder", "_buffer", "_position", "_in_array", "_finished",
+                 "fallback_response")
+
+    def __init__(self, key: str = "result"):
+        self._key_pattern = re.compile(r'"' + re.escape(key) + r'"\s*:\s*')
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer: str = ""
+        self._position: int = 0
+        self._in_array: bool = False
+        self._finished: bool = False
+        self.fallback_response: Optional[Dict] = None
+
+    def feed(self, chunk: bytes) -> List:
+        """adds a chunk of the body, returning any array elements that are now complete"""
+        self._buffer += self._text_decoder.decode(chunk)
+        if self._finished:
+            return []
+        if not self._in_array and not self._find_array_start():
+            return []
+        return self._parse_elements()
+
+    def close(self):
+        """marks the end of the body. Raises if the array was never completed, otherwise fills fallback_response if
+        the body didn't contain the array"""
+        self._buffer += self._text_decoder.decode(b"", final=True)
+        if self._in_array and not self._finished:
+            raise JsonStreamError("Stream ended before the array was completed")
+        if not self._in_array:
+            self.fallback_response = json.loads(self._buffer)
+
+    def _find_array_start(self) -> bool:
+        match = self._key_pattern.search(self._buffer)
+        if match is None or match.end() >= len(self._buffer):
+            return False
+        if self._buffer[match.end()] != "[":
+            # not an array so leave the whole body to be parsed once it has been received
+            self._finished = True
+            return False
+        self._in_array = True
+        self._position = match.end() + 1
+        return True
+
+    def _parse_elements(self) -> List:
+        elements = []
+        buffer = self._buffer
+        position = self._position
+        length = len(buffer)
+        while True:
+            while position < length and (buffer[position] in _WHITESPACE or buffer[position] == ","):
+                position += 1
+            if position >= length:
+                break
+            if buffer[position] == "]":
+                self._finished = True
+                break
+            try:
+                element, end = self._json_decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # element is incomplete, wait for the next chunk
+                break
+            if end >= length and isinstance(element, (int, float)):
+                # a number at the end of the buffer might be cut short
+                break
+            elements.append(element)
+            position = end
+        # drop everything that has been consumed so the buffer stays bounded
+        self._buffer = buffer[position:]
+        self._position = 0
+        return elements
@@ -0,0 +1,78 @@
+import os
+import random
+import time
+import unittest
+import Utilities.EthereumMaths as em
+
+
+class SqrtRatioCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        em.clear_sqrt_ratio_cache()
+
+    def tearDown(self):
+        em.clear_sqrt_ratio_cache()
+
+    def test_cached_matches_direct(self):
+        rng = random.Random(0)
+        ticks = [em.MIN_TICK, em.MAX_TICK, 0, 1, -1] + [rng.randrange(em.MIN_TICK, em.MAX_TICK) for _ in range(2000)]
+        for tick in ticks:
+            self.assertEqual(em.getSqrtRatioAtTickCached(tick), em.getSqrtRatioAtTick(tick))
+        em.precompute_sqrt_ratios((60, 200))
+        ticks += [-887220, 887220, -887200, 887200] + [rng.randrange(-14787, 14787) * 60 for _ in range(2000)]
+        for tick in ticks:
+            self.assertEqual(em.getSqrtRatioAtTickCached(tick), em.getSqrtRatioAtTick(tick))
+
+    def test_covered_spacings_skipped(self):
+        em.precompute_sqrt_ratios((200, 60, 120))
+        self.assertEqual([spacing for spacing, _, _ in em.sqrt_ratio_tables], [60, 200])
+        self.assertEqual(len(em.sqrt_ratio_tables[0][2]), (2 * (em.MAX_TICK // 60) + 1) * em.SQRT_RATIO_BYTES)
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+    def test_benchmark_against_direct(self):
+        em.precompute_sqrt_ratios((60,))
+        rng = random.Random(1)
+        ticks = [rng.randrange(-14787, 14787) * 60 for _ in range(50000)]
+        t1 = time.perf_counter()
+        direct = [em.getSqrtRatioAtTick(tick) for tick in ticks]
+        t2 = time.perf_counter()
+        cached = [em.getSqrtRatioAtTickCached(tick) for tick in ticks]
+        t3 = time.perf_counter()
+        print(f"direct: {t2 - t1}, precomputed: {t3 - t2}")
+        self.assertEqual(direct, cached)
+
+
+class SwapMathTests(unittest.TestCase):
+    """cases from the v3-core SqrtPriceMath and SwapMath specs"""
+
+    def test_next_sqrt_price_from_output(self):
+        self.assertEqual(em.getNextSqrtPriceFromOutput(2 ** 96, 10 ** 18, 10 ** 17, True),
+                         71305346262837903834189555302)
+        self.assertEqual(em.getNextSqrtPriceFromOutput(2 ** 96, 10 ** 18, 10 ** 17, False),
+                         88031291682515930659493278152)
+        with self.assertRaises(em.MathError):
+            em.getNextSqrtPriceFromOutput(20282409603651670423947251286016, 1024, 4, False)
+        with self.assertRaises(em.MathError):
+            em.getNextSqrtPriceFromOutput(2 ** 96, 10 ** 18, 10 ** 18, True)
+
+    def test_exact_out_step_capped(self):
+        self.assertEqual(em.computeSwapStep(417332158212080721273783715441582, 1452870262520218020823638996,
+                                            159344665391607089467575320103, -1, 1),
+                         (1, 1, 417332158212080721273783715441581, 1))
+
+    def test_exact_out_insufficient_liquidity(self):
+        price = 20282409603651670423947251286016
+        self.assertEqual(em.computeSwapStep(price, price * 11 // 10, 1024, -4, 3000),
+                         (26215, 0, price * 11 // 10, 79))
+        self.assertEqual(em.computeSwapStep(price, price * 9 // 10, 1024, -263000, 3000),
+                         (1, 26214, price * 9 // 10, 1))
+
+    def test_exact_in_unchanged(self):
+        self.assertEqual(em.computeSwapStep(2, 1, 1, 3915081100057732413702495386755767, 1),
+                         (39614081257132168796771975168, 0, 1, 39614120871253040049813))
+        self.assertEqual(em.computeSwapStep(2413, 79887613182836312, 1985041575832132834610021537970, 10, 1872),
+                         (0, 0, 2413, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+import json
+import os
+import random
+import time
+import unittest
+from eth_abi import encode, decode
+from web3 import Web3
+import Utilities.FunctionCallBuilder as fcb
+import Utilities.CalldataBuilder as cb
+from Utilities.AbiDecoder import get_static_decoder, get_word_decoder, parse_static_type
+from Utilities.AbiRegistry import AbiRegistry, ImmutableAbiError, BadFunctionCall
+from Web3Types.SimpleTypes import HexBytes, Address
+
+
+class AbiRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = AbiRegistry(fcb.ABI_FILENAME)
+        with open(fcb.ABI_FILENAME) as f:
+            self.raw_abis = json.loads(f.read())
+
+    def test_contract_loaded_once(self):
+        for _ in range(10):
+            self.registry.get_function("V3LiquidityPool", "slot0")
+            self.registry.get_event("V3LiquidityPool", "Swap")
+        self.assertEqual(self.registry.misses, 1)
+        self.assertEqual(self.registry.hits, 19)
+
+    def test_function_matches_linear_search(self):
+        for contract_type, abi in self.raw_abis.items():
+            for f in abi:
+                if f['type'] != 'function':
+                    continue
+                expected = fcb.get_function_from_abi(abi, f['name'], len(f['inputs']))
+                compiled = self.registry.get_function(contract_type, f['name'], len(f['inputs']))
+                self.assertEqual(expected['inputs'], [dict(i) for i in compiled['inputs']])
+                self.assertEqual(expected['name'], compiled.name)
+
+    def test_function_by_arity(self):
+        execute_2 = self.registry.get_function("universalRouter", "execute", 2)
+        execute_3 = self.registry.get_function("universalRouter", "execute", 3)
+        self.assertEqual(execute_2.input_types, ("bytes", "bytes[]"))
+        self.assertEqual(execute_3.input_types, ("bytes", "bytes[]", "uint256"))
+
+    def test_event_types(self):
+        mint = self.registry.get_event("V3LiquidityPool", "Mint")
+        self.assertEqual(mint.indexed_types, ("address", "int24", "int24"))
+        self.assertEqual(mint.data_types, ("address", "uint128", "uint256", "uint256"))
+
+    def test_descriptors_immutable(self):
+        slot0 = self.registry.get_function("V3LiquidityPool", "slot0")
+        with self.assertRaises(ImmutableAbiError):
+            slot0.name = "slot1"
+        with self.assertRaises(TypeError):
+            slot0['outputs'][0]['type'] = "uint8"
+
+    def test_missing_function(self):
+        with self.assertRaises(BadFunctionCall):
+            self.registry.get_function("V3LiquidityPool", "not_a_function")
+
+    def test_missing_event(self):
+        with self.assertRaisesRegex(BadFunctionCall, "event not_an_event in the V3LiquidityPool abi"):
+            self.registry.get_event("V3LiquidityPool", "not_an_event")
+
+    def test_module_helpers_use_registry(self):
+        fcb.ABI_REGISTRY.reset_stats()
+        fcb.get_abi_function("getReserves", "liquidityPool")
+        fcb.create_event_abi("Sync", fcb.get_abi("liquidityPool"))
+        self.assertEqual(fcb.ABI_REGISTRY.hits + fcb.ABI_REGISTRY.misses, 2)
+
+
+class SelectorTableTests(unittest.TestCase):
+
+    def test_known_selectors(self):
+        self.assertEqual(fcb.get_abi_function("getReserves", "liquidityPool").selector, HexBytes("0x0902f1ac"))
+        self.assertEqual(fcb.get_abi_function("slot0", "V3LiquidityPool").selector, HexBytes("0x3850c7bd"))
+        swap = fcb.create_event_abi("Swap", fcb.get_abi("V3LiquidityPool"))
+        self.assertEqual(swap.topic, HexBytes("0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67"))
+
+    def test_selectors_match_keccak(self):
+        for contract_type in fcb.ABI_REGISTRY.contract_types():
+            for entry in fcb.get_abi(contract_type):
+                if entry.entry_type not in ("function", "event"):
+                    continue
+                prototype = entry['name'] + "(" + ",".join(i['type'] for i in entry['inputs']) + ")"
+                if "tuple" in prototype:
+                    continue
+                digest = bytes(Web3.keccak(text=prototype))
+                if entry.entry_type == "function":
+                    self.assertEqual(bytes(entry.selector), digest[:4])
+                else:
+                    self.assertEqual(bytes(entry.topic), digest)
+
+    def test_raw_dict_abis_still_supported(self):
+        with open(fcb.ABI_FILENAME) as f:
+            raw_pool = json.loads(f.read())["V3LiquidityPool"]
+        compiled_pool = fcb.get_abi("V3LiquidityPool")
+        self.assertEqual(fcb.create_function_ident(raw_pool, "ticks"), fcb.create_function_ident(compiled_pool, "ticks"))
+        self.assertEqual(fcb.create_event_topic(fcb.create_event_abi("Mint", raw_pool)),
+                         fcb.create_event_topic(fcb.create_event_abi("Mint", compiled_pool)))
+
+    def test_reverse_topic_lookup(self):
+        sync = fcb.create_event_abi("Sync", fcb.get_abi("liquidityPool"))
+        self.assertIs(fcb.ABI_REGISTRY.event_by_topic(sync.topic), sync)
+        self.assertIs(fcb.ABI_REGISTRY.event_by_topic(str(sync.topic)), sync)
+        self.assertIsNone(fcb.ABI_REGISTRY.event_by_topic(HexBytes(bytes(32))))
+
+    def test_reverse_selector_lookup(self):
+        router = fcb.get_abi("router")
+        function = fcb.get_abi_function("swapExactTokensForTokens", "router")
+        self.assertIs(router.function_by_selector(function.selector), function)
+
+
+class CalldataBuilderTests(unittest.TestCase):
+
+    pool = Address("0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640")
+
+    def test_specialised_encoders_match_generic(self):
+        slot0 = fcb.get_abi_function("slot0", "V3LiquidityPool")
+        tick_bitmap = fcb.get_abi_function("tickBitmap", "V3LiquidityPool")
+        ticks = fcb.get_abi_function("ticks", "V3LiquidityPool")
+        get_reserves = fcb.get_abi_function("getReserves", "liquidityPool")
+        balance_of = fcb.get_abi_function("balanceOf", "token")
+        self.assertEqual(cb.encode_slot0(), fcb.create_function_call(slot0))
+        self.assertEqual(cb.encode_get_reserves(), fcb.create_function_call(get_reserves))
+        self.assertEqual(cb.encode_balance_of(self.pool), fcb.create_function_call(balance_of, self.pool))
+        for i in (-32768, -1080, -1, 0, 1, 32767):
+            self.assertEqual(cb.encode_tick_bitmap(i), fcb.create_function_call(tick_bitmap, i))
+        for i in (-887272, -276335, -1, 0, 60, 887272):
+            self.assertEqual(cb.encode_ticks(i), fcb.create_function_call(ticks, i))
+
+    def test_static_functions_match_generic(self):
+        for name, args in (("getPool", (self.pool, self.pool, 3000)), ("feeAmountTickSpacing", (500,))):
+            function = fcb.get_abi_function(name, "factory_v3")
+            self.assertEqual(cb.encode_function_call(function, *args), fcb.create_function_call(function, *args))
+
+    def test_dynamic_functions_fall_back(self):
+        function = fcb.get_abi_function("getAmountsOut", "router")
+        self.assertIsNone(cb.get_static_encoder(function))
+        args = (1000, [str(self.pool), str(self.pool)])
+        self.assertEqual(cb.encode_function_call(function, *args), fcb.create_function_call(function, *args))
+
+    def test_encoder_and_decoder_accept_the_same_types(self):
+        for arg_type in ("address", "bool", "uint", "uint8", "int24", "int256", "bytes1", "bytes32", "bytes", "bytes33",
+                         "string", "uint256[]", "(uint256,bool)"):
+            self.assertEqual(cb.get_word_encoder(arg_type) is None, get_word_decoder(arg_type) is None, arg_type)
+        self.assertEqual(parse_static_type("uint"), ("uint", 256))
+        self.assertEqual(parse_static_type("int24"), ("int", 24))
+        self.assertEqual(parse_static_type("bytes4"), ("bytes", 4))
+        self.assertIsNone(parse_static_type("bytes"))
+
+    def test_out_of_bounds(self):
+        with self.assertRaises(BadFunctionCall):
+            cb.encode_tick_bitmap(32768)
+        with self.assertRaises(BadFunctionCall):
+            cb.encode_ticks(-(1 << 23) - 1)
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+    def test_benchmark_against_generic(self):
+        calls = 100000
+        ticks = fcb.get_abi_function("ticks", "V3LiquidityPool")
+        t1 = time.perf_counter()
+        for i in range(calls):
+            fcb.create_function_call(ticks, i - calls // 2)
+        t2 = time.perf_counter()
+        for i in range(calls):
+            cb.encode_ticks(i - calls // 2)
+        t3 = time.perf_counter()
+        for i in range(calls):
+            cb.encode_function_call(ticks, i - calls // 2)
+        t4 = time.perf_counter()
+        print(f"generic: {t2 - t1}, specialised: {t3 - t2}, static fast path: {t4 - t3}")
+
+
+def random_value(arg_type: str):
+    if arg_type == "address":
+        return Web3.to_checksum_address("0x" + random.randbytes(20).hex())
+    if arg_type == "bool":
+        return random.random() > 0.5
+    if arg_type.startswith("uint"):
+        return random.getrandbits(int(arg_type[4:] or 256))
+    if arg_type.startswith("int"):
+        bits = int(arg_type[3:] or 256)
+        return random.getrandbits(bits) - (1 << (bits - 1))
+    return random.randbytes(int(arg_type[5:]))
+
+
+def eth_abi_decode(types, data: bytes):
+    outs = decode(list(types), data)
+    return tuple(Address(o) if t == "address" else o for t, o in zip(types, outs))
+
+
+class AbiDecoderTests(unittest.TestCase):
+
+    def test_static_outputs_match_eth_abi(self):
+        random.seed(1)
+        checked = 0
+        for contract_type in fcb.ABI_REGISTRY.contract_types():
+            for entry in fcb.get_abi(contract_type):
+                if entry.entry_type != "function" or get_static_decoder(entry.output_types) is None:
+                    continue
+                for _ in range(20):
+                    values = [random_value(t) for t in entry.output_types]
+                    data = encode(list(entry.output_types), values)
+                    self.assertEqual(fcb.decode_function_output(HexBytes(data), entry),
+                                     eth_abi_decode(entry.output_types, data))
+                checked += 1
+        self.assertGreater(checked, 50)
+
+    def test_v3_events_match_eth_abi(self):
+        random.seed(2)
+        for name in ("Swap", "Mint", "Burn", "Collect", "Flash", "Initialize"):
+            event = fcb.create_event_abi(name, fcb.get_abi("V3LiquidityPool"))
+            for _ in range(50):
+                values = [random_value(t) for t in event.data_types]
+                data = encode(list(event.data_types), values)
+                self.assertEqual(fcb.decode_event_output(HexBytes(data), event), eth_abi_decode(event.data_types, data))
+                indexed = [random_value(t) for t in event.indexed_types]
+                topics = [event.topic] + [HexBytes(encode([t], [v])) for t, v in zip(event.indexed_types, indexed)]
+                expected = [eth_abi_decode((t,), bytes(v))[0] for t, v in zip(event.indexed_types, topics[1:])]
+                self.assertEqual(fcb.decode_topic_data(topics, event), expected)
+
+    def test_sign_extension(self):
+        swap = fcb.create_event_abi("Swap", fcb.get_abi("V3LiquidityPool"))
+        data = encode(list(swap.data_types), [-1, -(1 << 255), 1 << 159, (1 << 127) + 5, -887272])
+        self.assertEqual(fcb.decode_event_output(HexBytes(data), swap), (-1, -(1 << 255), 1 << 159, (1 << 127) + 5, -887272))
+
+    def test_short_output_is_none(self):
+        self.assertIsNone(fcb.decode_function_output(HexBytes("0x"), fcb.get_abi_function("slot0", "V3LiquidityPool")))
+
+    def test_dynamic_outputs_fall_back(self):
+        function = fcb.get_abi_function("getAmountsOut", "router")
+        self.assertIsNone(get_static_decoder(function.output_types))
+        self.assertEqual(fcb.decode_function_output(HexBytes(encode(["uint256[]"], [[1, 2, 3]])), function), ([1, 2, 3],))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import json
+import os
+import random
+import time
+import unittest
+from Definitions import ROOT_DIR
+from UniswapTypes.PoolDecode import decode_json_lp
+from Utilities.JsonCodec import CODECS, STDLIB_CODEC, get_codec, UnknownCodecError
+from Utilities.JsonStream import JsonArrayStreamParser, JsonStreamError
+
+
+def split_randomly(body: bytes, max_chunk: int):
+    position = 0
+    while position < len(body):
+        size = random.randint(1, max_chunk)
+        yield body[position:position + size]
+        position += size
+
+
+class JsonArrayStreamParserTests(unittest.TestCase):
+
+    response = {"jsonrpc": "2.0", "id": 7, "result": [
+        {"address": "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640", "topics": ["0x01", "0x02"], "data": "0x", "n": i,
+         "text": "brackets ] [ and \"quotes\", commas"} for i in range(200)]}
+
+    def test_elements_match_full_parse(self):
+        random.seed(3)
+        body = json.dumps(self.response).encode()
+        for max_chunk in (1, 7, 100, 5000):
+            parser = JsonArrayStreamParser()
+            elements = []
+            for chunk in split_randomly(body, max_chunk):
+                elements += parser.feed(chunk)
+            parser.close()
+            self.assertEqual(elements, self.response["result"])
+            self.assertIsNone(parser.fallback_response)
+
+    def test_elements_yielded_before_end(self):
+        body = json.dumps(self.response).encode()
+        parser = JsonArrayStreamParser()
+        elements = parser.feed(body[:len(body) // 2])
+        self.assertGreater(len(elements), 50)
+
+    def test_numbers_and_multibyte_characters(self):
+        body = json.dumps({"result": [1, 22, 333, "é中", 4444]}, ensure_ascii=False).encode()
+        parser = JsonArrayStreamParser()
+        elements = []
+        for i in range(len(body)):
+            elements += parser.feed(body[i:i + 1])
+        parser.close()
+        self.assertEqual(elements, [1, 22, 333, "é中", 4444])
+
+    def test_error_response_falls_back(self):
+        error = {"jsonrpc": "2.0", "id": 1, "error": {"code": -32005, "message": "query returned more than 10000 "
+                                                                                  "results. Try with this block range "
+                                                                                  "[0x1, 0x2]."}}
+        parser = JsonArrayStreamParser()
+        self.assertEqual(parser.feed(json.dumps(error).encode()), [])
+        parser.close()
+        self.assertEqual(parser.fallback_response, error)
+
+    def test_null_result_falls_back(self):
+        parser = JsonArrayStreamParser()
+        parser.feed(b'{"jsonrpc": "2.0", "id": 1, "result": null}')
+        parser.close()
+        self.assertIsNone(parser.fallback_response["result"])
+
+    def test_truncated_stream(self):
+        parser = JsonArrayStreamParser()
+        parser.feed(json.dumps(self.response).encode()[:1000])
+        with self.assertRaises(JsonStreamError):
+            parser.close()
+
+
+def load_recorded_payloads():
+    """the recorded pool json plus json-rpc payloads built from a recorded mainnet swap log"""
+    with open(ROOT_DIR + "/Files/test_liquidity_pools.json") as f:
+        pools = list(json.loads(f.read()).values())
+    raw_log = {"blockHash": "0x06ce1c2a2bf4be3cc7f8cfbde9b29b3035dd35f551aea177e829905f0423f899",
+               "blockNumber": "0x10b3f9d",
+               "transactionIndex": "0x72",
+               "address": "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640",
+               "logIndex": "0xe2",
+               "data": "0x0000000000000000000000000000000000000000000000000000000077359400ffffffffffffffffffffffffffffffffffffffffffffffffefdf78616e9e6a8c0000000000000000000000000000000000005e2ec01dc1bd773f69f88e02cb360000000000000000000000000000000000000000000000012e2b29926a2e7ded000000000000000000000000000000000000000000000000000000000003145a",
+               "removed": False,
+               "topics": ["0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67",
+                          "0x000000000000000000000000def1c0ded9bec7f1a1670819833240f027b25eff",
+                          "0x000000000000000000000000def1c0ded9bec7f1a1670819833240f027b25eff"],
+               "transactionHash": "0x437f02b06f96645e6ec3a7f6f8b6638bc9bcab3a8f33cd8d453b6ebbb197055b"}
+    get_logs = json.dumps({"jsonrpc": "2.0", "id": 1, "result": [raw_log] * 500})
+    pending_transaction = json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+                                      "params": {"subscription": "0x9ce59a13059e417087c02d3236a0b1cc",
+                                                 "result": raw_log["transactionHash"]}})
+    return {"pools": pools, "get_logs": [get_logs], "pending_transactions": [pending_transaction] * 500}
+
+
+class JsonCodecTests(unittest.TestCase):
+
+    payloads = load_recorded_payloads()
+
+    def test_codecs_round_trip(self):
+        for codec in CODECS.values():
+            for payloads in self.payloads.values():
+                for payload in payloads:
+                    expected = json.loads(payload)
+                    self.assertEqual(codec.loads(payload), expected)
+                    self.assertEqual(codec.loads(payload.encode()), expected)
+                    if payloads is not self.payloads["pools"]:
+                        self.assertEqual(codec.loads_rpc(payload.encode()), expected)
+                    self.assertEqual(json.loads(codec.dumps(expected)), expected)
+
+    def test_big_integers_are_exact(self):
+        big = {"sqrtPriceX96": 2 ** 160 - 1, "tick": -887272, "slots": {-60: [2 ** 127, -(2 ** 127)]}}
+        for codec in CODECS.values():
+            self.assertEqual(codec.loads(codec.dumps(big)), {"sqrtPriceX96": 2 ** 160 - 1, "tick": -887272,
+                                                               "slots": {"-60": [2 ** 127, -(2 ** 127)]}})
+
+    def test_negative_19_digit_integers_are_exact(self):
+        # below the int64 minimum but only 19 digits long
+        payload = '{"slots_dict": {"-60": [-9300000000000000000, 9300000000000000000]}}'
+        for codec in CODECS.values():
+            self.assertEqual(codec.loads(payload), {"slots_dict": {"-60": [-9300000000000000000, 9300000000000000000]}})
+            self.assertEqual(codec.loads(payload.encode())["slots_dict"]["-60"][0], -9300000000000000000)
+
+    def test_pools_round_trip(self):
+        for payload in self.payloads["pools"]:
+            lp = decode_json_lp(payload)
+            self.assertEqual(json.loads(lp.to_json()), json.loads(payload))
+
+    def test_unknown_codec(self):
+        self.assertIs(get_codec("json"), STDLIB_CODEC)
+        with self.assertRaises(UnknownCodecError):
+            get_codec("not_a_codec")
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+    def test_benchmark(self):
+        """micro benchmark of each installed codec over the recorded payloads"""
+        for name, payloads in self.payloads.items():
+            encoded = [p.encode() for p in payloads]
+            decoded = [json.loads(p) for p in payloads]
+            repeats = max(1, 2000000 // sum(len(e) for e in encoded))
+            timings = {}
+            for codec in CODECS.values():
+                loads = codec.loads if name == "pools" else codec.loads_rpc
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    for data in encoded:
+                        loads(data)
+                load_time = time.perf_counter() - start
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    for obj in decoded:
+                        codec.dumps(obj)
+                timings[codec.name] = (load_time, time.perf_counter() - start)
+            print(f"{name}: " + ", ".join(f"{codec} loads {l:.4f}s dumps {d:.4f}s" for codec, (l, d) in timings.items()))
+
+
+if __name__ == '__main__':
+    unittest.main()
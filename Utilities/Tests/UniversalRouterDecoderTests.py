@@ -0,0 +1,169 @@
+import os
+import random
+import time
+import unittest
+from eth_abi import encode, decode
+import Utilities.FunctionCallBuilder as fcb
+import Utilities.UniversalRouterDecoder as urd
+from Utilities.UniversalRouterDecoder import decode_universal_router_transaction_input, decode_packed_path, InvalidPath
+from Web3Types.SimpleTypes import Address
+
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+DAI = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+SENDER = "0x1111111111111111111111111111111111111111"
+
+
+def packed_path(tokens, fees):
+    path = bytes.fromhex(tokens[0][2:])
+    for fee, token in zip(fees, tokens[1:]):
+        path += fee.to_bytes(3, "big") + bytes.fromhex(token[2:])
+    return path
+
+
+def v3_swap(amount_a, amount_b, tokens, fees):
+    return encode(["address", "uint256", "uint256", "bytes", "bool"],
+                  [SENDER, amount_a, amount_b, packed_path(tokens, fees), True])
+
+
+def v2_swap(amount_a, amount_b, path):
+    return encode(["address", "uint256", "uint256", "address[]", "bool"], [SENDER, amount_a, amount_b, path, False])
+
+
+def permit_single(amount):
+    return encode([f"({urd.PERMIT_DETAILS},address,uint256)", "bytes"],
+                  [((USDC, amount, 2 ** 40, 7), SENDER, 2 ** 40), b"\x01" * 65])
+
+
+def execute(commands, inputs, deadline=None):
+    if deadline is None:
+        function = fcb.get_abi('universalRouter').get_function('execute', 2)
+        args = [bytes(commands), inputs]
+    else:
+        function = fcb.get_abi('universalRouter').get_function('execute', 3)
+        args = [bytes(commands), inputs, deadline]
+    return bytes(function.selector) + encode(function.input_types, args)
+
+
+def make_corpus(size, seed=0):
+    """calldata shaped like mainnet universal router traffic, mostly permit + swap or wrap + swap + unwrap"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        amount = rng.getrandbits(96)
+        kind = i % 4
+        if kind == 0:
+            corpus.append(execute([urd.PERMIT2_PERMIT, urd.V3_SWAP_EXACT_IN],
+                                  [permit_single(amount), v3_swap(amount, amount // 2, [USDC, WETH], [500])],
+                                  deadline=rng.getrandbits(32)))
+        elif kind == 1:
+            corpus.append(execute([urd.WRAP_ETH, urd.V3_SWAP_EXACT_IN],
+                                  [encode(["address", "uint256"], [SENDER, amount]),
+                                   v3_swap(urd.CONTRACT_BALANCE, amount, [WETH, USDC, DAI], [3000, 100])],
+                                  deadline=rng.getrandbits(32)))
+        elif kind == 2:
+            corpus.append(execute([urd.V2_SWAP_EXACT_OUT, urd.UNWRAP_WETH],
+                                  [v2_swap(amount, amount * 2, [USDC, WETH]),
+                                   encode(["address", "uint256"], [SENDER, amount])]))
+        else:
+            corpus.append(execute([urd.V3_SWAP_EXACT_OUT | urd.FLAG_ALLOW_REVERT, urd.SWEEP],
+                                  [v3_swap(amount, amount * 3, [DAI, USDC], [100]),
+                                   encode(["address", "address", "uint256"], [USDC, SENDER, 0])],
+                                  deadline=rng.getrandbits(32)))
+    return corpus
+
+
+def generic_decode(data):
+    """decodes every command with eth_abi, what the table driven decoder is measured against"""
+    function_name, function = ("execute_deadline", fcb.get_abi('universalRouter').get_function('execute', 3)) \
+        if data[:4] == urd.EXECUTE_DEADLINE_SELECTOR else \
+        ("execute_no_deadline", fcb.get_abi('universalRouter').get_function('execute', 2))
+    decoded = decode(function.input_types, data[4:])
+    types = {urd.V3_SWAP_EXACT_IN: ["address", "uint256", "uint256", "bytes", "bool"],
+             urd.V3_SWAP_EXACT_OUT: ["address", "uint256", "uint256", "bytes", "bool"],
+             urd.V2_SWAP_EXACT_OUT: ["address", "uint256", "uint256", "address[]", "bool"],
+             urd.PERMIT2_PERMIT: [f"({urd.PERMIT_DETAILS},address,uint256)", "bytes"],
+             urd.WRAP_ETH: ["address", "uint256"], urd.UNWRAP_WETH: ["address", "uint256"],
+             urd.SWEEP: ["address", "address", "uint256"]}
+    return function_name, [decode(types[c & 0x3f], i) for c, i in zip(decoded[0], decoded[1])]
+
+
+class UniversalRouterDecoderTests(unittest.TestCase):
+
+    def test_packed_path(self):
+        tokens, fees = decode_packed_path(packed_path([WETH, USDC, DAI], [3000, 100]))
+        self.assertEqual(tokens, [Address(WETH), Address(USDC), Address(DAI)])
+        self.assertEqual(fees, [3000, 100])
+        with self.assertRaises(InvalidPath):
+            decode_packed_path(packed_path([WETH, USDC], [3000])[:-1])
+
+    def test_all_commands_decoded(self):
+        function_name, commands, deadline = decode_universal_router_transaction_input(make_corpus(2)[1])
+        self.assertEqual(function_name, "execute_deadline")
+        self.assertEqual([c.name for c in commands], ["WRAP_ETH", "V3_SWAP_EXACT_IN"])
+        swap = commands[1].args
+        self.assertEqual(swap["amountIn"], urd.CONTRACT_BALANCE)
+        self.assertEqual(swap["path"], [Address(WETH), Address(USDC), Address(DAI)])
+        self.assertEqual(swap["fees"], [3000, 100])
+        self.assertEqual(swap["recipient"], Address(SENDER))
+        self.assertTrue(swap["payerIsUser"])
+
+    def test_no_deadline_and_v2(self):
+        function_name, commands, deadline = decode_universal_router_transaction_input(make_corpus(3)[2])
+        self.assertEqual((function_name, deadline), ("execute_no_deadline", None))
+        self.assertEqual([c.name for c in commands], ["V2_SWAP_EXACT_OUT", "UNWRAP_WETH"])
+        self.assertEqual(commands[0].args["path"], [Address(USDC), Address(WETH)])
+        self.assertEqual(commands[0].args["amountInMax"], commands[0].args["amountOut"] * 2)
+
+    def test_allow_revert_permit_and_unknown(self):
+        _, commands, _ = decode_universal_router_transaction_input(make_corpus(4)[3])
+        self.assertEqual(commands[0].name, "V3_SWAP_EXACT_OUT")
+        self.assertTrue(commands[0].allow_revert)
+        _, commands, _ = decode_universal_router_transaction_input(make_corpus(1)[0])
+        self.assertEqual(commands[0].args["permitSingle"][1], Address(SENDER))
+        self.assertEqual(commands[0].args["signature"], b"\x01" * 65)
+        _, commands, _ = decode_universal_router_transaction_input(execute([0x13], [b"\x01\x02"]))
+        self.assertEqual((commands[0].name, commands[0].args), ("UNKNOWN_0x13", {"input": b"\x01\x02"}))
+
+    def test_sub_plan(self):
+        sub_plan = encode(["bytes", "bytes[]"], [bytes([urd.V2_SWAP_EXACT_IN]), [v2_swap(5, 4, [DAI, USDC])]])
+        _, commands, _ = decode_universal_router_transaction_input(execute([urd.EXECUTE_SUB_PLAN], [sub_plan], 1))
+        self.assertEqual(commands[0].args["commands"][0].args["amountIn"], 5)
+
+    def test_not_execute(self):
+        self.assertEqual(decode_universal_router_transaction_input(b"\x00" * 36), (None, None, None))
+
+    def test_matches_eth_abi(self):
+        def normalise(value):
+            return str(value).lower() if isinstance(value, (Address, str)) else value
+
+        for data in make_corpus(100, seed=1):
+            function_name, commands, _ = decode_universal_router_transaction_input(data)
+            expected_name, expected = generic_decode(data)
+            self.assertEqual(function_name, expected_name)
+            for command, values in zip(commands, expected):
+                args = list(command.args.values())
+                if command.command in urd.SWAP_COMMANDS:
+                    # the path is compared in the specific tests
+                    args = args[:3] + args[-1:]
+                    values = values[:3] + values[-1:]
+                elif command.command == urd.PERMIT2_PERMIT:
+                    args = [[normalise(a) for a in args[0][0]], normalise(args[0][1]), args[0][2], args[1]]
+                    values = [[normalise(v) for v in values[0][0]], normalise(values[0][1]), values[0][2], values[1]]
+                self.assertEqual([normalise(a) for a in args], [normalise(v) for v in values])
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+    def test_benchmark_against_generic(self):
+        corpus = make_corpus(4000)
+        t1 = time.perf_counter()
+        for data in corpus:
+            generic_decode(data)
+        t2 = time.perf_counter()
+        for data in corpus:
+            decode_universal_router_transaction_input(data)
+        t3 = time.perf_counter()
+        print(f"eth_abi: {len(corpus) / (t2 - t1):.0f} tx/s, table driven: {len(corpus) / (t3 - t2):.0f} tx/s")
+
+
+if __name__ == '__main__':
+    unittest.main()
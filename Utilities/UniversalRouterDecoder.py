@@ -0,0 +1,211 @@
+"""Table driven decoding of Universal Router execute calls. Each command byte of the commands string is looked up in
+UNIVERSAL_ROUTER_COMMANDS (after masking off the allow revert flag) to get the name, field names and decoder of its
+input. Swaps and the execute call itself are decoded by slicing words directly, static inputs with the compiled
+static decoders, and only the batched permit2 commands fall back to eth_abi."""
+
+from typing import Dict, List, Tuple, Optional, Callable, Any
+from eth_abi import decode
+from eth_abi.exceptions import InsufficientDataBytes
+import Utilities.FunctionCallBuilder as fcb
+from Utilities.AbiDecoder import get_static_decoder
+from Web3Types.SimpleTypes import HexBytes, Address
+
+COMMAND_TYPE_MASK = 0x3f
+FLAG_ALLOW_REVERT = 0x80
+
+# amounts the router replaces with its own balance, or the transaction value for WRAP_ETH
+CONTRACT_BALANCE = 1 << 255
+
+V3_SWAP_EXACT_IN = 0x00
+V3_SWAP_EXACT_OUT = 0x01
+PERMIT2_TRANSFER_FROM = 0x02
+PERMIT2_PERMIT_BATCH = 0x03
+SWEEP = 0x04
+TRANSFER = 0x05
+PAY_PORTION = 0x06
+V2_SWAP_EXACT_IN = 0x08
+V2_SWAP_EXACT_OUT = 0x09
+PERMIT2_PERMIT = 0x0a
+WRAP_ETH = 0x0b
+UNWRAP_WETH = 0x0c
+PERMIT2_TRANSFER_FROM_BATCH = 0x0d
+BALANCE_CHECK_ERC20 = 0x0e
+EXECUTE_SUB_PLAN = 0x21
+
+SWAP_COMMANDS = (V3_SWAP_EXACT_IN, V3_SWAP_EXACT_OUT, V2_SWAP_EXACT_IN, V2_SWAP_EXACT_OUT)
+
+PERMIT_DETAILS = "(address,uint160,uint48,uint48)"
+
+EXECUTE_DEADLINE_SELECTOR = bytes(fcb.get_abi('universalRouter').get_function('execute', 3).selector)
+EXECUTE_NO_DEADLINE_SELECTOR = bytes(fcb.get_abi('universalRouter').get_function('execute', 2).selector)
+
+
+class InvalidPath(Exception):
+    pass
+
+
+class UniversalRouterCommand:
+    """A single decoded command. args maps the command's field names to their values"""
+
+    __slots__ = ("command", "name", "args", "allow_revert")
+
+    def __init__(self, command: int, name: str, args: Dict[str, Any], allow_revert: bool):
+        self.command: int = command
+        self.name: str = name
+        self.args: Dict[str, Any] = args
+        self.allow_revert: bool = allow_revert
+
+    def __repr__(self):
+        return f"{self.name}({self.args})"
+
+
+class CommandSpec:
+
+    __slots__ = ("name", "fields", "decode")
+
+    def __init__(self, name: str, fields: Tuple[str, ...], decoder: Callable[[bytes], Tuple]):
+        self.name: str = name
+        self.fields: Tuple[str, ...] = fields
+        self.decode: Callable[[bytes], Tuple] = decoder
+
+
+def read_word(data: bytes, offset: int) -> int:
+    if offset + 32 > len(data):
+        raise InsufficientDataBytes(f"Tried to read 32 bytes at {offset}, only got {len(data)} bytes.")
+    return int.from_bytes(data[offset:offset + 32], "big")
+
+
+def read_bytes(data: bytes, offset: int) -> bytes:
+    """reads an abi encoded dynamic bytes value starting at offset"""
+    length = read_word(data, offset)
+    if offset + 32 + length > len(data):
+        raise InsufficientDataBytes(f"Tried to read {length} bytes at {offset + 32}, only got {len(data)} bytes.")
+    return data[offset + 32: offset + 32 + length]
+
+
+def read_bytes_array(data: bytes, offset: int) -> List[bytes]:
+    """reads an abi encoded bytes[] starting at offset, element offsets being relative to the start of the elements"""
+    length = read_word(data, offset)
+    start = offset + 32
+    return [read_bytes(data, start + read_word(data, start + 32 * i)) for i in range(length)]
+
+
+def decode_packed_path(path: bytes) -> Tuple[List[Address], List[int]]:
+    """splits a v3 path of token (20 bytes) then fee (3 bytes) and token pairs into the tokens and fees"""
+    if len(path) < 20 or (len(path) - 20) % 23 != 0:
+        raise InvalidPath(f"A v3 path can't be {len(path)} bytes long")
+    tokens = [Address(HexBytes(path[i:i + 20])) for i in range(0, len(path), 23)]
+    fees = [int.from_bytes(path[i + 20:i + 23], "big") for i in range(0, len(path) - 20, 23)]
+    return tokens, fees
+
+
+_SWAP_HEAD = get_static_decoder(("address", "uint256", "uint256", "uint256", "bool"))
+
+
+def decode_v3_swap(data: bytes) -> Tuple:
+    recipient, amount_a, amount_b, path_offset, payer_is_user = _SWAP_HEAD.decode(data)
+    tokens, fees = decode_packed_path(read_bytes(data, path_offset))
+    return recipient, amount_a, amount_b, tokens, fees, payer_is_user
+
+
+def decode_v2_swap(data: bytes) -> Tuple:
+    recipient, amount_a, amount_b, path_offset, payer_is_user = _SWAP_HEAD.decode(data)
+    length = read_word(data, path_offset)
+    end = path_offset + 32 + 32 * length
+    if end > len(data):
+        raise InsufficientDataBytes(f"Path of {length} addresses runs past the end of the input")
+    path = [Address(HexBytes(data[i + 12:i + 32])) for i in range(path_offset + 32, end, 32)]
+    return recipient, amount_a, amount_b, path, payer_is_user
+
+
+def decode_sub_plan(data: bytes) -> Tuple:
+    commands = read_bytes(data, read_word(data, 0))
+    inputs = read_bytes_array(data, read_word(data, 32))
+    return decode_universal_router_commands(commands, inputs),
+
+
+_PERMIT_SINGLE_HEAD = get_static_decoder(("address", "uint160", "uint48", "uint48", "address", "uint256", "uint256"))
+
+
+def decode_permit_single(data: bytes) -> Tuple:
+    """the permit struct is static so sits in the head, followed by the offset of the signature"""
+    token, amount, expiration, nonce, spender, sig_deadline, signature_offset = _PERMIT_SINGLE_HEAD.decode(data)
+    return ((token, amount, expiration, nonce), spender, sig_deadline), read_bytes(data, signature_offset)
+
+
+def static_decoder(*types: str) -> Callable[[bytes], Tuple]:
+    return get_static_decoder(types).decode
+
+
+def abi_decoder(*types: str) -> Callable[[bytes], Tuple]:
+    def decode_input(data: bytes) -> Tuple:
+        return decode(types, data)
+    return decode_input
+
+
+UNIVERSAL_ROUTER_COMMANDS: Dict[int, CommandSpec] = {
+    V3_SWAP_EXACT_IN: CommandSpec("V3_SWAP_EXACT_IN", ("recipient", "amountIn", "amountOutMin", "path", "fees",
+                                                       "payerIsUser"), decode_v3_swap),
+    # v3 exact output paths are encoded from the output token back to the input token
+    V3_SWAP_EXACT_OUT: CommandSpec("V3_SWAP_EXACT_OUT", ("recipient", "amountOut", "amountInMax", "path", "fees",
+                                                         "payerIsUser"), decode_v3_swap),
+    PERMIT2_TRANSFER_FROM: CommandSpec("PERMIT2_TRANSFER_FROM", ("token", "recipient", "amount"),
+                                       static_decoder("address", "address", "uint160")),
+    PERMIT2_PERMIT_BATCH: CommandSpec("PERMIT2_PERMIT_BATCH", ("permitBatch", "signature"),
+                                      abi_decoder(f"({PERMIT_DETAILS}[],address,uint256)", "bytes")),
+    SWEEP: CommandSpec("SWEEP", ("token", "recipient", "amountMin"), static_decoder("address", "address", "uint256")),
+    TRANSFER: CommandSpec("TRANSFER", ("token", "recipient", "value"), static_decoder("address", "address", "uint256")),
+    PAY_PORTION: CommandSpec("PAY_PORTION", ("token", "recipient", "bips"),
+                             static_decoder("address", "address", "uint256")),
+    V2_SWAP_EXACT_IN: CommandSpec("V2_SWAP_EXACT_IN", ("recipient", "amountIn", "amountOutMin", "path", "payerIsUser"),
+                                  decode_v2_swap),
+    V2_SWAP_EXACT_OUT: CommandSpec("V2_SWAP_EXACT_OUT", ("recipient", "amountOut", "amountInMax", "path",
+                                                         "payerIsUser"), decode_v2_swap),
+    PERMIT2_PERMIT: CommandSpec("PERMIT2_PERMIT", ("permitSingle", "signature"),
+                                decode_permit_single),
+    WRAP_ETH: CommandSpec("WRAP_ETH", ("recipient", "amountMin"), static_decoder("address", "uint256")),
+    UNWRAP_WETH: CommandSpec("UNWRAP_WETH", ("recipient", "amountMin"), static_decoder("address", "uint256")),
+    PERMIT2_TRANSFER_FROM_BATCH: CommandSpec("PERMIT2_TRANSFER_FROM_BATCH", ("batchDetails",),
+                                             abi_decoder("(address,address,uint160,address)[]")),
+    BALANCE_CHECK_ERC20: CommandSpec("BALANCE_CHECK_ERC20", ("owner", "token", "minBalance"),
+                                     static_decoder("address", "address", "uint256")),
+    EXECUTE_SUB_PLAN: CommandSpec("EXECUTE_SUB_PLAN", ("commands",), decode_sub_plan),
+}
+
+
+def decode_universal_router_commands(commands: bytes, inputs: List[bytes]) -> List[UniversalRouterCommand]:
+    """decodes every command, commands missing from the table (e.g. nft purchases) keep their raw input"""
+    if len(commands) != len(inputs):
+        raise InsufficientDataBytes(f"{len(commands)} commands but {len(inputs)} inputs")
+    decoded = []
+    for command_byte, command_input in zip(commands, inputs):
+        command = command_byte & COMMAND_TYPE_MASK
+        spec = UNIVERSAL_ROUTER_COMMANDS.get(command)
+        if spec is None:
+            decoded.append(UniversalRouterCommand(command, f"UNKNOWN_{command:#04x}", {"input": command_input},
+                                                  bool(command_byte & FLAG_ALLOW_REVERT)))
+            continue
+        args = dict(zip(spec.fields, spec.decode(command_input)))
+        decoded.append(UniversalRouterCommand(command, spec.name, args, bool(command_byte & FLAG_ALLOW_REVERT)))
+    return decoded
+
+
+def decode_universal_router_transaction_input(data: HexBytes) -> Tuple[Optional[str],
+                                                                      Optional[List[UniversalRouterCommand]],
+                                                                      Optional[int]]:
+    """decodes an execute call into (function name, commands, deadline), all None if data isn't an execute call.
+    The deadline is None for execute without a deadline"""
+    data = bytes(data)
+    selector = data[:4]
+    body = data[4:]
+    if selector == EXECUTE_DEADLINE_SELECTOR:
+        function_name = "execute_deadline"
+        deadline = read_word(body, 64)
+    elif selector == EXECUTE_NO_DEADLINE_SELECTOR:
+        function_name = "execute_no_deadline"
+        deadline = None
+    else:
+        return None, None, None
+    commands = read_bytes(body, read_word(body, 0))
+    inputs = read_bytes_array(body, read_word(body, 32))
+    return function_name, decode_universal_router_commands(commands, inputs), deadline
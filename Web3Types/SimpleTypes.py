@@ -79,5 +79,8 @@ class Address:
     def __hash__(self):
         return hash(self.__hex_bytes)
 
+    def __bytes__(self):
+        return bytes(self.__hex_bytes)
+
 
 NULL_ADDRESS = Address("0x0000000000000000000000000000000000000000")
@@ -0,0 +1,28 @@
+from typing import List, Optional
+from Web3Types.SimpleTypes import HexBytes, Address
+
+
+class SwapIntent:
+    """A swap decoded from a pending router transaction. For exact output swaps amount_in is the most the sender will
+    pay and amount_out_min the exact amount out. deadline is None if the transaction doesn't set one"""
+
+    __slots__ = ("tx_hash", "router", "function_name", "path", "amount_in", "amount_out_min", "deadline", "recipient",
+                 "exact_input")
+
+    def __init__(self, tx_hash: HexBytes, router: Address, function_name: str, path: List[Address], amount_in: int,
+                 amount_out_min: int, deadline: Optional[int], recipient: Optional[Address], exact_input: bool):
+        self.tx_hash: HexBytes = tx_hash
+        self.router: Address = router
+        self.function_name: str = function_name
+        self.path: List[Address] = path
+        self.amount_in: int = amount_in
+        self.amount_out_min: int = amount_out_min
+        self.deadline: Optional[int] = deadline
+        self.recipient: Optional[Address] = recipient
+        self.exact_input: bool = exact_input
+
+    def __repr__(self):
+        return f"{self.function_name} {self.amount_in} -> {self.amount_out_min} via {self.path} in {self.tx_hash}"
+
+    def __eq__(self, other):
+        return all(getattr(self, s) == getattr(other, s) for s in self.__slots__)
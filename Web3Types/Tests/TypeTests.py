@@ -2,6 +2,7 @@ import unittest
 from Web3Types.SimpleTypes import *
 from Web3Types.Block import *
 from Web3Types.TransactionLog import *
+import Utilities.FunctionCallBuilder as fcb
 
 
 class TestSimpleTypes(unittest.TestCase):
@@ -98,5 +99,48 @@ class TestLogType(unittest.TestCase):
             self.assertEqual(ar, r)
 
 
+class TestLazyLogType(unittest.TestCase):
+
+    raw_log_1 = {"blockHash": "0x06ce1c2a2bf4be3cc7f8cfbde9b29b3035dd35f551aea177e829905f0423f899",
+                 "blockNumber": "0x10b3f9d",
+                 "transactionIndex": "0x72",
+                 "address": "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640",
+                 "logIndex": "0xe2",
+                 "data": "0x0000000000000000000000000000000000000000000000000000000077359400ffffffffffffffffffffffffffffffffffffffffffffffffefdf78616e9e6a8c0000000000000000000000000000000000005e2ec01dc1bd773f69f88e02cb360000000000000000000000000000000000000000000000012e2b29926a2e7ded000000000000000000000000000000000000000000000000000000000003145a",
+                 "removed": False,
+                 "topics": ["0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67",
+                            "0x000000000000000000000000def1c0ded9bec7f1a1670819833240f027b25eff",
+                            "0x000000000000000000000000def1c0ded9bec7f1a1670819833240f027b25eff"],
+                 "transactionHash": "0x437f02b06f96645e6ec3a7f6f8b6638bc9bcab3a8f33cd8d453b6ebbb197055b"}
+
+    def test_lazy_log_matches_log(self):
+        lazy_log = LazyLog(self.raw_log_1)
+        actual_result = TestLogType.log_1
+        self.assertEqual(actual_result, lazy_log)
+        self.assertEqual(actual_result.address, lazy_log.address)
+        self.assertEqual(actual_result.data, lazy_log.data)
+        self.assertEqual(actual_result.block_number, lazy_log.block_number)
+        self.assertEqual(actual_result.block_hash, lazy_log.block_hash)
+        self.assertEqual(actual_result.transaction_index, lazy_log.transaction_index)
+        self.assertEqual(actual_result.removed, lazy_log.removed)
+        self.assertEqual(actual_result.get_topic(), lazy_log.get_topic())
+        for ar, r in zip(actual_result.topics, lazy_log.topics):
+            self.assertEqual(ar, r)
+        self.assertEqual(actual_result.to_json(), lazy_log.to_json())
+
+    def test_lazy_decoding(self):
+        swap_event = fcb.create_event_abi("Swap", fcb.get_abi("V3LiquidityPool"))
+        lazy_log = LazyLog(self.raw_log_1, swap_event)
+        self.assertEqual(type(lazy_log._data), str)
+        self.assertEqual(lazy_log.decoded_data[0], 2000000000)
+        self.assertEqual(lazy_log.decoded_data[4], 201818)
+        self.assertEqual(lazy_log.decoded_topics[0], Address("0xDef1C0ded9bec7F1a1670819833240f027b25EfF"))
+
+    def test_lazy_log_has_slots(self):
+        lazy_log = LazyLog(self.raw_log_1)
+        with self.assertRaises(AttributeError):
+            lazy_log.extra = 1
+
+
 if __name__ == '__main__':
     unittest.main()
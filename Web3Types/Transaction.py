@@ -1,5 +1,6 @@
 from __future__ import annotations
 from Utilities.FunctionCallBuilder import *
+from Utilities.CalldataBuilder import encode_function_call
 from Web3Types.SimpleTypes import Address, HexBytes
 
 
@@ -38,7 +39,7 @@ class Transaction:
         return out
 
     def set_function_call(self, function_abi, *args):
-        self.data = create_function_call(function_abi, *args)
+        self.data = encode_function_call(function_abi, *args)
 
 
 class SmartContractTransaction(Transaction):
@@ -48,6 +49,6 @@ class SmartContractTransaction(Transaction):
                  transfer_gasPrice: int = 0, transfer_maxFeePerGas: int = 0,
                  transfer_maxPriorityFeePerGas: int = 0):
         self.abi_function = abi_function
-        data = create_function_call(abi_function, *input_tuple)
+        data = encode_function_call(abi_function, *input_tuple)
         super().__init__(transfer_from, transfer_to, transfer_value, data, transfer_gas, transfer_gasPrice, transfer_maxFeePerGas, transfer_maxPriorityFeePerGas)
 
@@ -1,5 +1,5 @@
-import json
-from typing import List
+import Utilities.JsonCodec as json_codec
+from typing import List, Dict, Optional
 from Utilities.FunctionCallBuilder import decode_event_output, decode_topic_data
 from Web3Types.SimpleTypes import HexBytes, Address
 
@@ -42,7 +42,140 @@ class Log:
 
     def to_json(self) -> str:
         """Note that saving and loading a log to json will lose its decoded_data which will need to be re-initialised"""
-        return json.dumps({
+        return json_codec.dumps({
+            "block_hash": str(self.block_hash),
+            "block_number": self.block_number,
+            "transaction_index": self.transaction_index,
+            "address": str(self.address),
+            "log_index": self.log_index,
+            "removed": self.removed,
+            "topics": [str(t) for t in self.topics],
+            "transaction_hash": str(self.transaction_hash),
+            "data": str(self.data)
+        })
+
+
+class LazyLog:
+    """A log backed by the raw json-rpc response. The address and first topic are parsed straight away so logs can be
+    cheaply filtered, everything else is kept as the raw hex strings and only parsed (then cached) when accessed. If an
+    event abi is given the data and topics are only decoded the first time decoded_data or decoded_topics is used."""
+
+    __slots__ = ("address", "_topic", "_topics", "_block_hash", "_block_number", "_transaction_index", "_log_index",
+                 "_data", "_removed", "_transaction_hash", "_event_abi", "_decoded_data", "_decoded_topics")
+
+    def __init__(self, raw_log: Dict, event_abi=None):
+        self.address: Address = Address(raw_log['address'])
+        self._topics = raw_log['topics']
+        self._topic: Optional[HexBytes] = HexBytes(self._topics[0]) if self._topics else None
+        self._block_hash = raw_log['blockHash']
+        self._block_number = raw_log['blockNumber']
+        self._transaction_index = raw_log['transactionIndex']
+        self._log_index = raw_log['logIndex']
+        self._data = raw_log['data']
+        self._removed = raw_log['removed']
+        self._transaction_hash = raw_log['transactionHash']
+        self._event_abi = event_abi
+        self._decoded_data = None
+        self._decoded_topics = None
+
+    @property
+    def block_hash(self) -> HexBytes:
+        if type(self._block_hash) == str:
+            self._block_hash = HexBytes(self._block_hash)
+        return self._block_hash
+
+    @property
+    def block_number(self) -> int:
+        if type(self._block_number) == str:
+            self._block_number = int(self._block_number, 16)
+        return self._block_number
+
+    @property
+    def transaction_index(self) -> int:
+        if type(self._transaction_index) == str:
+            self._transaction_index = int(self._transaction_index, 16)
+        return self._transaction_index
+
+    @property
+    def log_index(self) -> int:
+        if type(self._log_index) == str:
+            self._log_index = int(self._log_index, 16)
+        return self._log_index
+
+    @property
+    def removed(self) -> bool:
+        return self._removed is True or self._removed == "true"
+
+    @property
+    def topics(self) -> List:
+        if len(self._topics) > 0 and type(self._topics[-1]) == str:
+            self._topics = [self._topic] + [HexBytes(t) for t in self._topics[1:]]
+        return self._topics
+
+    @property
+    def transaction_hash(self) -> HexBytes:
+        if type(self._transaction_hash) == str:
+            self._transaction_hash = HexBytes(self._transaction_hash)
+        return self._transaction_hash
+
+    @property
+    def data(self) -> HexBytes:
+        if type(self._data) == str:
+            self._data = HexBytes(self._data)
+        return self._data
+
+    @property
+    def decoded_data(self):
+        if self._decoded_data is None and self._event_abi is not None:
+            self._decoded_data = decode_event_output(self.data, self._event_abi)
+        return self._decoded_data
+
+    @property
+    def decoded_topics(self):
+        if self._decoded_topics is None and self._event_abi is not None:
+            self._decoded_topics = decode_topic_data(self.topics, self._event_abi)
+        return self._decoded_topics
+
+    def decode_data(self, event_abi):
+        self._event_abi = event_abi
+        self._decoded_data = None
+        self._decoded_topics = None
+        return self.decoded_data
+
+    def get_topic(self):
+        return self._topic
+
+    def to_rpc_json(self) -> Dict:
+        """the log in the json-rpc format it was received in, so it can be stored and rebuilt later"""
+        return {
+            "address": "0x" + bytes(self.address).hex(),
+            "topics": [t if type(t) == str else str(t) for t in self._topics],
+            "blockHash": self._block_hash if type(self._block_hash) == str else str(self._block_hash),
+            "blockNumber": self._block_number if type(self._block_number) == str else hex(self._block_number),
+            "transactionIndex": self._transaction_index if type(self._transaction_index) == str
+            else hex(self._transaction_index),
+            "logIndex": self._log_index if type(self._log_index) == str else hex(self._log_index),
+            "data": self._data if type(self._data) == str else str(self._data),
+            "removed": self.removed,
+            "transactionHash": self._transaction_hash if type(self._transaction_hash) == str
+            else str(self._transaction_hash)
+        }
+
+    def __str__(self):
+        return f"{self.block_number}, {self.transaction_hash}, {self.decoded_data}"
+
+    def __repr__(self):
+        return str(self)
+
+    def __eq__(self, other):
+        return self.transaction_hash == other.transaction_hash and self.log_index == other.log_index
+
+    def __hash__(self):
+        return hash(hash(self.transaction_hash) + hash(self.log_index))
+
+    def to_json(self) -> str:
+        """Note that saving and loading a log to json will lose its decoded_data which will need to be re-initialised"""
+        return json_codec.dumps({
             "block_hash": str(self.block_hash),
             "block_number": self.block_number,
             "transaction_index": self.transaction_index,
@@ -57,7 +190,7 @@ class Log:
 
 def log_from_json(json_str: str) -> Log:
     """Note that saving and loading a log to json will lose its decoded_data which will need to be re-initialised"""
-    obj_dict = json.loads(json_str)
+    obj_dict = json_codec.loads(json_str)
     return Log(
         HexBytes(obj_dict["block_hash"]),
         obj_dict["block_number"],